@@ -0,0 +1,265 @@
+# app/broadcast.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from app import metrics
+from app.tenants import bot_ids, current_bot_id, get_bot, use_bot
+from db.base import session_factory
+from db.broadcast_repo import BroadcastRepo, BroadcastRow
+
+log = logging.getLogger("app.broadcast")
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))            # сообщений в секунду (лимит Telegram ~30/с на бота)
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", "200"))           # получателей за один запрос к БД
+BROADCAST_STATUS_EVERY = float(os.getenv("BROADCAST_STATUS_EVERY", "3"))  # сек: чекпоинт и правка статуса
+BROADCAST_STALE = float(os.getenv("BROADCAST_STALE", "60"))          # сек: без heartbeat рассылку подхватит другой
+
+_STATE_TITLES = {"running": "идёт", "done": "завершена", "cancelled": "отменена"}
+
+
+def format_status(broadcast_id: int, state: str, total: int, delivered: int, failed: int) -> str:
+    remaining = max(0, total - delivered - failed)
+    text = (
+        f"Рассылка #{broadcast_id}: {_STATE_TITLES.get(state, state)}\n"
+        f"Доставлено: {delivered}\nОшибок: {failed}\nОсталось: {remaining}"
+    )
+    if state == "running":
+        text += f"\nОтменить: /broadcast_cancel {broadcast_id}"
+    return text
+
+
+class Broadcaster:
+    """
+    Рассылки администратора. Получатели читаются из users пачками по tg_id (keyset),
+    отправка — равномерно, не быстрее BROADCAST_RATE. Прогресс (курсор и счётчики)
+    сохраняется в broadcasts раз в BROADCAST_STATUS_EVERY вместе с правкой статусного
+    сообщения, поэтому после рестарта рассылка продолжается с места остановки
+    (повторно могут уйти максимум сообщения последних секунд).
+    """
+
+    def __init__(self) -> None:
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    # --- запуск ---
+    async def start(self, text: str, status_chat_id: int, status_message_id: int) -> int:
+        """Создать рассылку от имени текущего бота и сразу начать отправку."""
+        Session = session_factory()
+        async with Session() as session:
+            broadcast_id = await BroadcastRepo(session).create(text, status_chat_id, status_message_id, self.owner)
+            await session.commit()
+        self._spawn(current_bot_id(), broadcast_id)
+        return broadcast_id
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """
+        Отменить рассылку. Отправитель (здесь или в другом инстансе) заметит это
+        на ближайшем чекпоинте и допишет статус.
+        """
+        Session = session_factory()
+        async with Session() as session:
+            ok = await BroadcastRepo(session).finish(broadcast_id, "cancelled")
+            await session.commit()
+        return ok
+
+    async def resume(self) -> int:
+        """Подхватить идущие рассылки без живого владельца (после рестарта или падения инстанса)."""
+        started = 0
+        stale_before = time.time() - BROADCAST_STALE
+        for bot_id in bot_ids() or [current_bot_id()]:
+            with use_bot(bot_id):
+                Session = session_factory()
+                async with Session() as session:
+                    repo = BroadcastRepo(session)
+                    for broadcast_id in await repo.running_ids():
+                        if (bot_id, broadcast_id) in self._tasks:
+                            continue
+                        if await repo.claim(broadcast_id, self.owner, stale_before):
+                            await session.commit()
+                            log.info("resuming broadcast #%d of bot %d", broadcast_id, bot_id)
+                            self._spawn(bot_id, broadcast_id)
+                            started += 1
+        return started
+
+    def _spawn(self, bot_id: int, broadcast_id: int) -> None:
+        key = (bot_id, broadcast_id)
+        task = asyncio.create_task(self._run(bot_id, broadcast_id))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(key, None))
+
+    # --- отправка ---
+    async def _run(self, bot_id: int, broadcast_id: int) -> None:
+        with use_bot(bot_id):
+            try:
+                await self._send_all(get_bot(), broadcast_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("broadcast #%d failed", broadcast_id)
+
+    async def _send_all(self, bot: Bot, broadcast_id: int) -> None:
+        Session = session_factory()
+        async with Session() as session:
+            row = await BroadcastRepo(session).get(broadcast_id)
+        if row is None or row.status != "running":
+            return
+        cursor, delivered, failed = row.cursor_tg_id, row.delivered, row.failed
+
+        async def checkpoint(heartbeat_at: Optional[float] = None) -> bool:
+            async with Session() as session:
+                ok = await BroadcastRepo(session).checkpoint(
+                    broadcast_id, self.owner, cursor, delivered, failed, heartbeat_at)
+                await session.commit()
+            return ok
+
+        await self._edit_status(bot, row, format_status(broadcast_id, "running", row.total, delivered, failed))
+        interval = 1.0 / BROADCAST_RATE
+        next_slot = last_flush = time.monotonic()
+        try:
+            while True:
+                async with Session() as session:
+                    chunk = await BroadcastRepo(session).recipients(cursor, BROADCAST_CHUNK)
+                if not chunk:
+                    break
+                for tg_id in chunk:
+                    delay = next_slot - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_slot = max(next_slot, time.monotonic()) + interval
+                    sent = await self._deliver(bot, tg_id, row.text, checkpoint)
+                    if sent is None:
+                        # пока ждали флуд-лимит, отменили или перехватил другой инстанс
+                        await self._final_status(bot, broadcast_id, row, delivered, failed)
+                        return
+                    if sent:
+                        delivered += 1
+                    else:
+                        failed += 1
+                    cursor = tg_id
+                    if time.monotonic() - last_flush >= BROADCAST_STATUS_EVERY:
+                        if not await checkpoint():
+                            # отменили или перехватил другой инстанс
+                            await self._final_status(bot, broadcast_id, row, delivered, failed)
+                            return
+                        await self._edit_status(bot, row, format_status(
+                            broadcast_id, "running", row.total, delivered, failed))
+                        last_flush = time.monotonic()
+        except asyncio.CancelledError:
+            # остановка процесса: сохраняем курсор и отпускаем рассылку для следующего запуска
+            await asyncio.shield(checkpoint(heartbeat_at=0))
+            raise
+
+        if await checkpoint():
+            async with Session() as session:
+                await BroadcastRepo(session).finish(broadcast_id, "done")
+                await session.commit()
+        await self._final_status(bot, broadcast_id, row, delivered, failed)
+
+    async def _deliver(self, bot: Bot, chat_id: int, text: str,
+                       heartbeat: Callable[[], Awaitable[bool]]) -> Optional[bool]:
+        """True — доставлено, False — не доставлено, None — рассылка больше не наша (см. _wait)."""
+        while True:
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                metrics.inc("broadcast_sent")
+                return True
+            except TelegramRetryAfter as e:
+                # флуд-лимит: ждём сколько сказали и повторяем тому же получателю
+                metrics.inc("broadcast_retry_after")
+                if not await self._wait(e.retry_after, heartbeat):
+                    return None
+            except (TelegramForbiddenError, TelegramBadRequest):
+                metrics.inc("broadcast_failed")
+                return False
+            except Exception as e:
+                log.warning("broadcast to %s failed: %r", chat_id, e)
+                metrics.inc("broadcast_failed")
+                return False
+
+    @staticmethod
+    async def _wait(seconds: float, heartbeat: Callable[[], Awaitable[bool]]) -> bool:
+        """
+        Сон дольше BROADCAST_STALE / 2 — с heartbeat (checkpoint) на каждом отрезке, иначе resume()
+        в другом инстансе сочтёт рассылку брошенной и начнёт слать тем же получателям.
+        False — checkpoint не прошёл (отменили или уже перехватили).
+        """
+        step = BROADCAST_STALE / 2
+        if seconds <= step:
+            await asyncio.sleep(seconds)
+            return True
+        while seconds > 0:
+            if not await heartbeat():
+                return False
+            await asyncio.sleep(min(step, seconds))
+            seconds -= step
+        return True
+
+    async def _final_status(self, bot: Bot, broadcast_id: int, row: BroadcastRow,
+                            delivered: int, failed: int) -> None:
+        Session = session_factory()
+        async with Session() as session:
+            current = await BroadcastRepo(session).get(broadcast_id)
+        if current is not None and current.status != "running":
+            # счётчики из БД: при перехвате другим инстансом они свежее наших
+            if current.delivered + current.failed > delivered + failed:
+                delivered, failed = current.delivered, current.failed
+            await self._edit_status(bot, row, format_status(
+                broadcast_id, current.status, row.total, delivered, failed))
+
+    @staticmethod
+    async def _edit_status(bot: Bot, row: BroadcastRow, text: str) -> None:
+        try:
+            await bot.edit_message_text(text=text, chat_id=row.status_chat_id, message_id=row.status_message_id)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                log.debug("broadcast status edit failed: %s", e)
+        except Exception as e:
+            log.debug("broadcast status edit failed: %r", e)
+
+    # --- жизненный цикл ---
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await self.resume()
+            except Exception:
+                log.exception("broadcast resume failed")
+            await asyncio.sleep(BROADCAST_STALE / 2)
+
+    def run(self) -> None:
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_broadcaster: Optional[Broadcaster] = None
+
+
+def setup_broadcaster() -> Broadcaster:
+    global _broadcaster
+    _broadcaster = Broadcaster()
+    _broadcaster.run()
+    return _broadcaster
+
+
+def get_broadcaster() -> Broadcaster:
+    assert _broadcaster is not None, "Broadcaster is not initialized. Call setup_broadcaster() first."
+    return _broadcaster
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime, date, timezone
-from typing import Dict, Tuple, Iterable, List
+from typing import Dict, Tuple, Iterable, List, Optional
 from zoneinfo import ZoneInfo
 import re
 
@@ -11,10 +11,18 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from app.kb import build_work_kb
 from app.parse import parse_input, fmt_hhmm, ParsedDayOff
+from app.norms import fmt_signed, norm_minutes
 from db.work_repo import WorkRepo
 from db.settings_repo import SettingsRepo
-from db.middleware import session_factory
-from app.scheduler import schedule_kb_expire, cancel_kb_expire
+from db.models import WorkEntry
+from db.outbox_repo import OutboxRepo
+from db.archive_repo import ArchiveRepo
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.scheduler import schedule_kb_expire, cancel_kb_expire, local_today
+from app.logs import suppressed
+from app import report_cache
+from db.base import current_schema
 from html import escape
 
 router = Router(name="main_router")
@@ -29,8 +37,8 @@ HELP_TEXT = (
 
 REPORT_PROMPT_TEXT = "Укажите период отчета: (Дата начала - Дата окончания)"
 
-# Храним последний показанный промпт пользователя: user_id -> (chat_id, message_id)
-LAST_PROMPT: Dict[int, Tuple[int, int]] = {}
+# Храним последний показанный промпт пользователя: (bot_id, user_id) -> (chat_id, message_id)
+LAST_PROMPT: Dict[Tuple[int, int], Tuple[int, int]] = {}
 
 # ==== Утилиты для отчета ====
 
@@ -73,45 +81,46 @@ def _build_report_kb():
     return kb.as_markup()
 
 async def _hide_last_prompt_kb(user_id: int, bot) -> None:
-    pair = LAST_PROMPT.pop(user_id, None)
+    pair = LAST_PROMPT.pop((bot.id, user_id), None)
     if not pair:
         return
     chat_id, message_id = pair
     cancel_kb_expire(chat_id, message_id)
-    try:
+    with suppressed("prompt_kb_hide"):
         await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
-    except Exception:
-        pass
 
 async def _send_prompt(message: Message, session) -> None:
     user_id = message.from_user.id
     wr = WorkRepo(session)
     templates = await wr.get_templates(user_id)
     msg = await message.answer(PROMPT_TEXT, reply_markup=build_work_kb(templates, include_help=True))
-    LAST_PROMPT[user_id] = (msg.chat.id, msg.message_id)
+    LAST_PROMPT[(message.bot.id, user_id)] = (msg.chat.id, msg.message_id)
     schedule_kb_expire(msg.chat.id, msg.message_id, seconds=60)
 
 async def _send_report_prompt(message: Message) -> None:
     msg = await message.answer(REPORT_PROMPT_TEXT, reply_markup=_build_report_kb())
     # фикс: запоминаем и отчётный промпт, чтобы потом убирать его клавиатуру
-    LAST_PROMPT[message.from_user.id] = (msg.chat.id, msg.message_id)
+    LAST_PROMPT[(message.bot.id, message.from_user.id)] = (msg.chat.id, msg.message_id)
     schedule_kb_expire(msg.chat.id, msg.message_id, seconds=60)
 
 async def _fetch_entries(session, user_id: int, start: date, end: date) -> List[tuple[str,int,int,int]]:
     """
     Возвращает список (work_date_iso, start_min, end_min, break_min) отсортированный по дате.
+    Закрытые годы подмешиваем из work_archive (живая запись приоритетнее).
     """
-    from sqlalchemy import text as sqltext
     res = await session.execute(
-        sqltext("""
-            SELECT work_date, start_min, end_min, break_min
-            FROM work_entries
-            WHERE user_id=:uid AND work_date BETWEEN :s AND :e
-            ORDER BY work_date ASC
-        """),
-        {"uid": user_id, "s": start.isoformat(), "e": end.isoformat()},
+        select(WorkEntry.work_date, WorkEntry.start_min, WorkEntry.end_min, WorkEntry.break_min)
+        .where(WorkEntry.user_id == user_id, WorkEntry.work_date.between(start.isoformat(), end.isoformat()))
+        .order_by(WorkEntry.work_date.asc())
     )
-    return [(r[0], r[1], r[2], r[3]) for r in res.fetchall()]
+    rows = [(r[0], r[1], r[2], r[3]) for r in res.fetchall()]
+    # какие годы уже в архиве, по дате сервера не угадать — спрашиваем work_archive (PK user_id, year)
+    archived = await ArchiveRepo(session).fetch_range(user_id, start, end)
+    if not archived:
+        return rows
+    merged = {r[0]: r for r in archived}
+    merged.update((r[0], r) for r in rows)
+    return [merged[k] for k in sorted(merged)]
 
 def _format_report_rows(rows: List[tuple[str,int,int,int]]) -> tuple[str, int]:
     """
@@ -123,7 +132,7 @@ def _format_report_rows(rows: List[tuple[str,int,int,int]]) -> tuple[str, int]:
     lines.append("────────────┼──────┼────────────────────────┼───────────")
 
     for iso, start_min, end_min, break_min in rows:
-        day = datetime.strptime(iso, "%Y-%m-%d").date()
+        day = date.fromisoformat(iso)
         dow = _DOW_RU[day.weekday()]
         work_str = f"{fmt_hhmm(start_min)}–{fmt_hhmm(end_min)}" + (f"-{fmt_hhmm(break_min)}" if break_min else "")
         worked = (end_min - start_min) - break_min
@@ -134,31 +143,73 @@ def _format_report_rows(rows: List[tuple[str,int,int,int]]) -> tuple[str, int]:
     body = "\n".join(lines)
     return body, total_min
 
+async def _balance_line(srepo: SettingsRepo, user_id: int) -> str:
+    """
+    Строка «Баланс: baseline + всё записанное после неё» из накопленного счётчика.
+    """
+    bal = await srepo.get_balance(user_id)
+    if bal is None:
+        return ""
+    baseline_iso, total_min = bal
+    since = date.fromisoformat(baseline_iso).strftime('%d.%m.%Y')
+    return f"\nБаланс с {since}: {fmt_hhmm(total_min)}"
+
+async def _norm_footer(session, user_id: int, start: date, end: date,
+                       rows: List[tuple[str,int,int,int]], today: date) -> str:
+    """
+    Норма по производственному календарю (app/norms.py) и переработка.
+    Для текущего периода норма и отработанное считаются только по сегодняшний день
+    (today — локальная дата пользователя, как и границы периода).
+    """
+    upto = min(end, today)
+    if upto < start:
+        return ""
+    days_off = await WorkRepo(session).get_days_off(user_id, start, upto)
+    norm = norm_minutes(start, upto, days_off)
+    upto_iso = upto.isoformat()
+    worked = sum(e - s - b for iso, s, e, b in rows if iso <= upto_iso)
+    label = "Норма" if upto == end else f"Норма по {upto.strftime('%d.%m.%Y')}"
+    return f"\n{label}: {fmt_hhmm(norm)}\nПереработка: {fmt_signed(worked - norm)}"
+
 def _clip_telegram(text: str, budget: int = 3900) -> str:
     if len(text) <= budget:
         return text
     return text[:budget - 1]
 
-async def _send_report_text(message: Message, session, start: date, end: date, user_id: int) -> None:
+async def _reply(session, chat_id: int, text: str, key: str) -> None:
+    """
+    Ответ через outbox: пишется в той же транзакции, что и данные, отправляется фоном
+    (app/outbox.py). key — ключ идемпотентности (повторный апдейт не даст дубль).
+    """
+    await OutboxRepo(session).enqueue(chat_id, text, idem_key=key)
+
+async def _send_report_text(message: Message, session, start: date, end: date, user_id: int, key: str,
+                            today: date, gen: Optional[int]) -> None:
     """
     ВНИМАНИЕ: user_id передаём снаружи (message.from_user в коллбэке = бот, а не человек).
+    today — локальная дата пользователя, gen — его report_gen (SettingsRepo.get_report_state).
     """
-    rows = await _fetch_entries(session, user_id, start, end)
-    body, total_min = _format_report_rows(rows)
-    footer = f"\n\nИтого: {fmt_hhmm(total_min)}"
-    # code = f"```\n{body}{footer}\n```"
-    code = f"{body}{footer}"
-    code = _clip_telegram(code)
-    code = f"<pre>{escape(code)}</pre>"    
-    await message.answer(code)
+    # готовый текст из кэша, если данные пользователя не менялись (app/report_cache.py)
+    schema = current_schema()
+    code = None if gen is None else report_cache.get(schema, user_id, start, end, today, gen)
+    if code is None:
+        rows = await _fetch_entries(session, user_id, start, end)
+        body, total_min = _format_report_rows(rows)
+        footer = f"\n\nИтого: {fmt_hhmm(total_min)}"
+        footer += await _norm_footer(session, user_id, start, end, rows, today)
+        # code = f"```\n{body}{footer}\n```"
+        code = f"{body}{footer}"
+        code = _clip_telegram(code)
+        code = f"<pre>{escape(code)}</pre>"
+        if gen is not None:
+            report_cache.put(schema, user_id, start, end, today, gen, code)
+    await _reply(session, message.chat.id, code, key)
 
 # ==== Команды ====
 
 @router.message(Command('mark'))
-async def cmd_mark(message: Message):
-    Session = session_factory()
-    async with Session() as session:
-        await _send_prompt(message, session)
+async def cmd_mark(message: Message, db_session: AsyncSession):
+    await _send_prompt(message, db_session)
 
 @router.message(Command('report'))
 async def cmd_report(message: Message):
@@ -171,48 +222,50 @@ async def cmd_settings(message: Message):
 # ==== Текстовый ввод ====
 
 @router.message(F.text)
-async def on_text(message: Message):
+async def on_text(message: Message, db_session: AsyncSession):
     user_id = message.from_user.id
     text_in = message.text or ""
-    Session = session_factory()
-    async with Session() as session:
-        # 1) Период отчета "Дата-Дата"
-        period = _parse_period(text_in)
-        if period:
-            await _hide_last_prompt_kb(user_id, message.bot)
-            await _send_report_text(message, session, period[0], period[1], user_id)
-            return
-
-        # 2) Ввод рабочего времени
-        srepo = SettingsRepo(session)
-        s = await srepo.get_or_create(user_id)
-        parsed = parse_input(text_in, s.timezone, now_utc=datetime.now(timezone.utc))
-        if parsed is None:
-            await message.answer("Не понял ввод. Нажмите help для формата или выберите шаблон.")
-            await _send_prompt(message, session)
-            return
-
-        wr = WorkRepo(session)
-        if isinstance(parsed, ParsedDayOff):
-            await wr.delete_entry(user_id, parsed.date.isoformat())
-            await _hide_last_prompt_kb(user_id, message.bot)
-            await message.answer(f"Отметил: выходной {parsed.date.strftime('%d.%m.%Y')}")
-            return
-
-        await wr.upsert_entry(user_id, parsed.date.isoformat(), parsed.start_min, parsed.end_min, parsed.break_min)
-        if getattr(parsed, "from_template_candidate", False):
-            await wr.touch_template(user_id, parsed.start_min, parsed.end_min, parsed.break_min)
-
-        total = (parsed.end_min - parsed.start_min) - parsed.break_min
-        if parsed.break_min:
-            txt = (f"Записал: {parsed.date.strftime('%d.%m.%Y')} "
-                   f"{fmt_hhmm(parsed.start_min)}–{fmt_hhmm(parsed.end_min)}-{fmt_hhmm(parsed.break_min)} (итого {fmt_hhmm(total)})")
-        else:
-            txt = (f"Записал: {parsed.date.strftime('%d.%m.%Y')} "
-                   f"{fmt_hhmm(parsed.start_min)}–{fmt_hhmm(parsed.end_min)} (итого {fmt_hhmm(total)})")
 
+    # 1) Период отчета "Дата-Дата"
+    period = _parse_period(text_in)
+    srepo = SettingsRepo(db_session)
+    if period:
         await _hide_last_prompt_kb(user_id, message.bot)
-        await message.answer(txt)
+        tz, gen = await srepo.get_report_state(user_id)
+        await _send_report_text(message, db_session, period[0], period[1], user_id,
+                                key=f"msg:{message.chat.id}:{message.message_id}", today=local_today(tz), gen=gen)
+        return
+
+    # 2) Ввод рабочего времени
+    tz = await srepo.get_timezone(user_id)
+    parsed = parse_input(text_in, tz, now_utc=datetime.now(timezone.utc))
+    if parsed is None:
+        await message.answer("Не понял ввод. Нажмите help для формата или выберите шаблон.")
+        await _send_prompt(message, db_session)
+        return
+
+    # сеть — до записи: блокировка БД не ждёт Telegram
+    await _hide_last_prompt_kb(user_id, message.bot)
+    wr = WorkRepo(db_session)
+    if isinstance(parsed, ParsedDayOff):
+        await wr.set_day_off(user_id, parsed.date.isoformat())
+        await _reply(db_session, message.chat.id, f"Отметил: выходной {parsed.date.strftime('%d.%m.%Y')}",
+                     key=f"msg:{message.chat.id}:{message.message_id}")
+        return
+
+    await wr.upsert_entry(user_id, parsed.date.isoformat(), parsed.start_min, parsed.end_min, parsed.break_min)
+    if getattr(parsed, "from_template_candidate", False):
+        await wr.touch_template(user_id, parsed.start_min, parsed.end_min, parsed.break_min)
+
+    total = (parsed.end_min - parsed.start_min) - parsed.break_min
+    if parsed.break_min:
+        txt = (f"Записал: {parsed.date.strftime('%d.%m.%Y')} "
+               f"{fmt_hhmm(parsed.start_min)}–{fmt_hhmm(parsed.end_min)}-{fmt_hhmm(parsed.break_min)} (итого {fmt_hhmm(total)})")
+    else:
+        txt = (f"Записал: {parsed.date.strftime('%d.%m.%Y')} "
+               f"{fmt_hhmm(parsed.start_min)}–{fmt_hhmm(parsed.end_min)} (итого {fmt_hhmm(total)})")
+    txt += await _balance_line(srepo, user_id)
+    await _reply(db_session, message.chat.id, txt, key=f"msg:{message.chat.id}:{message.message_id}")
 
 # ==== Коллбеки отчета ====
 
@@ -239,98 +292,80 @@ def _prev_month_bounds(dt: date) -> tuple[date, date]:
     return start, next_m_start - timedelta(days=1)
 
 @router.callback_query(F.data == "rep:cur")
-async def on_rep_cur(cb: CallbackQuery):
-    try:
+async def on_rep_cur(cb: CallbackQuery, db_session: AsyncSession):
+    with suppressed("rep_cur_kb_hide"):
         await cb.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     cancel_kb_expire(cb.message.chat.id, cb.message.message_id)
+    # ответ на коллбек — до записи: блокировка БД не ждёт Telegram
+    await cb.answer()
 
     user_id = cb.from_user.id
-    Session = session_factory()
-    async with Session() as session:
-        srepo = SettingsRepo(session)
-        s = await srepo.get_or_create(user_id)
-        now_local = datetime.now(timezone.utc).astimezone(ZoneInfo(s.timezone)).date()
-        start, end = _month_bounds(now_local)
-        await _send_report_text(cb.message, session, start, end, user_id)
-    await cb.answer()
+    srepo = SettingsRepo(db_session)
+    tz, gen = await srepo.get_report_state(user_id)
+    now_local = local_today(tz)
+    start, end = _month_bounds(now_local)
+    await _send_report_text(cb.message, db_session, start, end, user_id, key=f"cb:{cb.id}", today=now_local, gen=gen)
 
 @router.callback_query(F.data == "rep:prev")
-async def on_rep_prev(cb: CallbackQuery):
-    try:
+async def on_rep_prev(cb: CallbackQuery, db_session: AsyncSession):
+    with suppressed("rep_prev_kb_hide"):
         await cb.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     cancel_kb_expire(cb.message.chat.id, cb.message.message_id)
+    await cb.answer()
 
     user_id = cb.from_user.id
-    Session = session_factory()
-    async with Session() as session:
-        srepo = SettingsRepo(session)
-        s = await srepo.get_or_create(user_id)
-        now_local = datetime.now(timezone.utc).astimezone(ZoneInfo(s.timezone)).date()
-        start, end = _prev_month_bounds(now_local)
-        await _send_report_text(cb.message, session, start, end, user_id)
-    await cb.answer()
+    srepo = SettingsRepo(db_session)
+    tz, gen = await srepo.get_report_state(user_id)
+    now_local = local_today(tz)
+    start, end = _prev_month_bounds(now_local)
+    await _send_report_text(cb.message, db_session, start, end, user_id, key=f"cb:{cb.id}", today=now_local, gen=gen)
 
 # ==== Коллбеки существующих кнопок ====
 
 @router.callback_query(F.data == "dayoff")
-async def on_dayoff(cb: CallbackQuery):
-    try:
+async def on_dayoff(cb: CallbackQuery, db_session: AsyncSession):
+    with suppressed("dayoff_kb_hide"):
         await cb.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     cancel_kb_expire(cb.message.chat.id, cb.message.message_id)
+    await cb.answer()
 
     user_id = cb.from_user.id
-    Session = session_factory()
-    async with Session() as session:
-        srepo = SettingsRepo(session)
-        s = await srepo.get_or_create(user_id)
-        now = datetime.now(timezone.utc).astimezone(ZoneInfo(s.timezone))
-        d = now.date()
-        wr = WorkRepo(session)
-        await wr.delete_entry(user_id, d.isoformat())
-    await cb.answer()
-    await cb.message.answer(f"Отметил: выходной {d.strftime('%d.%m.%Y')}")
+    srepo = SettingsRepo(db_session)
+    tz = await srepo.get_timezone(user_id)
+    now = datetime.now(timezone.utc).astimezone(ZoneInfo(tz))
+    d = now.date()
+    wr = WorkRepo(db_session)
+    await wr.set_day_off(user_id, d.isoformat())
+    await _reply(db_session, cb.message.chat.id, f"Отметил: выходной {d.strftime('%d.%m.%Y')}", key=f"cb:{cb.id}")
 
 @router.callback_query(F.data == "help")
-async def on_help(cb: CallbackQuery):
+async def on_help(cb: CallbackQuery, db_session: AsyncSession):
     user_id = cb.from_user.id
-    Session = session_factory()
-    async with Session() as session:
-        wr = WorkRepo(session)
-        templates = await wr.get_templates(user_id)
-        try:
-            await cb.message.edit_text(HELP_TEXT, reply_markup=build_work_kb(templates, include_help=False))
-        except Exception:
-            pass
+    wr = WorkRepo(db_session)
+    templates = await wr.get_templates(user_id)
+    with suppressed("help_edit"):
+        await cb.message.edit_text(HELP_TEXT, reply_markup=build_work_kb(templates, include_help=False))
     cancel_kb_expire(cb.message.chat.id, cb.message.message_id)
     schedule_kb_expire(cb.message.chat.id, cb.message.message_id, seconds=60)
     await cb.answer()
 
 @router.callback_query(F.data.startswith("tpl:"))
-async def on_tpl(cb: CallbackQuery):
-    try:
+async def on_tpl(cb: CallbackQuery, db_session: AsyncSession):
+    with suppressed("tpl_kb_hide"):
         await cb.message.edit_reply_markup(reply_markup=None)
-    except Exception:
-        pass
     cancel_kb_expire(cb.message.chat.id, cb.message.message_id)
+    await cb.answer()
 
     user_id = cb.from_user.id
     parts = cb.data.split(":", 3)
     start = int(parts[1]); end = int(parts[2]); brk = int(parts[3])
 
-    Session = session_factory()
-    async with Session() as session:
-        srepo = SettingsRepo(session)
-        s = await srepo.get_or_create(user_id)
-        now = datetime.now(timezone.utc).astimezone(ZoneInfo(s.timezone))
-        d = now.date()
-        wr = WorkRepo(session)
-        await wr.upsert_entry(user_id, d.isoformat(), start, end, brk)
+    srepo = SettingsRepo(db_session)
+    tz = await srepo.get_timezone(user_id)
+    now = datetime.now(timezone.utc).astimezone(ZoneInfo(tz))
+    d = now.date()
+    wr = WorkRepo(db_session)
+    await wr.upsert_entry(user_id, d.isoformat(), start, end, brk)
 
     total = (end - start) - brk
     if brk:
@@ -339,5 +374,5 @@ async def on_tpl(cb: CallbackQuery):
     else:
         txt = (f"Записал: {d.strftime('%d.%m.%Y')} "
                f"{fmt_hhmm(start)}–{fmt_hhmm(end)} (итого {fmt_hhmm(total)})")
-    await cb.answer()
-    await cb.message.answer(txt)
+    txt += await _balance_line(srepo, user_id)
+    await _reply(db_session, cb.message.chat.id, txt, key=f"cb:{cb.id}")
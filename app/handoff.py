@@ -0,0 +1,242 @@
+# app/handoff.py
+"""
+Передача работы при деплое без паузы в ответах.
+
+Новый процесс (HANDOFF_ON_START=1) полностью стартует — БД, боты, outbox, планировщик —
+и только перед поллингом оставляет заявку в handoffs. Старый процесс её видит,
+перестаёт забирать апдейты, дожидается обработчиков, сбрасывает накопленное
+(трекер, outbox, таймеры клавиатур — через scheduler_requests), отпускает аренду
+планировщика и записывает последние update_id и FSM-состояния. Новый подтверждает
+offset у Telegram, поднимает FSM, забирает аренду и начинает поллинг.
+Не дождались обработчиков — offset останавливается перед самым ранним из них:
+новый процесс получит их заново, а уже обработанные после него пропустит по dedup.
+
+Опирается на внутренности aiogram (Dispatcher._handle_update_tasks, MemoryStorage.storage,
+поля StorageKey) — проверяются при создании координатора, см. check_aiogram_internals().
+"""
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiogram
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app import metrics
+from app.lease import get_leader
+from app.logs import suppressed
+from app.middlewares.dedup import in_flight, seen_updates
+from db.base import session_factory
+from db.handoff_repo import HandoffRepo
+
+log = logging.getLogger("app.handoff")
+
+HANDOFF_ON_START = os.getenv("HANDOFF_ON_START", "") == "1"    # запуск при деплое: принять работу у старого процесса
+HANDOFF_POLL = float(os.getenv("HANDOFF_POLL", "1"))            # сек: как часто старый процесс проверяет заявки
+HANDOFF_WAIT = float(os.getenv("HANDOFF_WAIT", "30"))           # сек: сколько новый ждёт; дальше стартует сам
+HANDOFF_DRAIN_TIMEOUT = float(os.getenv("HANDOFF_DRAIN_TIMEOUT", "20"))  # сек: ожидание незавершённых обработчиков
+
+
+# Поля StorageKey в порядке, в котором ключ лежит в payload (aiogram>=3.5: business_connection_id)
+_KEY_FIELDS = ("bot_id", "chat_id", "user_id", "thread_id", "business_connection_id", "destiny")
+
+
+def _internal(obj: Any, name: str) -> Any:
+    value = getattr(obj, name, None)
+    if value is None:
+        raise RuntimeError(
+            f"handoff: aiogram {aiogram.__version__} has no {type(obj).__name__}.{name}; "
+            f"handoff needs the aiogram version from requirements.txt"
+        )
+    return value
+
+
+def check_aiogram_internals(dp: Dispatcher) -> None:
+    """Всё, что handoff берёт из внутренностей aiogram, — есть в установленной версии; иначе RuntimeError."""
+    _internal(dp, "_handle_update_tasks")
+    if isinstance(dp.storage, MemoryStorage):
+        _internal(dp.storage, "storage")
+    missing = set(_KEY_FIELDS) - {f.name for f in dataclasses.fields(StorageKey)}
+    if missing:
+        raise RuntimeError(
+            f"handoff: aiogram {aiogram.__version__} StorageKey has no {', '.join(sorted(missing))}; "
+            f"handoff needs the aiogram version from requirements.txt"
+        )
+
+
+def snapshot_fsm(storage: BaseStorage) -> List[Dict[str, Any]]:
+    """FSM-состояния MemoryStorage; постоянным хранилищам (Redis и т.п.) передавать нечего."""
+    if not isinstance(storage, MemoryStorage):
+        return []
+    entries = []
+    for key, record in _internal(storage, "storage").items():
+        if record.state is None and not record.data:
+            continue
+        entry = {
+            "key": [getattr(key, name) for name in _KEY_FIELDS],
+            "state": record.state,
+            "data": record.data,
+        }
+        with suppressed("handoff_fsm"):
+            json.dumps(entry)  # несериализуемые данные не передаём (и считаем)
+            entries.append(entry)
+    return entries
+
+
+async def restore_fsm(storage: BaseStorage, entries: Sequence[Dict[str, Any]]) -> int:
+    for entry in entries:
+        key = StorageKey(**dict(zip(_KEY_FIELDS, entry["key"])))
+        await storage.set_state(key, entry["state"])
+        await storage.set_data(key, entry["data"])
+    return len(entries)
+
+
+class HandoffCoordinator:
+    """
+    Обе стороны передачи. Старый процесс: watch() ждёт заявку и останавливает поллинг,
+    on_shutdown дренирует обработчики и вызывает release(). Новый: take_over() в on_startup.
+    """
+
+    def __init__(self, dp: Dispatcher) -> None:
+        # при старте, а не посреди деплоя
+        check_aiogram_internals(dp)
+        self.dp = dp
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handoff_id: Optional[int] = None
+        self._started_at = time.time()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Task] = None
+
+    # --- старый процесс ---
+    async def _watch(self) -> None:
+        while self.handoff_id is None:
+            await asyncio.sleep(HANDOFF_POLL)
+            try:
+                Session = session_factory()
+                async with Session() as session:
+                    # заявки, оставленные до нашего старта, — не нам
+                    handoff_id = await HandoffRepo(session).claim_request(self.instance_id, self._started_at)
+                    await session.commit()
+            except Exception:
+                log.exception("handoff poll failed")
+                continue
+            if handoff_id is not None:
+                self.handoff_id = handoff_id
+                log.info("handoff #%d requested, stopping polling", handoff_id)
+                metrics.inc("handoff_given")
+                # остальное — в on_shutdown, который aiogram вызовет после остановки поллинга
+                self._stopping = asyncio.create_task(self.dp.stop_polling())
+
+    def watch(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def drain(self) -> int:
+        """Дождаться апдейтов, которые aiogram уже отдал обработчикам."""
+        tasks = [t for t in _internal(self.dp, "_handle_update_tasks") if not t.done()]
+        if not tasks:
+            return 0
+        _done, pending = await asyncio.wait(tasks, timeout=HANDOFF_DRAIN_TIMEOUT)
+        if pending:
+            log.warning("%d handlers still running after %.0f s", len(pending), HANDOFF_DRAIN_TIMEOUT)
+        return len(tasks) - len(pending)
+
+    async def release(self, bots: Sequence[Bot]) -> None:
+        """
+        Записать последние update_id и FSM — после того, как аренда и outbox отпущены.
+        Без заявки (обычная остановка) ничего не делает.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.handoff_id is None:
+            return
+        offsets: Dict[str, int] = {}
+        done: Dict[str, List[int]] = {}
+        for bot in bots:
+            seen = seen_updates(bot.id)
+            pending = in_flight(bot.id)
+            if not pending:
+                offsets[str(bot.id)] = seen.newest
+                continue
+            # незавершённые не подтверждаем; обработанные после них новый процесс пропустит
+            offsets[str(bot.id)] = min(pending) - 1
+            done[str(bot.id)] = [x for x in seen.after(min(pending)) if x not in pending]
+            log.warning("handoff #%d: %d updates of bot %d left unprocessed", self.handoff_id, len(pending), bot.id)
+        payload = {"offsets": offsets, "done": done, "fsm": snapshot_fsm(self.dp.storage)}
+        Session = session_factory()
+        async with Session() as session:
+            await HandoffRepo(session).release(self.handoff_id, payload, time.time())
+            await session.commit()
+        log.info("handoff #%d released: %d fsm entries", self.handoff_id, len(payload["fsm"]))
+
+    # --- новый процесс ---
+    async def take_over(self, bots: Sequence[Bot]) -> bool:
+        """
+        Попросить работающий процесс передать работу и дождаться этого (не дольше HANDOFF_WAIT).
+        False — никто не ответил: стартуем как обычно.
+        """
+        Session = session_factory()
+        async with Session() as session:
+            handoff_id = await HandoffRepo(session).request(self.instance_id, time.time())
+            await session.commit()
+        deadline = time.monotonic() + HANDOFF_WAIT
+        state, payload = "requested", None
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(HANDOFF_POLL, 0.25))
+            async with Session() as session:
+                state, payload = await HandoffRepo(session).get(handoff_id)
+            if state == "released":
+                break
+
+        if state != "released" or payload is None:
+            log.warning("handoff #%d not released in %.0f s (%s), starting cold", handoff_id, HANDOFF_WAIT, state)
+            async with Session() as session:
+                await HandoffRepo(session).finish(handoff_id, "abandoned")
+                await session.commit()
+            return False
+
+        offsets = payload.get("offsets", {})
+        done = payload.get("done", {})
+        for bot in bots:
+            seen = seen_updates(bot.id)
+            for update_id in done.get(str(bot.id), ()):
+                seen.add(update_id)
+            last = offsets.get(str(bot.id), -1)
+            if last < 0:
+                continue
+            # подтверждаем у Telegram всё обработанное старым процессом: повторов не будет
+            with suppressed("handoff_confirm"):
+                await bot.get_updates(offset=last + 1, limit=1, timeout=0)
+        restored = await restore_fsm(self.dp.storage, payload.get("fsm", []))
+        async with Session() as session:
+            await HandoffRepo(session).finish(handoff_id, "done")
+            await session.commit()
+        # аренда отпущена старым процессом — забираем сразу, не дожидаясь heartbeat
+        await get_leader().renew_once()
+        metrics.inc("handoff_taken")
+        log.info("handoff #%d taken over: offsets %s, %d fsm entries", handoff_id, offsets, restored)
+        return True
+
+
+_coordinator: Optional[HandoffCoordinator] = None
+
+
+def setup_handoff(dp: Dispatcher) -> HandoffCoordinator:
+    global _coordinator
+    _coordinator = HandoffCoordinator(dp)
+    return _coordinator
+
+
+def get_handoff() -> HandoffCoordinator:
+    assert _coordinator is not None, "Handoff is not initialized. Call setup_handoff() first."
+    return _coordinator
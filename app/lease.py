@@ -0,0 +1,156 @@
+# app/lease.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.scheduler import (
+    apply_request, pending_kb_expiries, restore_reminders, schedule_maintenance, set_owner,
+)
+from db.base import session_factory
+from db.lease_repo import LeaseRepo
+
+log = logging.getLogger("app.lease")
+
+LEASE_NAME = "scheduler"
+LEASE_TTL = float(os.getenv("LEASE_TTL", "15"))          # сек: через сколько чужая аренда считается брошенной
+LEASE_RENEW = float(os.getenv("LEASE_RENEW", "5"))       # сек: период heartbeat/попыток захвата
+REQUEST_POLL = float(os.getenv("LEASE_REQUEST_POLL", "1"))  # сек: обмен заявками через БД
+
+
+class SchedulerLeader:
+    """
+    Выборы владельца планировщика через строку в scheduler_lease.
+    Владелец держит все задачи APScheduler и выполняет заявки из scheduler_requests;
+    остальные инстансы только обрабатывают апдейты и пересылают заявки владельцу.
+    """
+
+    def __init__(self) -> None:
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._valid_until = 0.0
+        self._outgoing: List[Tuple[str, Dict[str, Any], float]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    # --- пересылка заявок (вызывается синхронно из app/scheduler.py) ---
+    def forward(self, kind: str, payload: Dict[str, Any]) -> None:
+        self._outgoing.append((kind, payload, time.time()))
+
+    # --- аренда ---
+    async def renew_once(self) -> bool:
+        now = time.time()
+        try:
+            Session = session_factory()
+            async with Session() as session:
+                acquired = await LeaseRepo(session).try_acquire(LEASE_NAME, self.instance_id, LEASE_TTL, now)
+                await session.commit()
+        except Exception:
+            log.exception("lease renew failed")
+            acquired = self.is_leader and time.time() < self._valid_until
+        if acquired:
+            self._valid_until = now + LEASE_TTL
+        await self._set_leader(acquired)
+        return acquired
+
+    async def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        if leader:
+            log.info("scheduler lease acquired by %s", self.instance_id)
+            set_owner(True)
+            # свои неотправленные заявки выполняем локально
+            pending, self._outgoing = self._outgoing, []
+            for kind, payload, _ in pending:
+                apply_request(kind, payload)
+            await restore_reminders()
+            schedule_maintenance()
+        else:
+            log.info("scheduler lease lost by %s", self.instance_id)
+            # таймеры скрытия клавиатур есть только в памяти: передаём их следующему владельцу
+            # заявками, а не теряем вместе с remove_all_jobs() (напоминания он поднимет из БД)
+            for payload in pending_kb_expiries():
+                self.forward("kb_expire", payload)
+            set_owner(False, self.forward)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(LEASE_RENEW)
+            await self.renew_once()
+
+    # --- обмен заявками ---
+    async def exchange_once(self) -> None:
+        Session = session_factory()
+        async with Session() as session:
+            repo = LeaseRepo(session)
+            if self.is_leader:
+                requests = await repo.take_requests()
+                await session.commit()
+                for kind, payload in requests:
+                    try:
+                        apply_request(kind, payload)
+                    except Exception:
+                        log.exception("scheduler request %s failed", kind)
+            elif self._outgoing:
+                batch, self._outgoing = self._outgoing, []
+                try:
+                    await repo.enqueue_requests(batch)
+                    await session.commit()
+                except Exception:
+                    self._outgoing[:0] = batch
+                    raise
+
+    async def _exchange_loop(self) -> None:
+        while True:
+            await asyncio.sleep(REQUEST_POLL)
+            try:
+                await self.exchange_once()
+            except Exception:
+                log.exception("scheduler request exchange failed")
+
+    # --- жизненный цикл ---
+    async def start(self) -> None:
+        # до первой попытки считаем себя не-владельцем: заявки копятся в памяти
+        set_owner(False, self.forward)
+        await self.renew_once()
+        self._tasks = [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._exchange_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._outgoing and not self.is_leader:
+            await self.exchange_once()
+        if self.is_leader:
+            # таймеры клавиатур уходят в _outgoing и в БД — вместе с освобождением аренды
+            await self._set_leader(False)
+            pending, self._outgoing = self._outgoing, []
+            Session = session_factory()
+            async with Session() as session:
+                repo = LeaseRepo(session)
+                await repo.enqueue_requests(pending)
+                await repo.release(LEASE_NAME, self.instance_id)
+                await session.commit()
+
+
+_leader: Optional[SchedulerLeader] = None
+
+
+async def setup_leader() -> SchedulerLeader:
+    global _leader
+    _leader = SchedulerLeader()
+    await _leader.start()
+    return _leader
+
+
+def get_leader() -> SchedulerLeader:
+    assert _leader is not None, "Scheduler leader is not initialized. Call setup_leader() first."
+    return _leader
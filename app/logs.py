@@ -0,0 +1,150 @@
+# app/logs.py
+"""
+Логи без задержек на event loop: обработчики только кладут запись в очередь,
+форматирование (JSON) и запись в stderr — в отдельном потоке QueueListener.
+К каждой записи добавляется контекст текущего апдейта (update_id, user_id,
+handler, duration_ms) — его ведёт LogContextMiddleware (app/middlewares/logctx.py).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator, Optional, Tuple, Type
+
+from app import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")               # json | text
+LOG_SAMPLE = float(os.getenv("LOG_SAMPLE", "0.1"))         # доля записываемых рядовых событий «update»
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "1000"))      # мс: медленные апдейты пишутся всегда
+
+log = logging.getLogger("app.logs")
+
+# контекст текущего апдейта; словарь изменяемый — внутренняя мидлварь дописывает handler
+_update_ctx: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_update_ctx", default=None)
+
+CONTEXT_FIELDS = ("update_id", "user_id", "bot_id", "handler", "duration_ms")
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+@contextmanager
+def update_context(**fields: Any) -> Iterator[Dict[str, Any]]:
+    ctx = dict(fields)
+    token = _update_ctx.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _update_ctx.reset(token)
+
+
+def current_context() -> Optional[Dict[str, Any]]:
+    return _update_ctx.get()
+
+
+def sampled(duration_ms: float) -> bool:
+    """Писать ли рядовое событие: медленные — всегда, остальные — с вероятностью LOG_SAMPLE."""
+    return duration_ms >= LOG_SLOW_MS or random.random() < LOG_SAMPLE
+
+
+@contextmanager
+def suppressed(site: str, ignore: Tuple[Type[BaseException], ...] = ()) -> Iterator[None]:
+    """
+    Вместо «except Exception: pass»: ошибку глотаем, но считаем (метрика suppressed_<site>)
+    и пишем в debug. ignore — ожидаемые исключения (например, задачи уже нет), их не считаем.
+    """
+    try:
+        yield
+    except ignore:
+        pass
+    except Exception:
+        metrics.inc(f"suppressed_{site}")
+        log.debug("suppressed exception at %s", site, exc_info=True, extra={"site": site})
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Выполняется в потоке, который логирует: здесь только снимаем контекст апдейта
+    и превращаем запись в пригодную для очереди (сообщение и traceback — строками).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        ctx = _update_ctx.get()
+        if ctx:
+            for key, value in ctx.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.message = message, None, message
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на запись: время, уровень, логгер, сообщение, контекст и extra-поля."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                data[key] = value
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = " ".join(f"{k}={getattr(record, k)}" for k in CONTEXT_FIELDS if getattr(record, k, None) is not None)
+        return f"{line} [{extra}]" if extra else line
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> QueueListener:
+    """
+    Корневой логгер пишет только в очередь; поток-слушатель форматирует и выводит.
+    """
+    global _listener
+    stream = logging.StreamHandler(sys.stderr)
+    if fmt == "text":
+        stream.setFormatter(_TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_ContextQueueHandler(q))
+    root.setLevel(level)
+    # «Update id=… is handled» на каждый апдейт — его заменяет выборочное событие update
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    _listener = QueueListener(q, stream, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Дописать очередь и остановить поток-слушатель."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
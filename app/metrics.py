@@ -0,0 +1,24 @@
+# app/metrics.py
+from __future__ import annotations
+from collections import Counter
+from typing import Dict
+
+# Простые счётчики/гейджи процесса: inc("reminders_suppressed"), snapshot()
+_counters: Counter = Counter()
+_gauges: Dict[str, float] = {}
+
+def inc(name: str, n: int = 1) -> None:
+    _counters[name] += n
+
+def set_gauge(name: str, value: float) -> None:
+    _gauges[name] = value
+
+def get(name: str) -> float:
+    if name in _gauges:
+        return _gauges[name]
+    return _counters[name]
+
+def snapshot() -> Dict[str, float]:
+    data: Dict[str, float] = dict(_counters)
+    data.update(_gauges)
+    return data
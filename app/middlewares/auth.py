@@ -3,6 +3,7 @@ from typing import Any, Awaitable, Callable, Dict
 from aiogram import BaseMiddleware, types
 from aiogram import Bot
 from db.users_repo import UsersRepo
+from db.activity import get_activity_tracker
 
 # ВАЖНО: укажи реальный ID админа (не 86269683200 — это слишком длинный!)
 ADMIN_ID = 86269683200
@@ -22,18 +23,18 @@ class AuthMiddleware(BaseMiddleware):
         if user is None:
             return await handler(event, data)
 
-        users_repo: UsersRepo | None = data.get("users_repo")
-        if users_repo is None:
+        # Админ — всегда разрешён; активность пишется в users пачкой (db/activity.py).
+        # До проверки users_repo: на dp.update сессии БД ещё нет, а трекеру она не нужна
+        if user.id == ADMIN_ID:
+            get_activity_tracker().touch(user.id, user.username)
             return await handler(event, data)
 
-        # Админ — всегда разрешён и апсертим запись
-        if user.id == ADMIN_ID:
-            await users_repo.upsert_user(tg_id=user.id, username=user.username)
+        users_repo: UsersRepo | None = data.get("users_repo")
+        if users_repo is None:
             return await handler(event, data)
 
         # Проверяем доступ обычного пользователя
-        db_user = await users_repo.get_by_tg_id(user.id)
-        if db_user is None:
+        if not await users_repo.exists(user.id):
             text = (
                f"Hello {user.full_name}. "
                f"Please send your ID: {user.id} to the administrator."
@@ -0,0 +1,143 @@
+# app/middlewares/dedup.py
+import logging
+import os
+from array import array
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from app import metrics
+from app.tenants import is_default
+
+log = logging.getLogger("app.dedup")
+
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "10000"))   # сколько последних update_id помним
+DEDUP_STATE_PATH = os.getenv("DEDUP_STATE_PATH", "")         # файл состояния между рестартами; пусто = не сохранять
+
+_EMPTY = -1
+
+
+class SeenUpdates:
+    """
+    Последние update_id: кольцевой буфер (порядок вытеснения) + множество (проверка за O(1)).
+    Виденным считается только то, что есть в буфере: монотонности update_id не предполагаем —
+    после недели без апдейтов Telegram начинает нумерацию со случайного числа, в т.ч. меньшего.
+    """
+    __slots__ = ("capacity", "_ring", "_pos", "_ids")
+
+    def __init__(self, capacity: int = DEDUP_CAPACITY) -> None:
+        self.capacity = capacity
+        self._ring = array("q", [_EMPTY]) * capacity
+        self._pos = 0
+        self._ids: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, update_id: int) -> bool:
+        """True — апдейт новый (и теперь запомнен), False — уже был."""
+        if update_id in self._ids:
+            return False
+        old = self._ring[self._pos]
+        if old != _EMPTY:
+            self._ids.discard(old)
+        self._ring[self._pos] = update_id
+        self._pos = (self._pos + 1) % self.capacity
+        self._ids.add(update_id)
+        return True
+
+    @property
+    def newest(self) -> int:
+        """Последний запомненный update_id (-1 — ещё ничего)."""
+        return self._ring[self._pos - 1]
+
+    def after(self, update_id: int) -> List[int]:
+        """Запомненные update_id больше данного, по возрастанию."""
+        return sorted(x for x in self._ids if x > update_id)
+
+    def save(self, path: str) -> None:
+        # в порядке поступления: при загрузке кольцо восстановится как было
+        ordered = self._ring[self._pos:] + self._ring[:self._pos]
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            array("q", (x for x in ordered if x != _EMPTY)).tofile(f)
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> int:
+        data = array("q")
+        with open(path, "rb") as f:
+            data.frombytes(f.read())
+        for update_id in data:
+            self.add(update_id)
+        return len(data)
+
+
+class DedupMiddleware(BaseMiddleware):
+    """
+    Внешняя мидлварь на dp.update (снаружи только контекст логов и выбор бота, см. main.py):
+    повторно доставленный апдейт (рестарт посреди поллинга, ретрай вебхука) пропускается
+    до троттлинга и обработчиков.
+    update_id у каждого бота свои — и кэш у каждого свой.
+    Апдейты в обработке видны через in_flight() — передача работы при деплое (app/handoff.py).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        bot_id = data["bot"].id
+        if not seen_updates(bot_id).add(event.update_id):
+            metrics.inc("dedup_skipped")
+            return None
+        running = _in_flight.setdefault(bot_id, set())
+        running.add(event.update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            running.discard(event.update_id)
+
+
+_seen: Dict[int, SeenUpdates] = {}
+# bot_id -> update_id, чьи обработчики ещё не завершились
+_in_flight: Dict[int, Set[int]] = {}
+
+
+def in_flight(bot_id: int) -> Set[int]:
+    return set(_in_flight.get(bot_id, ()))
+
+
+def _state_path(bot_id: int, path: str) -> str:
+    # у бота по умолчанию — прежнее имя файла
+    return path if is_default(bot_id) else f"{path}.{bot_id}"
+
+
+def seen_updates(bot_id: int, path: str = DEDUP_STATE_PATH) -> SeenUpdates:
+    """Кэш бота; при первом обращении поднимается из файла состояния."""
+    seen = _seen.get(bot_id)
+    if seen is not None:
+        return seen
+    seen = _seen[bot_id] = SeenUpdates()
+    state = _state_path(bot_id, path) if path else ""
+    if state and os.path.exists(state):
+        try:
+            n = seen.load(state)
+            log.info("restored %d seen update ids from %s", n, state)
+        except (OSError, ValueError):
+            log.warning("cannot read dedup state %s, starting empty", state)
+    return seen
+
+
+def save_seen_updates(path: str = DEDUP_STATE_PATH) -> None:
+    if not path:
+        return
+    for bot_id, seen in _seen.items():
+        state = _state_path(bot_id, path)
+        try:
+            seen.save(state)
+        except OSError:
+            log.exception("cannot save dedup state to %s", state)
@@ -0,0 +1,95 @@
+# app/middlewares/intake.py
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import CallbackQuery, Update
+
+from app import metrics
+from app.logs import suppressed
+
+INTAKE_CONCURRENCY = int(os.getenv("INTAKE_CONCURRENCY", "8"))      # одновременно в обработчиках
+INTAKE_MAX_QUEUE = int(os.getenv("INTAKE_MAX_QUEUE", "200"))        # сверх этого коллбеки сбрасываем
+CALLBACK_MAX_AGE = float(os.getenv("CALLBACK_MAX_AGE", "90"))       # сек: клавиатуры живут 60 с (+запас)
+CALLBACK_ANSWER_WINDOW = float(os.getenv("CALLBACK_ANSWER_WINDOW", "15"))  # сек: дольше Telegram ответа не ждёт
+
+
+class IntakeMiddleware(BaseMiddleware):
+    """
+    Outer-мидлварь на dp.update: ограниченная очередь перед роутерами.
+    Не больше INTAKE_CONCURRENCY апдейтов обрабатываются одновременно, остальные ждут.
+    Коллбеки по уже истёкшим клавиатурам и простоявшие в очереди дольше окна ответа
+    закрываются сразу, без обработчика. Сообщения не сбрасываются никогда — это данные.
+    """
+
+    def __init__(self, concurrency: int = INTAKE_CONCURRENCY, max_queue: int = INTAKE_MAX_QUEUE) -> None:
+        self._sem = asyncio.Semaphore(concurrency)
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.waiting + self.active
+
+    def _gauges(self) -> None:
+        metrics.set_gauge("intake_queue_depth", self.waiting)
+        metrics.set_gauge("intake_active", self.active)
+
+    @staticmethod
+    def _keyboard_age(cb: CallbackQuery) -> float:
+        msg = cb.message
+        shown = getattr(msg, "edit_date", None) or getattr(msg, "date", None)
+        if not isinstance(shown, datetime) or shown.timestamp() <= 0:
+            # InaccessibleMessage (date=0) — сообщение слишком старое
+            return float("inf")
+        return (datetime.now(timezone.utc) - shown).total_seconds()
+
+    async def _shed(self, bot: Bot, cb: CallbackQuery, reason: str, hide_kb: bool = False) -> None:
+        metrics.inc(f"intake_shed_{reason}")
+        with suppressed("cb_answer"):
+            # окно ответа на коллбек могло уже закрыться
+            await bot.answer_callback_query(cb.id, text="Клавиатура устарела, запросите заново.")
+        if hide_kb and cb.message is not None and getattr(cb.message, "date", None):
+            with suppressed("intake_shed_kb_hide"):
+                await bot.edit_message_reply_markup(chat_id=cb.message.chat.id, message_id=cb.message.message_id,
+                                                    reply_markup=None)
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        received = time.monotonic()
+        cb = event.callback_query if isinstance(event, Update) else None
+        bot: Bot = data["bot"]
+
+        if cb is not None:
+            if self._keyboard_age(cb) > CALLBACK_MAX_AGE:
+                # таймер скрытия не сработал (простой бота) — уберём клавиатуру сейчас
+                return await self._shed(bot, cb, "expired", hide_kb=True)
+            if self.waiting >= self.max_queue:
+                return await self._shed(bot, cb, "overload")
+
+        self.waiting += 1
+        self._gauges()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            if cb is not None and time.monotonic() - received > CALLBACK_ANSWER_WINDOW:
+                return await self._shed(bot, cb, "late")
+            self.active += 1
+            self._gauges()
+            try:
+                return await handler(event, data)
+            finally:
+                self.active -= 1
+                self._gauges()
+        finally:
+            self._sem.release()
@@ -0,0 +1,61 @@
+# app/middlewares/logctx.py
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+
+from app.logs import current_context, sampled, update_context
+
+log = logging.getLogger("app.update")
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Самая внешняя мидлварь на dp.update: контекст логов апдейта (update_id, user_id, bot_id)
+    и итоговое событие «update» с длительностью — выборочно (LOG_SAMPLE), медленные и упавшие всегда.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        user = data.get("event_from_user")
+        with update_context(
+            update_id=event.update_id,
+            user_id=user.id if user is not None else None,
+            bot_id=data["bot"].id,
+        ) as ctx:
+            started = time.perf_counter()
+            try:
+                result = await handler(event, data)
+            except Exception:
+                ctx["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                log.exception("update failed")
+                raise
+            ctx["duration_ms"] = duration = round((time.perf_counter() - started) * 1000, 1)
+            if sampled(duration):
+                log.info("update", extra={"event_type": event.event_type, "handled": result is not UNHANDLED})
+            return result
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Внутренняя мидлварь: дописывает в контекст логов имя выбранного обработчика."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        ctx = current_context()
+        handler_obj = data.get("handler")
+        if ctx is not None and handler_obj is not None:
+            ctx["handler"] = getattr(handler_obj.callback, "__qualname__", repr(handler_obj.callback))
+        return await handler(event, data)
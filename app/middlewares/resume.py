@@ -0,0 +1,27 @@
+# app/middlewares/resume.py
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+
+from app.scheduler import resume_reminders_if_paused
+
+
+class ResumeRemindersMiddleware(BaseMiddleware):
+    """
+    Внутренняя мидлварь (после DbSessionMiddleware): пользователь написал или нажал
+    кнопку — значит снова доступен; снятая пауза напоминаний коммитится вместе с апдейтом.
+    Проверка — после обработчика: его ответы в Telegram не идут внутри пишущей транзакции.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        result = await handler(event, data)
+        user = data.get("event_from_user")
+        session = data.get("db_session")
+        if user is not None and session is not None:
+            await resume_reminders_if_paused(session, user.id)
+        return result
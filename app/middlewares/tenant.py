@@ -0,0 +1,22 @@
+# app/middlewares/tenant.py
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+
+from app.tenants import use_bot
+
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Первая outer-мидлварь на dp.update: всё, что ниже (сессии, репозитории,
+    планировщик, outbox), работает от имени бота, получившего апдейт, и в его схеме БД.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        with use_bot(data["bot"].id):
+            return await handler(event, data)
@@ -0,0 +1,109 @@
+# app/middlewares/throttle.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Update
+
+from app import metrics
+from app.logs import suppressed
+
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))            # апдейтов в секунду на пользователя
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))          # ёмкость ведра (разовый всплеск)
+THROTTLE_MAX_DELAY = float(os.getenv("THROTTLE_MAX_DELAY", "2"))  # сек: дольше сообщение не придерживаем
+
+SLOW_DOWN_TEXT = "Слишком часто. Подождите пару секунд."
+
+# (bot_id, user_id) -> (токены, время последнего пересчёта, уже предупреждён)
+Key = Tuple[int, int]
+Bucket = Tuple[float, float, bool]
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """
+    Outer-мидлварь на dp.update (до IntakeMiddleware): ведро токенов на пользователя.
+    Коллбеки сверх лимита сбрасываются (повторные нажатия одной кнопки — дубли).
+    Сообщения — данные: небольшой перерасход придерживается до появления токена,
+    и только если ждать дольше THROTTLE_MAX_DELAY, сообщение сбрасывается.
+    Предупреждение «помедленнее» — одно на серию, до первого пропущенного апдейта.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST,
+                 max_delay: float = THROTTLE_MAX_DELAY) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_delay = max_delay
+        # порядок = давность последнего касания; полное ведро неотличимо от отсутствующего
+        self._buckets: "OrderedDict[Key, Bucket]" = OrderedDict()
+        self._idle_ttl = burst / rate + max_delay
+
+    def _expire(self, now: float) -> None:
+        while self._buckets:
+            key, (_tokens, stamp, _noticed) = next(iter(self._buckets.items()))
+            if now - stamp < self._idle_ttl:
+                break
+            del self._buckets[key]
+        metrics.set_gauge("throttle_buckets", len(self._buckets))
+
+    def _take(self, key: Key, now: float) -> Tuple[float, bool]:
+        """
+        Списать токен. Возвращает (сколько ждать до него, предупреждали ли уже).
+        Токены могут уйти в минус — это очередь уже придержанных сообщений.
+        """
+        tokens, stamp, noticed = self._buckets.pop(key, (self.burst, now, False))
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate) - 1
+        wait = -tokens / self.rate if tokens < 0 else 0.0
+        self._buckets[key] = (tokens, now, noticed and wait > 0)
+        return wait, noticed
+
+    def _refund(self, key: Key, noticed: bool) -> None:
+        # сброшенный апдейт токен не тратит
+        tokens, stamp, _ = self._buckets[key]
+        self._buckets[key] = (tokens + 1, stamp, noticed)
+
+    @staticmethod
+    def _user_id(event: Update) -> Optional[int]:
+        src = event.message or event.callback_query
+        user = getattr(src, "from_user", None)
+        return user.id if user is not None else None
+
+    async def _notify(self, bot: Bot, event: Update, first: bool) -> None:
+        with suppressed("throttle_notice"):
+            if event.callback_query is not None:
+                # ответ на коллбек обязателен (иначе «часики»); текст — только первый раз
+                await bot.answer_callback_query(event.callback_query.id, text=SLOW_DOWN_TEXT if first else None)
+            elif first:
+                await bot.send_message(chat_id=event.message.chat.id, text=SLOW_DOWN_TEXT)
+        if first:
+            metrics.inc("throttle_notices")
+
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        user_id = self._user_id(event) if isinstance(event, Update) else None
+        if user_id is None:
+            return await handler(event, data)
+
+        key = (data["bot"].id, user_id)
+        now = time.monotonic()
+        self._expire(now)
+        wait, noticed = self._take(key, now)
+        if wait <= 0:
+            return await handler(event, data)
+
+        if event.message is not None and wait <= self.max_delay:
+            metrics.inc("throttle_delayed")
+            await asyncio.sleep(wait)
+            return await handler(event, data)
+
+        kind = "callback" if event.callback_query is not None else "message"
+        metrics.inc(f"throttle_dropped_{kind}")
+        self._refund(key, noticed=True)
+        await self._notify(data["bot"], event, first=not noticed)
+        return None
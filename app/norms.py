@@ -0,0 +1,102 @@
+# app/norms.py
+from __future__ import annotations
+
+import os
+from array import array
+from datetime import date, timedelta
+from functools import lru_cache
+from itertools import accumulate
+from typing import FrozenSet, Iterable, List
+
+# Норма по дням недели в минутах, Пн..Вс
+WEEKDAY_NORMS: List[int] = [int(x) for x in os.getenv("WORK_NORM_MINUTES", "480,480,480,480,480,0,0").split(",")]
+HOLIDAY_CALENDAR = os.getenv("HOLIDAY_CALENDAR", "pl")  # pl | none
+HOLIDAYS_EXTRA: FrozenSet[date] = frozenset(
+    date.fromisoformat(x.strip()) for x in os.getenv("HOLIDAYS_EXTRA", "").split(",") if x.strip()
+)
+
+
+def _easter(year: int) -> date:
+    # григорианская Пасха (алгоритм Мееуса/Джонса/Бутчера)
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def public_holidays(year: int) -> FrozenSet[date]:
+    days = {d for d in HOLIDAYS_EXTRA if d.year == year}
+    if HOLIDAY_CALENDAR == "pl":
+        easter = _easter(year)
+        days.update({
+            date(year, 1, 1), date(year, 1, 6), date(year, 5, 1), date(year, 5, 3),
+            date(year, 8, 15), date(year, 11, 1), date(year, 11, 11),
+            date(year, 12, 25), date(year, 12, 26),
+            easter, easter + timedelta(days=1),          # Пасха, Пасхальный понедельник
+            easter + timedelta(days=49),                 # Троица
+            easter + timedelta(days=60),                 # Божье Тело
+        })
+        if year >= 2025:
+            days.add(date(year, 12, 24))                 # Сочельник — выходной с 2025
+    return frozenset(days)
+
+
+class YearCalendar:
+    """
+    Норма по дням года в компактных массивах:
+    day_norm[i] — норма i-го дня (минуты), prefix[i] — сумма норм дней 0..i-1.
+    Норма любого отрезка внутри года — одна разность prefix, без цикла по дням.
+    """
+    __slots__ = ("year", "first", "day_norm", "prefix")
+
+    def __init__(self, year: int) -> None:
+        self.year = year
+        self.first = date(year, 1, 1)
+        n = (date(year + 1, 1, 1) - self.first).days
+        wd0 = self.first.weekday()
+        norms = [WEEKDAY_NORMS[(wd0 + i) % 7] for i in range(n)]
+        for h in public_holidays(year):
+            norms[(h - self.first).days] = 0
+        self.day_norm = array("H", norms)
+        self.prefix = array("l", accumulate(norms, initial=0))
+
+    def norm_between(self, start: date, end: date) -> int:
+        lo = max((start - self.first).days, 0)
+        hi = min((end - self.first).days + 1, len(self.day_norm))
+        if hi <= lo:
+            return 0
+        return self.prefix[hi] - self.prefix[lo]
+
+    def norm_on(self, d: date) -> int:
+        return self.day_norm[(d - self.first).days]
+
+
+@lru_cache(maxsize=32)
+def year_calendar(year: int) -> YearCalendar:
+    return YearCalendar(year)
+
+
+def norm_minutes(start: date, end: date, days_off: Iterable[date] = ()) -> int:
+    """
+    Норма за [start, end] включительно за вычетом дней, отмеченных выходными (dayoff).
+    """
+    if end < start:
+        return 0
+    total = sum(year_calendar(y).norm_between(start, end) for y in range(start.year, end.year + 1))
+    for d in days_off:
+        if start <= d <= end:
+            total -= year_calendar(d.year).norm_on(d)
+    return total
+
+
+def fmt_signed(minutes: int) -> str:
+    sign = "+" if minutes >= 0 else "-"
+    m = abs(minutes)
+    return f"{sign}{m // 60:02d}:{m % 60:02d}"
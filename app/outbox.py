@@ -0,0 +1,183 @@
+# app/outbox.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SyncSession
+
+from app import metrics
+from app.tenants import current_bot_id, schema_of, use_bot
+from db.base import session_factory
+from db.outbox_repo import OutboxItem, OutboxRepo
+
+log = logging.getLogger("app.outbox")
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "20"))
+OUTBOX_LOCK = float(os.getenv("OUTBOX_LOCK", "30"))            # сек: аренда забранной пачки
+OUTBOX_SEND_TIMEOUT = int(os.getenv("OUTBOX_SEND_TIMEOUT", "10"))  # сек: таймаут одной отправки
+OUTBOX_POLL = float(os.getenv("OUTBOX_POLL", "2"))            # сек: страховочный опрос без уведомлений
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_KEEP_SENT = float(os.getenv("OUTBOX_KEEP_SENT", str(24 * 3600)))  # сек: сколько хранить отправленные
+
+
+class OutboxSender:
+    """
+    Фоновый отправитель outbox: забирает пачки готовых сообщений, шлёт их
+    и отмечает результат одной транзакцией на пачку. Доставка at-least-once:
+    падение между отправкой и отметкой даст повтор после рестарта.
+    Один отправитель на бота: outbox лежит в схеме бота.
+    Пачка укладывается в аренду: новая отправка начинается, только если до конца аренды
+    остаётся не меньше OUTBOX_SEND_TIMEOUT, остальное возвращается в очередь —
+    другой инстанс не заберёт строки, которые мы ещё шлём. RetryAfter — лимит на весь бот:
+    пачка прерывается, неотправленное ждёт того же срока.
+    """
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self._flood_until = 0.0
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _send(self, item: OutboxItem) -> None:
+        kwargs = {}
+        if item.parse_mode is not None:
+            kwargs["parse_mode"] = item.parse_mode
+        await self.bot.send_message(chat_id=item.chat_id, text=item.text,
+                                    request_timeout=OUTBOX_SEND_TIMEOUT, **kwargs)
+
+    async def drain_once(self) -> int:
+        """Отправить одну пачку. Возвращает число обработанных сообщений."""
+        with use_bot(self.bot.id):
+            return await self._drain_batch()
+
+    async def _drain_batch(self) -> int:
+        if time.time() < self._flood_until:
+            return 0
+        Session = session_factory()
+        claimed = time.monotonic()
+        async with Session() as session:
+            items = await OutboxRepo(session).claim(self.owner, OUTBOX_BATCH, lock_seconds=OUTBOX_LOCK)
+            await session.commit()
+        if not items:
+            return 0
+
+        sent: List[int] = []
+        failures: List[tuple[int, str, Optional[float]]] = []
+        rest: List[int] = []
+        release_at = 0.0
+        for i, item in enumerate(items):
+            if time.monotonic() > claimed + OUTBOX_LOCK - OUTBOX_SEND_TIMEOUT:
+                rest, release_at = [it.id for it in items[i:]], time.time()
+                break
+            try:
+                await self._send(item)
+                sent.append(item.id)
+            except TelegramRetryAfter as e:
+                self._flood_until = time.time() + e.retry_after
+                failures.append((item.id, str(e), self._flood_until))
+                rest, release_at = [it.id for it in items[i + 1:]], self._flood_until
+                break
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # заблокирован/чат не найден/некорректный текст — повтор не поможет
+                failures.append((item.id, str(e), None))
+            except Exception as e:
+                if item.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                    failures.append((item.id, repr(e), None))
+                else:
+                    failures.append((item.id, repr(e), time.time() + min(300, 2 ** item.attempts)))
+
+        async with Session() as session:
+            repo = OutboxRepo(session)
+            await repo.mark_sent(sent)
+            for item_id, error, retry_at in failures:
+                await repo.mark_failed(item_id, error, retry_at)
+            await repo.release(rest, release_at)
+            if time.time() - self._last_purge > 3600:
+                await repo.purge_sent(time.time() - OUTBOX_KEEP_SENT)
+                self._last_purge = time.time()
+            await session.commit()
+
+        metrics.inc("outbox_sent", len(sent))
+        metrics.inc("outbox_retry", sum(1 for f in failures if f[2] is not None))
+        metrics.inc("outbox_dead", sum(1 for f in failures if f[2] is None))
+        metrics.inc("outbox_released", len(rest))
+        return len(items) - len(rest)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.drain_once() >= OUTBOX_BATCH:
+                    pass
+            except Exception:
+                log.exception("outbox drain failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # дошлём то, что успели закоммитить
+        try:
+            while await self.drain_once():
+                pass
+        except Exception:
+            log.exception("outbox final drain failed")
+
+
+# схема бота ("" — основная) -> отправитель
+_senders: Dict[str, OutboxSender] = {}
+_NOT_DIRTY = object()
+
+
+@event.listens_for(SyncSession, "after_commit")
+def _wake_after_commit(session: SyncSession) -> None:
+    # OutboxRepo.enqueue помечает сессию схемой; будим её отправителя только после commit
+    schema = session.info.pop("outbox_dirty", _NOT_DIRTY)
+    if schema is not _NOT_DIRTY:
+        sender = _senders.get(schema or "")
+        if sender is not None:
+            sender.notify()
+
+
+def setup_outbox(bot: Bot) -> OutboxSender:
+    sender = OutboxSender(bot)
+    _senders[schema_of(bot.id) or ""] = sender
+    sender.start()
+    return sender
+
+
+def get_outbox(bot_id: Optional[int] = None) -> OutboxSender:
+    key = schema_of(current_bot_id() if bot_id is None else bot_id) or ""
+    assert key in _senders, "Outbox is not initialized. Call setup_outbox() first."
+    return _senders[key]
+
+
+async def stop_outboxes() -> None:
+    for sender in list(_senders.values()):
+        await sender.stop()
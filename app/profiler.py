@@ -0,0 +1,124 @@
+# app/profiler.py
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+# Наши модули: по ним строим сводку «какие обработчики/корутины горячие»
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_IDLE_FUNCS = {"select", "poll"}  # селектор, вызванный прямо из _run_once: цикл ждёт событий
+_LOOP_STEP = "_run_once"           # BaseEventLoop._run_once: всё, что ниже, — запуск цикла, а не работа
+
+MAX_SECONDS = 60
+
+
+@dataclass
+class ProfileResult:
+    seconds: float
+    interval: float
+    samples: int = 0
+    idle: int = 0
+    stacks: Counter = field(default_factory=Counter)      # "a;b;c" -> samples
+    inclusive: Counter = field(default_factory=Counter)   # наша функция -> samples (в стеке)
+    own: Counter = field(default_factory=Counter)         # самая глубокая наша функция -> samples
+
+    def collapsed(self) -> str:
+        """Формат collapsed stacks (flamegraph.pl / speedscope)."""
+        return "\n".join(f"{stack} {n}" for stack, n in self.stacks.most_common()) + "\n"
+
+    def summary(self, top: int = 15) -> str:
+        busy = self.samples - self.idle
+        lines = [
+            f"Сэмплов: {self.samples} за {self.seconds:g} с (шаг {self.interval * 1000:g} мс)",
+            f"Цикл занят: {100 * busy / self.samples if self.samples else 0:.1f}%",
+            "",
+            "Включительно (наш код):",
+        ]
+        for name, n in self.inclusive.most_common(top):
+            lines.append(f"{100 * n / self.samples:5.1f}%  {name}")
+        lines.append("")
+        lines.append("Собственное время (самый глубокий наш кадр):")
+        for name, n in self.own.most_common(top):
+            lines.append(f"{100 * n / self.samples:5.1f}%  {name}")
+        return "\n".join(lines)
+
+
+def _frame_name(code) -> Tuple[str, bool]:
+    filename = code.co_filename
+    ours = filename.startswith(_PROJECT_ROOT) and "site-packages" not in filename
+    if ours:
+        mod = os.path.relpath(filename, _PROJECT_ROOT)[:-3].replace(os.sep, ".")
+    else:
+        mod = os.path.splitext(os.path.basename(filename))[0]
+    return f"{mod}:{code.co_qualname if hasattr(code, 'co_qualname') else code.co_name}", ours
+
+
+def _is_idle(leaf) -> bool:
+    """
+    Цикл ждёт событий: самый глубокий кадр — селектор, вызванный прямо из _run_once,
+    и с ненулевым таймаутом (select(0) — опрос сокетов между готовыми колбэками, цикл занят).
+    """
+    caller = leaf.f_back
+    if leaf.f_code.co_name not in _IDLE_FUNCS or caller is None or caller.f_code.co_name != _LOOP_STEP:
+        return False
+    # селекторы stdlib приводят таймаут внутри select(): 0 — опрос, None/-1/>0 — ожидание
+    return leaf.f_locals.get("timeout") != 0
+
+
+def _sample(thread_id: int, seconds: float, interval: float) -> ProfileResult:
+    """
+    Работает в отдельном потоке: периодически снимает стек потока event loop'а.
+    Пока профилировщик не запущен, никаких хуков нет — нулевая стоимость.
+    """
+    result = ProfileResult(seconds=seconds, interval=interval)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            stack: List[str] = []
+            ours: List[str] = []
+            result.samples += 1
+            if _is_idle(frame):
+                result.idle += 1
+            in_loop = True
+            while frame is not None:
+                code = frame.f_code
+                name, is_ours = _frame_name(code)
+                stack.append(name)
+                # main.py и прочие <module> ниже _run_once есть в каждом сэмпле — это не время нашего кода
+                if code.co_name == _LOOP_STEP:
+                    in_loop = False
+                elif is_ours and in_loop and code.co_name != "<module>":
+                    ours.append(name)
+                frame = frame.f_back
+            stack.reverse()
+            result.stacks[";".join(stack)] += 1
+            for name in set(ours):
+                result.inclusive[name] += 1
+            if ours:
+                result.own[ours[0]] += 1
+        time.sleep(interval)
+    return result
+
+
+_lock = asyncio.Lock()
+
+
+def is_running() -> bool:
+    return _lock.locked()
+
+
+async def profile_loop(seconds: float, interval: float = 0.005) -> ProfileResult:
+    """
+    Сэмплирующий профиль потока, в котором крутится текущий event loop.
+    """
+    seconds = max(1.0, min(float(seconds), MAX_SECONDS))
+    async with _lock:
+        loop_thread = threading.get_ident()
+        return await asyncio.to_thread(_sample, loop_thread, seconds, interval)
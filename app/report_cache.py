@@ -0,0 +1,47 @@
+# app/report_cache.py
+"""
+Кэш готовых отчётов (текст для outbox) по (схема бота, user_id, start, end).
+Точность — через поколение данных пользователя в БД (user_settings.report_gen):
+WorkRepo и архивация поднимают его в той же транзакции, что и правку записей,
+поэтому запись на любой реплике видна всем остальным. Поколение читается
+до выборки — отчёт, собранный параллельно с записью, сохранится со старым
+поколением и не всплывёт. Норма «по сегодняшний день» зависит от даты — она тоже
+часть проверки. В памяти процесса только тексты; без строки настроек (report_gen
+неизвестен) отчёт не кэшируется.
+"""
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from datetime import date
+from typing import Optional, Tuple
+
+from app import metrics
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "2000"))   # отчётов в LRU
+
+# (schema, user_id, start, end) -> (report_gen, дата «сегодня» при рендере, текст)
+Key = Tuple[Optional[str], int, date, date]
+_cache: "OrderedDict[Key, Tuple[int, date, str]]" = OrderedDict()
+
+
+def get(schema: Optional[str], user_id: int, start: date, end: date, today: date, gen: int) -> Optional[str]:
+    """gen — report_gen пользователя, прочитанный в этом апдейте."""
+    key = (schema, user_id, start, end)
+    hit = _cache.get(key)
+    if hit is None or hit[0] != gen or hit[1] != today:
+        metrics.inc("report_cache_miss")
+        return None
+    _cache.move_to_end(key)
+    metrics.inc("report_cache_hit")
+    return hit[2]
+
+
+def put(schema: Optional[str], user_id: int, start: date, end: date, today: date, gen: int, text: str) -> None:
+    """gen — поколение, прочитанное до выборки данных."""
+    key = (schema, user_id, start, end)
+    _cache[key] = (gen, today, text)
+    _cache.move_to_end(key)
+    while len(_cache) > REPORT_CACHE_SIZE:
+        _cache.popitem(last=False)
+    metrics.set_gauge("report_cache_size", len(_cache))
@@ -0,0 +1,150 @@
+# app/routers/admin.py
+from __future__ import annotations
+
+import calendar
+import time
+from datetime import date
+from html import escape
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, profiler
+from app.broadcast import get_broadcaster
+from app.logs import suppressed
+from app.scheduler import local_today
+from app.timesheet import generate as generate_timesheet
+from app.middlewares.auth import ADMIN_ID
+from db.backup import run_backup
+from db.settings_repo import SettingsRepo
+
+router = Router(name="admin")
+# Все команды роутера — только для администратора
+router.message.filter(F.from_user.id == ADMIN_ID)
+
+
+@router.message(Command("backup"))
+async def cmd_backup(message: Message):
+    status = await message.answer("Бэкап запущен…")
+    try:
+        result = await run_backup()
+    except Exception as e:
+        await status.edit_text(f"Бэкап не удался: {escape(str(e))}")
+        return
+    await status.edit_text(
+        f"Бэкап готов: <code>{escape(result.path)}</code>\n"
+        f"{result.pages} стр., {result.size / 1024 / 1024:.1f} МБ, {result.duration:.1f} с"
+    )
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    snap = metrics.snapshot()
+    if not snap:
+        await message.answer("Метрик пока нет.")
+        return
+    lines = [f"{name}: {value:g}" for name, value in sorted(snap.items())]
+    await message.answer(f"<pre>{escape(chr(10).join(lines))}</pre>")
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject):
+    """
+    /profile [секунды] — сэмплирующий профиль event loop'а (по умолчанию 10 с, максимум 60).
+    """
+    if profiler.is_running():
+        await message.answer("Профилирование уже идёт.")
+        return
+    try:
+        seconds = float(command.args) if command.args else 10.0
+    except ValueError:
+        await message.answer("Использование: /profile [секунды]")
+        return
+    status = await message.answer(f"Профилирую {min(seconds, profiler.MAX_SECONDS):g} с…")
+    result = await profiler.profile_loop(seconds)
+    await status.edit_text(f"<pre>{escape(result.summary())}</pre>")
+    await message.answer_document(
+        BufferedInputFile(result.collapsed().encode("utf-8"), filename="profile.collapsed.txt"),
+        caption="collapsed stacks (flamegraph.pl / speedscope)",
+    )
+
+
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message):
+    """
+    /broadcast <текст> — сообщение всем пользователям; форматирование сохраняется.
+    Прогресс — в одном статусном сообщении, которое бот правит по ходу.
+    """
+    parts = (message.html_text or "").split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer("Использование: /broadcast &lt;текст&gt;")
+        return
+    status = await message.answer("Рассылка: подготовка…")
+    await get_broadcaster().start(parts[1], message.chat.id, status.message_id)
+
+
+@router.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message, command: CommandObject):
+    try:
+        broadcast_id = int(command.args or "")
+    except ValueError:
+        await message.answer("Использование: /broadcast_cancel &lt;номер&gt;")
+        return
+    if await get_broadcaster().cancel(broadcast_id):
+        await message.answer(f"Рассылка #{broadcast_id} будет остановлена.")
+    else:
+        await message.answer(f"Рассылка #{broadcast_id} не идёт.")
+
+
+def _parse_month(arg: str | None, today: date) -> tuple[date, date] | None:
+    """«MM.YYYY» или «YYYY-MM»; без аргумента — месяц локальной даты today."""
+    if not arg:
+        year, month = today.year, today.month
+    else:
+        arg = arg.strip()
+        try:
+            if "." in arg:
+                month, year = (int(x) for x in arg.split("."))
+            else:
+                year, month = (int(x) for x in arg.split("-"))
+            date(year, month, 1)
+        except ValueError:
+            return None
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+@router.message(Command("timesheet"))
+async def cmd_timesheet(message: Message, command: CommandObject, db_session: AsyncSession):
+    """
+    /timesheet [MM.YYYY] — табель всех пользователей за месяц одним zip (отчёты + summary.csv).
+    """
+    today = local_today(await SettingsRepo(db_session).get_timezone(message.from_user.id))
+    period = _parse_month(command.args, today)
+    if period is None:
+        await message.answer("Использование: /timesheet [MM.YYYY]")
+        return
+    start, end = period
+    title = f"Табель за {start.strftime('%m.%Y')}"
+    status = await message.answer(f"{title}: собираю данные…")
+    started = time.monotonic()
+    last_edit = 0.0
+
+    async def progress(done: int, total: int) -> None:
+        nonlocal last_edit
+        now = time.monotonic()
+        if done < total and now - last_edit < 1.0:
+            return
+        last_edit = now
+        # прогресс не важнее самого табеля
+        with suppressed("timesheet_progress"):
+            await status.edit_text(f"{title}: {done}/{total} пользователей ({done * 100 // max(total, 1)}%)")
+
+    try:
+        sheet = await generate_timesheet(db_session, start, end, today, progress)
+    except Exception as e:
+        await status.edit_text(f"{title}: не удалось — {escape(str(e))}")
+        raise
+    await message.answer_document(BufferedInputFile(sheet.data, filename=sheet.filename))
+    await status.edit_text(f"{title}: готово, {sheet.users} пользователей, {time.monotonic() - started:.1f} с")
@@ -3,7 +3,6 @@ from __future__ import annotations
 
 import re
 from typing import Optional
-from datetime import datetime
 
 from aiogram import Router, F, Bot
 from aiogram.filters import Command
@@ -15,14 +14,18 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from zoneinfo import ZoneInfo
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from db.middleware import after_commit
 from db.settings_repo import SettingsRepo
 from db.users_repo import UsersRepo
+from db.activity import get_activity_tracker
 from db.models import UserSettings
+from app.logs import suppressed
 from app.scheduler import (
     schedule_user_reminder,
     remove_user_reminder,
     schedule_kb_expire,
     cancel_kb_expire,
+    local_today,
 )
 
 router = Router(name="settings")
@@ -99,17 +102,23 @@ def _kb(us: Optional[UserSettings]) -> InlineKeyboardMarkup:
 
 
 async def _ensure_user(session: AsyncSession, tg_id: int, username: str | None) -> None:
-    # поддержим логику UsersRepo (создаст/обновит пользователя)
-    await UsersRepo(session).upsert_user(tg_id=tg_id, username=username)
+    # строка users — сразу (её читают рассылки, табель, напоминания);
+    # last_seen/username — пачкой при ближайшем сбросе трекера активности
+    await UsersRepo(session).ensure(tg_id, username)
+    get_activity_tracker().touch(tg_id, username)
 
 
 async def _send_settings_and_arm_timer(message: Message, repo: SettingsRepo, state: FSMContext) -> None:
     """
     Отправить новое сообщение "Настройки:" с актуальной инлайн-клавиатурой и поставить авто-скрытие на 60 секунд.
+    Отправка — после commit апдейта (get_or_create мог создать строку настроек).
     """
-    tg_id = message.from_user.id
-    us = await repo.get_or_create(tg_id)
-    msg = await message.answer("Настройки:", reply_markup=_kb(us))
+    us = await repo.get_or_create(message.from_user.id)
+    after_commit(repo.session, _show_settings, message, _kb(us), state)
+
+
+async def _show_settings(message: Message, kb: InlineKeyboardMarkup, state: FSMContext) -> None:
+    msg = await message.answer("Настройки:", reply_markup=kb)
     # Сохраняем link на сообщение с клавиатурой для /cancel
     await state.update_data(kb_chat=msg.chat.id, kb_msg=msg.message_id)
     # Планируем автоскрытие через 60 сек
@@ -120,23 +129,11 @@ async def _hide_kb_now(bot: Bot, chat_id: int, message_id: int) -> None:
     """
     Мгновенно скрыть инлайн-клавиатуру у сообщения + отменить таймер авто-скрытия.
     """
-    try:
+    with suppressed("settings_kb_cancel"):
         cancel_kb_expire(chat_id, message_id)
-    except Exception:
-        pass
-    try:
-        await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
-    except Exception:
+    with suppressed("settings_kb_hide"):
         # сообщение уже удалено или клавиатура спрятана — игнорируем
-        pass
-
-
-def _today_in_tz(tz_name: str) -> datetime.date:
-    try:
-        tz = ZoneInfo(tz_name)
-    except Exception:
-        tz = ZoneInfo("Europe/Warsaw")
-    return datetime.now(tz).date()
+        await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
 
 
 # ====== /settings ======
@@ -196,8 +193,7 @@ async def on_start_input(message: Message, state: FSMContext, db_session: AsyncS
     # получим таймзону пользователя, чтобы сравнить с локальным «сегодня»
     repo = SettingsRepo(db_session)
     tg_id = message.from_user.id
-    us = await repo.get_or_create(tg_id)
-    today_tz = _today_in_tz(us.timezone or "Europe/Warsaw")
+    today_tz = local_today(await repo.get_timezone(tg_id))
     if provided_date > today_tz:
         await message.answer(
             f"Дата не может быть в будущем. Сегодня: {today_tz.strftime('%d.%m.%Y')}. /cancel"
@@ -208,10 +204,11 @@ async def on_start_input(message: Message, state: FSMContext, db_session: AsyncS
     worked_minutes = hours * 60 + mins
     baseline_date_iso = provided_date.isoformat()
 
-    us = await repo.set_baseline(tg_id, baseline_date_iso, worked_minutes)
+    await repo.set_baseline(tg_id, baseline_date_iso, worked_minutes)
 
-    await message.answer(
-        f"Сохранил начальную точку: {provided_date.strftime('%d.%m.%Y')}, {_fmt_hhmm(worked_minutes)}"
+    after_commit(
+        db_session, message.answer,
+        f"Сохранил начальную точку: {provided_date.strftime('%d.%m.%Y')}, {_fmt_hhmm(worked_minutes)}",
     )
 
     # Новое сообщение с клавиатурой + таймер 60с
@@ -262,12 +259,13 @@ async def on_reminder_input(message: Message, state: FSMContext, db_session: Asy
         minutes = int(m.group(1)) * 60 + int(m.group(2))
 
     us = await repo.set_reminder_minutes(tg_id, minutes)
+    # задача планировщика и ответ — только для закоммиченной настройки
     if minutes > 0:
-        schedule_user_reminder(tg_id, minutes, us.timezone)
-        await message.answer(f"Сохранил время напоминания: {_fmt_hhmm(minutes)}")
+        after_commit(db_session, schedule_user_reminder, tg_id, minutes, us.timezone)
+        after_commit(db_session, message.answer, f"Сохранил время напоминания: {_fmt_hhmm(minutes)}")
     else:
-        remove_user_reminder(tg_id)
-        await message.answer("Выключил напоминание.")
+        after_commit(db_session, remove_user_reminder, tg_id)
+        after_commit(db_session, message.answer, "Выключил напоминание.")
 
     # Новое сообщение с клавиатурой + таймер 60с
     await _send_settings_and_arm_timer(message, repo, state)
@@ -306,9 +304,9 @@ async def on_timezone_input(message: Message, state: FSMContext, db_session: Asy
 
     # если есть активное напоминание — пересоздадим с новой TZ
     if us.reminder_minutes > 0:
-        schedule_user_reminder(tg_id, us.reminder_minutes, us.timezone)
+        after_commit(db_session, schedule_user_reminder, tg_id, us.reminder_minutes, us.timezone)
 
-    await message.answer(f"Сохранил таймзону: {text}")
+    after_commit(db_session, message.answer, f"Сохранил таймзону: {text}")
     await _send_settings_and_arm_timer(message, repo, state)
     await state.clear()
 
@@ -320,13 +318,9 @@ async def cmd_cancel(message: Message, state: FSMContext, bot: Bot):
     kb_chat = data.get("kb_chat")
     kb_msg = data.get("kb_msg")
     if kb_chat and kb_msg:
-        try:
+        with suppressed("cancel_kb_cancel"):
             cancel_kb_expire(kb_chat, kb_msg)
-        except Exception:
-            pass
-        try:
+        with suppressed("cancel_kb_hide"):
             await bot.edit_message_reply_markup(chat_id=kb_chat, message_id=kb_msg, reply_markup=None)
-        except Exception:
-            pass
     await state.clear()
     await message.answer("Отменено.")
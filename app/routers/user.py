@@ -6,6 +6,7 @@ from aiogram.fsm.context import FSMContext
 
 # UsersRepo инжектится через middleware (data["users_repo"])
 from db.users_repo import UsersRepo
+from db.middleware import after_commit
 
 router = Router(name="user_router")
 
@@ -38,10 +39,12 @@ async def save_user_id(
     user = await users_repo.upsert_user(tg_id=tg_id, username=None)
     await state.clear()
 
-    await message.answer(
+    # ответ — после commit апдейта (db/middleware.py)
+    after_commit(
+        users_repo.session, message.answer,
         f"Сохранил пользователя:\n"
         f"• tg_id: <code>{user.tg_id}</code>\n"
-        f"• id в базе: <code>{user.id}</code>"
+        f"• id в базе: <code>{user.id}</code>",
     )
 
 
@@ -1,104 +1,489 @@
 # app/scheduler.py
 from __future__ import annotations
-from typing import Optional
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-from aiogram import Bot
+
+from app.logs import suppressed
+from app.tenants import bot_ids, current_bot_id, get_bot, use_bot
+
+log = logging.getLogger("app.scheduler")
 
 _scheduler: Optional[AsyncIOScheduler] = None
-_bot: Optional[Bot] = None
 
-def setup_scheduler(bot: Bot) -> AsyncIOScheduler:
-    global _scheduler, _bot
-    _bot = bot
+def setup_scheduler(paused: bool = False) -> AsyncIOScheduler:
+    """
+    Один планировщик на все боты процесса: задачи несут bot_id в аргументах.
+    paused=True — задачи копятся в jobstore, но не исполняются
+    (симуляция с виртуальными часами, tools/sim_scheduler.py).
+    """
+    global _scheduler
     _scheduler = AsyncIOScheduler(timezone="UTC")
-    _scheduler.start()
+    _scheduler.start(paused=paused)
     return _scheduler
 
 def get_scheduler() -> AsyncIOScheduler:
     assert _scheduler is not None, "Scheduler is not initialized. Call setup_scheduler() first."
     return _scheduler
 
+# ===== часы =====
+# Всё «сейчас» модуля берётся отсюда: симуляция подменяет часы на виртуальные.
+def _wall_clock() -> datetime:
+    return datetime.now(tz=timezone.utc)
+
+_clock: Callable[[], datetime] = _wall_clock
+
+def set_clock(clock: Optional[Callable[[], datetime]]) -> None:
+    global _clock
+    _clock = clock or _wall_clock
+
+def now_utc() -> datetime:
+    return _clock()
+
 # ===== reminders (пн–сб) =====
-async def send_reminder(tg_id: int) -> None:
+# Напоминания, сработавшие в одно окно, доставляем пачкой:
+# один запрос «у кого уже есть запись на локальное сегодня» + один запрос шаблонов.
+REMINDER_BATCH_WINDOW = 1.0  # секунды
+REMINDER_BATCH_RETRIES = int(os.getenv("REMINDER_BATCH_RETRIES", "3"))  # повторов пачки при ошибке БД
+
+_reminder_batch: Dict[Tuple[int, int], str] = {}   # (bot_id, tg_id) -> timezone
+_batch_retries: Dict[Tuple[int, int], int] = {}    # (bot_id, tg_id) -> сколько раз пачка уже падала
+_batch_task: Optional[asyncio.Task] = None
+_batch_tasks: Set[asyncio.Task] = set()            # ссылки на работающие пачки, пока не завершатся
+
+async def send_reminder(tg_id: int, tz: str = "Europe/Warsaw", bot_id: Optional[int] = None) -> None:
     """
     Вместо текста «Напоминание…» отправляем единое сервисное сообщение
     «Укажите время работы:» с инлайн-клавиатурой (последние 4 шаблона)
     и автоскрытием клавиатуры через 60 секунд.
+    Сама отправка откладывается на REMINDER_BATCH_WINDOW и идёт пачкой.
     """
-    assert _bot is not None, "Bot is not set"
+    _reminder_batch[(current_bot_id() if bot_id is None else bot_id, tg_id)] = tz
+    if _batch_task is None:
+        _start_batch()
+
+def _start_batch() -> None:
+    global _batch_task
+    _batch_task = asyncio.create_task(_deliver_reminders_after_window())
+    _batch_tasks.add(_batch_task)
+    _batch_task.add_done_callback(_batch_done)
+
+def _batch_done(task: asyncio.Task) -> None:
+    _batch_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("reminder batch task failed", exc_info=task.exception())
+
+def _requeue_batch(bot_id: int, batch: Dict[int, str]) -> None:
+    """Пачка не прочиталась из БД, никому ещё не отправлено: повторить в следующем окне."""
+    from app import metrics
+
+    for tg_id, tz in batch.items():
+        key = (bot_id, tg_id)
+        tries = _batch_retries.get(key, 0) + 1
+        if tries > REMINDER_BATCH_RETRIES:
+            _batch_retries.pop(key, None)
+            metrics.inc("reminders_failed")
+            continue
+        _batch_retries[key] = tries
+        _reminder_batch.setdefault(key, tz)
+    if _reminder_batch and _batch_task is None:
+        _start_batch()
+
+async def _deliver_reminders_after_window() -> None:
+    global _batch_task
+    await asyncio.sleep(REMINDER_BATCH_WINDOW)
+    per_bot: Dict[int, Dict[int, str]] = {}
+    for (bot_id, tg_id), tz in _reminder_batch.items():
+        per_bot.setdefault(bot_id, {})[tg_id] = tz
+    _reminder_batch.clear()
+    _batch_task = None
+    for bot_id, batch in per_bot.items():
+        # контекст задачи планировщика случаен — бот и схема задаются явно
+        with use_bot(bot_id):
+            try:
+                await _deliver_reminders(batch)
+            except Exception:
+                log.exception("reminder batch of bot %s failed", bot_id)
+
+def local_today(tz: str) -> date:
+    """«Сегодня» в часовом поясе пользователя (некорректный пояс — Europe/Warsaw)."""
+    try:
+        zone = ZoneInfo(tz)
+    except Exception:
+        zone = ZoneInfo("Europe/Warsaw")
+    return now_utc().astimezone(zone).date()
+
+def _local_today_iso(tz: str) -> str:
+    return local_today(tz).isoformat()
+
+async def _deliver_reminders(batch: Dict[int, str]) -> None:
+    bot = get_bot()
 
-    # Берём последние шаблоны пользователя и собираем клавиатуру
     from db.base import session_factory
     from db.work_repo import WorkRepo
     from app.kb import build_work_kb
+    from app import metrics
+
+    bot_id = current_bot_id()
+    local_dates = {tg_id: _local_today_iso(tz) for tg_id, tz in batch.items()}
+    Session = session_factory()
+    try:
+        async with Session() as session:
+            wr = WorkRepo(session)
+            already_logged = await wr.users_with_entry_on(local_dates)
+            recipients = [tg_id for tg_id in batch if tg_id not in already_logged]
+            templates = await wr.get_templates_bulk(recipients)
+    except Exception:
+        log.exception("reminder batch of bot %s: %d users requeued", bot_id, len(batch))
+        _requeue_batch(bot_id, batch)
+        return
+    for tg_id in batch:
+        _batch_retries.pop((bot_id, tg_id), None)
+
+    metrics.inc("reminders_suppressed", len(already_logged))
+    unreachable: Dict[str, list] = {}
+    for tg_id in recipients:
+        try:
+            msg = await bot.send_message(
+                chat_id=tg_id,
+                text="Укажите время работы:",
+                reply_markup=build_work_kb(templates.get(tg_id, []), include_help=True)
+            )
+        except Exception as e:
+            # один неудачный адресат не должен срывать всю пачку
+            reason = classify_send_error(e)
+            if reason is None:
+                log.warning("reminder to %s failed: %r", tg_id, e)
+                metrics.inc("reminders_failed")
+            else:
+                unreachable.setdefault(reason, []).append(tg_id)
+            continue
+        metrics.inc("reminders_sent")
+        # автоскрытие клавиатуры через 60 секунд
+        schedule_kb_expire(msg.chat.id, msg.message_id, seconds=60)
+
+    if unreachable:
+        await _pause_reminders(unreachable)
+
+# ===== пауза напоминаний недоступным пользователям =====
+# Заблокировал бота / удалил аккаунт — дальше слать бессмысленно: ставим паузу
+# в user_settings и снимаем задачу. Первое сообщение пользователя паузу снимает.
+_PERMANENT_SEND_ERRORS = (
+    ("chat not found", "chat_not_found"),
+    ("user is deactivated", "deactivated"),
+    ("bot was blocked", "blocked"),
+)
+
+def classify_send_error(e: Exception) -> Optional[str]:
+    """
+    Причина паузы для постоянной ошибки отправки; None — временная (сеть, лимиты, 5xx).
+    """
+    from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+    text = str(e).lower()
+    if isinstance(e, (TelegramForbiddenError, TelegramBadRequest)):
+        for marker, reason in _PERMANENT_SEND_ERRORS:
+            if marker in text:
+                return reason
+        if isinstance(e, TelegramForbiddenError):
+            return "blocked"
+    return None
+
+async def _pause_reminders(unreachable: Dict[str, list]) -> None:
+    from db.base import session_factory
+    from db.settings_repo import SettingsRepo
+    from app import metrics
 
     Session = session_factory()
     async with Session() as session:
-        wr = WorkRepo(session)
-        templates = await wr.get_templates(tg_id)
+        repo = SettingsRepo(session)
+        for reason, ids in unreachable.items():
+            await repo.pause_reminders(ids, reason)
+        await session.commit()
+    bot_id = current_bot_id()
+    for reason, ids in unreachable.items():
+        metrics.inc(f"reminders_paused_{reason}", len(ids))
+        log.info("reminders paused for %d users of bot %s: %s", len(ids), bot_id, reason)
+        for tg_id in ids:
+            remove_user_reminder(tg_id, bot_id)
+            _known_active.pop((bot_id, tg_id), None)
+
+async def count_paused() -> int:
+    """Пауз напоминаний во всех ботах — по БД: снимают их апдейты на любом инстансе."""
+    from db.base import session_factory
+    from db.settings_repo import SettingsRepo
+
+    paused = 0
+    for bot_id in bot_ids() or [current_bot_id()]:
+        with use_bot(bot_id):
+            Session = session_factory()
+            async with Session() as session:
+                paused += await SettingsRepo(session).count_paused_reminders()
+    return paused
+
+async def count_skipped_reminders() -> None:
+    """Раз в день (пн–сб): каждая пауза — одна несостоявшаяся отправка."""
+    from app import metrics
+    paused = await count_paused()
+    metrics.set_gauge("reminders_paused_users", paused)
+    metrics.inc("reminders_skipped", paused)
+
+# (bot_id, user_id) -> monotonic-время проверки: у этих паузы точно нет, в БД не ходим.
+# TTL ограничивает устаревание, если паузу поставил другой инстанс (владелец планировщика).
+RESUME_CHECK_TTL = float(os.getenv("RESUME_CHECK_TTL", "600"))
+_known_active: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+
+async def resume_reminders_if_paused(session: Any, user_id: int) -> None:
+    """
+    Вызывается на каждое сообщение/нажатие: пользователь снова доступен.
+    Запрос в БД — не чаще раза в RESUME_CHECK_TTL на пользователя.
+    """
+    from db.settings_repo import SettingsRepo
+
+    key = (current_bot_id(), user_id)
+    now = time.monotonic()
+    while _known_active:
+        oldest_key, checked = next(iter(_known_active.items()))
+        if now - checked < RESUME_CHECK_TTL:
+            break
+        del _known_active[oldest_key]
+    if key in _known_active:
+        return
+    row = await SettingsRepo(session).resume_reminders(user_id)
+    if row is None:
+        _known_active[key] = now
+        return
+    # снятая пауза ещё не закоммичена: при откате апдейта задача не должна остаться
+    from db.middleware import after_commit
+    after_commit(session, _resumed, key, now, row)
 
-    msg = await _bot.send_message(
-        chat_id=tg_id,
-        text="Укажите время работы:",
-        reply_markup=build_work_kb(templates, include_help=True)
-    )
-    # автоскрытие клавиатуры через 60 секунд
-    schedule_kb_expire(msg.chat.id, msg.message_id, seconds=60)
+def _resumed(key: Tuple[int, int], checked: float, row: Any) -> None:
+    from app import metrics
 
-def _rem_job_id(user_id: int) -> str:
-    return f"reminder:{user_id}"
+    _known_active[key] = checked
+    metrics.inc("reminders_resumed")
+    schedule_user_reminder(row.user_id, row.reminder_minutes, row.timezone, key[0])
 
-def schedule_user_reminder(user_id: int, minutes: int, tz: str) -> None:
+def _rem_job_id(bot_id: int, user_id: int) -> str:
+    return f"reminder:{bot_id}:{user_id}"
+
+def schedule_user_reminder(user_id: int, minutes: int, tz: str, bot_id: Optional[int] = None) -> None:
+    bot_id = current_bot_id() if bot_id is None else bot_id
+    if not _is_owner:
+        _forward("reminder", {"user_id": user_id, "minutes": minutes, "tz": tz, "bot_id": bot_id})
+        return
     sched = get_scheduler()
-    try:
-        sched.remove_job(job_id=_rem_job_id(user_id))
-    except Exception:
-        pass
+    with suppressed("reminder_replace", ignore=(JobLookupError,)):
+        sched.remove_job(job_id=_rem_job_id(bot_id, user_id))
     if minutes <= 0:
         return
     hour = minutes // 60
     minute = minutes % 60
     trigger = CronTrigger(day_of_week="mon-sat", hour=hour, minute=minute, timezone=ZoneInfo(tz))
-    sched.add_job(send_reminder, trigger=trigger, id=_rem_job_id(user_id), args=[user_id], replace_existing=True)
+    sched.add_job(send_reminder, trigger=trigger, id=_rem_job_id(bot_id, user_id), args=[user_id, tz, bot_id],
+                  replace_existing=True)
 
-def remove_user_reminder(user_id: int) -> None:
+def remove_user_reminder(user_id: int, bot_id: Optional[int] = None) -> None:
+    bot_id = current_bot_id() if bot_id is None else bot_id
+    if not _is_owner:
+        _forward("reminder_off", {"user_id": user_id, "bot_id": bot_id})
+        return
     sched = get_scheduler()
+    with suppressed("reminder_remove", ignore=(JobLookupError,)):
+        sched.remove_job(job_id=_rem_job_id(bot_id, user_id))
+
+async def restore_reminders() -> int:
+    """
+    Поднять все напоминания из БД всех ботов (вызывается у владельца планировщика).
+    """
+    from db.base import session_factory
+    from db.settings_repo import SettingsRepo
+
+    from app import metrics
+
+    n = 0
+    for bot_id in bot_ids() or [current_bot_id()]:
+        with use_bot(bot_id):
+            Session = session_factory()
+            async with Session() as session:
+                async for row in SettingsRepo(session).iter_reminders():
+                    schedule_user_reminder(row.user_id, row.reminder_minutes, row.timezone, bot_id)
+                    n += 1
+    metrics.set_gauge("reminders_paused_users", await count_paused())
+    return n
+
+# ===== обслуживание (только у владельца планировщика) =====
+async def archive_closed_years() -> int:
+    """
+    Перенести закрытые годы work_entries в work_archive (см. db/archive_repo.py).
+    Каждый год — отдельная транзакция.
+    """
+    from db.base import session_factory
+    from db.archive_repo import ArchiveRepo, archive_cutoff
+
+    cutoff = archive_cutoff(now_utc().year)  # архивируем годы < cutoff
+    moved = 0
+    for bot_id in bot_ids() or [current_bot_id()]:
+        with use_bot(bot_id):
+            Session = session_factory()
+            async with Session() as session:
+                first = await ArchiveRepo(session).oldest_live_year()
+            if first is None:
+                continue
+            for year in range(first, cutoff):
+                async with Session() as session:
+                    n = await ArchiveRepo(session).archive_year(year)
+                    await session.commit()
+                if n:
+                    log.info("archived %d work_entries of %d (bot %s)", n, year, bot_id)
+                moved += n
+    return moved
+
+async def reconcile_balances() -> int:
+    """
+    Сверить накопленные балансы с полным пересчётом (SettingsRepo.verify_balance)
+    и исправить разошедшиеся или незаполненные. Пользователь — отдельная короткая транзакция.
+    """
+    from db.base import session_factory
+    from db.settings_repo import SettingsRepo
+    from app import metrics
+
+    fixed = 0
+    for bot_id in bot_ids() or [current_bot_id()]:
+        with use_bot(bot_id):
+            Session = session_factory()
+            async with Session() as session:
+                users = await SettingsRepo(session).balance_users()
+            for user_id, baseline_date in users:
+                async with Session() as session:
+                    repo = SettingsRepo(session)
+                    if await repo.verify_balance(user_id):
+                        continue
+                    await repo.recompute_balance(user_id, baseline_date)
+                    await session.commit()
+                log.warning("balance of user %s (bot %s) drifted or missing, recomputed", user_id, bot_id)
+                fixed += 1
+    metrics.inc("balances_recomputed", fixed)
+    return fixed
+
+BACKUP_SCHEDULE_HOUR = os.getenv("BACKUP_SCHEDULE_HOUR")  # UTC-час ежедневного бэкапа; пусто = выкл
+
+async def scheduled_backup() -> None:
+    from db.backup import run_backup
     try:
-        sched.remove_job(job_id=_rem_job_id(user_id))
+        await run_backup()
     except Exception:
-        pass
+        log.exception("scheduled backup failed")
+
+def schedule_maintenance() -> None:
+    sched = get_scheduler()
+    sched.add_job(archive_closed_years, trigger=CronTrigger(month=1, day=2, hour=3, minute=30),
+                  id="maintenance:archive", replace_existing=True)
+    sched.add_job(count_skipped_reminders, trigger=CronTrigger(day_of_week="mon-sat", hour=23, minute=59),
+                  id="maintenance:skipped", replace_existing=True)
+    sched.add_job(reconcile_balances, trigger=CronTrigger(day_of_week="sun", hour=4, minute=0),
+                  id="maintenance:balances", replace_existing=True)
+    if BACKUP_SCHEDULE_HOUR:
+        sched.add_job(scheduled_backup, trigger=CronTrigger(hour=int(BACKUP_SCHEDULE_HOUR), minute=0),
+                      id="maintenance:backup", replace_existing=True)
 
 # ===== авто-скрытие инлайн-клавиатур =====
-def _kb_expire_job_id(chat_id: int, message_id: int) -> str:
-    return f"expire:{chat_id}:{message_id}"
+def _kb_expire_job_id(bot_id: int, chat_id: int, message_id: int) -> str:
+    return f"expire:{bot_id}:{chat_id}:{message_id}"
 
-async def _hide_kb(chat_id: int, message_id: int) -> None:
-    assert _bot is not None
-    try:
-        await _bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
-    except Exception:
+async def _hide_kb(chat_id: int, message_id: int, bot_id: Optional[int] = None) -> None:
+    with suppressed("kb_expire_hide"):
         # сообщение могло быть удалено/уже без клавиатуры — игнор
-        pass
+        await get_bot(bot_id).edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=None)
 
 def schedule_kb_expire(chat_id: int, message_id: int, seconds: int = 60) -> None:
+    run_at = now_utc() + timedelta(seconds=seconds)
+    _schedule_kb_expire_at(chat_id, message_id, run_at, current_bot_id())
+
+def _schedule_kb_expire_at(chat_id: int, message_id: int, run_at: datetime, bot_id: int) -> None:
+    if not _is_owner:
+        # время абсолютное: задержка пересылки не продлевает жизнь клавиатуры
+        _forward("kb_expire", {"chat_id": chat_id, "message_id": message_id, "run_at": run_at.timestamp(),
+                               "bot_id": bot_id})
+        return
     sched = get_scheduler()
     # На всякий случай удалим существующий
-    try:
-        sched.remove_job(job_id=_kb_expire_job_id(chat_id, message_id))
-    except Exception:
-        pass
-    run_at = datetime.now(tz=timezone.utc) + timedelta(seconds=seconds)
+    with suppressed("kb_expire_replace", ignore=(JobLookupError,)):
+        sched.remove_job(job_id=_kb_expire_job_id(bot_id, chat_id, message_id))
     trigger = DateTrigger(run_date=run_at)
-    sched.add_job(_hide_kb, trigger=trigger, id=_kb_expire_job_id(chat_id, message_id),
-                  args=[chat_id, message_id], replace_existing=True)
+    sched.add_job(_hide_kb, trigger=trigger, id=_kb_expire_job_id(bot_id, chat_id, message_id),
+                  args=[chat_id, message_id, bot_id], replace_existing=True)
 
-def cancel_kb_expire(chat_id: int, message_id: int) -> None:
+def cancel_kb_expire(chat_id: int, message_id: int, bot_id: Optional[int] = None) -> None:
+    bot_id = current_bot_id() if bot_id is None else bot_id
+    if not _is_owner:
+        _forward("kb_cancel", {"chat_id": chat_id, "message_id": message_id, "bot_id": bot_id})
+        return
     sched = get_scheduler()
-    try:
-        sched.remove_job(job_id=_kb_expire_job_id(chat_id, message_id))
-    except Exception:
-        pass
+    with suppressed("kb_expire_cancel", ignore=(JobLookupError,)):
+        sched.remove_job(job_id=_kb_expire_job_id(bot_id, chat_id, message_id))
+
+def pending_kb_expiries() -> List[Dict[str, Any]]:
+    """
+    Неисполненные таймеры скрытия клавиатур в виде заявок kb_expire —
+    уходящий владелец передаёт их следующему через scheduler_requests.
+    """
+    if _scheduler is None:
+        return []
+    pending = []
+    for job in _scheduler.get_jobs():
+        if job.id.startswith("expire:") and job.next_run_time is not None:
+            chat_id, message_id, bot_id = job.args
+            pending.append({"chat_id": chat_id, "message_id": message_id,
+                            "run_at": job.next_run_time.timestamp(), "bot_id": bot_id})
+    return pending
+
+# ===== владение планировщиком (несколько инстансов, см. app/lease.py) =====
+# По умолчанию инстанс — владелец (один процесс работает как раньше).
+# Не-владелец не держит задачи у себя, а пересылает заявки владельцу через БД.
+_is_owner: bool = True
+_forwarder: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+def is_owner() -> bool:
+    return _is_owner
+
+def set_owner(owner: bool, forwarder: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> None:
+    global _is_owner, _forwarder
+    _is_owner = owner
+    _forwarder = forwarder
+    if not owner and _scheduler is not None:
+        _scheduler.remove_all_jobs()
+
+def _forward(kind: str, payload: Dict[str, Any]) -> None:
+    assert _forwarder is not None, "Scheduler forwarder is not set"
+    _forwarder(kind, payload)
+
+def apply_request(kind: str, payload: Dict[str, Any]) -> None:
+    """
+    Выполнить у владельца заявку, пересланную не-лидером.
+    Заявки без bot_id (от старых версий) относятся к боту по умолчанию.
+    """
+    bot_id = payload.get("bot_id")
+    if bot_id is None:
+        bot_id = current_bot_id()
+    if kind == "reminder":
+        schedule_user_reminder(payload["user_id"], payload["minutes"], payload["tz"], bot_id)
+    elif kind == "reminder_off":
+        remove_user_reminder(payload["user_id"], bot_id)
+    elif kind == "kb_expire":
+        # просроченное — скрываем сразу, иначе APScheduler сочтёт задачу пропущенной
+        run_at = max(datetime.fromtimestamp(payload["run_at"], tz=timezone.utc), now_utc())
+        _schedule_kb_expire_at(payload["chat_id"], payload["message_id"], run_at, bot_id)
+    elif kind == "kb_cancel":
+        cancel_kb_expire(payload["chat_id"], payload["message_id"], bot_id)
+    else:
+        log.warning("unknown scheduler request %r", kind)
@@ -0,0 +1,74 @@
+# app/tenants.py
+"""
+Боты процесса (BOT_TOKENS): реестр Bot по id и контекст «текущего бота».
+Первый токен — бот по умолчанию (основная схема БД, прежние данные);
+остальные получают свою схему bot_<id> (db/tenant.py).
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from aiogram import Bot
+
+from db.base import use_schema
+from db.tenant import register_schema
+
+_bots: Dict[int, Bot] = {}
+_default_id: Optional[int] = None
+_current: ContextVar[Optional[int]] = ContextVar("bot_id", default=None)
+
+
+def parse_tokens(raw: str) -> List[str]:
+    return [t.strip() for t in raw.replace("\n", ",").split(",") if t.strip()]
+
+
+def schema_of(bot_id: int) -> Optional[str]:
+    return None if _default_id is None or bot_id == _default_id else f"bot_{bot_id}"
+
+
+def is_default(bot_id: int) -> bool:
+    return schema_of(bot_id) is None
+
+
+async def register_bots(bots: Iterable[Bot]) -> None:
+    """
+    Запомнить ботов и подключить схемы данных для всех, кроме первого.
+    """
+    global _default_id
+    for bot in bots:
+        if _default_id is None:
+            _default_id = bot.id
+        _bots[bot.id] = bot
+        schema = schema_of(bot.id)
+        if schema is not None:
+            await register_schema(schema)
+
+
+def get_bot(bot_id: Optional[int] = None) -> Bot:
+    bot = _bots.get(current_bot_id() if bot_id is None else bot_id)
+    assert bot is not None, f"Bot {bot_id} is not registered. Call register_bots() first."
+    return bot
+
+
+def bot_ids() -> List[int]:
+    return list(_bots)
+
+
+def current_bot_id() -> int:
+    bot_id = _current.get()
+    if bot_id is not None:
+        return bot_id
+    return _default_id or 0
+
+
+@contextmanager
+def use_bot(bot_id: int) -> Iterator[None]:
+    """Всё внутри — от имени бота bot_id: его Bot и его схема БД."""
+    token = _current.set(bot_id)
+    try:
+        with use_schema(schema_of(bot_id)):
+            yield
+    finally:
+        _current.reset(token)
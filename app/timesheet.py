@@ -0,0 +1,157 @@
+# app/timesheet.py
+"""
+Табель всей команды за месяц (/timesheet у администратора).
+Данные — одним запросом по всем пользователям (+ выходные и архив закрытых лет),
+отчёты и сводка рендерятся в пуле процессов, результат — один zip:
+по текстовому отчёту на пользователя (как /report) и summary.csv.
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Tuple
+
+from app.handlers import _format_report_rows
+from app.norms import fmt_signed, norm_minutes
+from app.parse import fmt_hhmm
+from db.archive_repo import ArchiveRepo, Entry
+from db.work_repo import WorkRepo
+
+TIMESHEET_WORKERS = int(os.getenv("TIMESHEET_WORKERS", "2"))    # процессов рендера
+TIMESHEET_CHUNK = int(os.getenv("TIMESHEET_CHUNK", "50"))       # пользователей на одну задачу воркера
+
+SUMMARY_HEADER = ("tg_id", "username", "days", "worked", "norm", "overtime", "days_off")
+
+
+class UserSheet(NamedTuple):
+    tg_id: int
+    username: Optional[str]
+    rows: List[Entry]
+    days_off: List[str]
+
+
+class Rendered(NamedTuple):
+    filename: str
+    text: str
+    summary: Tuple
+
+
+class Timesheet(NamedTuple):
+    filename: str
+    data: bytes
+    users: int
+
+
+async def collect(session, start: date, end: date) -> List[UserSheet]:
+    """Записи всех пользователей за период: один запрос по work_entries, без цикла по пользователям."""
+    repo = WorkRepo(session)
+    team = await repo.team_entries(start, end)
+    days_off = await repo.team_days_off(start, end)
+    archived = await ArchiveRepo(session).fetch_range_all(start, end)
+
+    sheets: List[UserSheet] = []
+    for tg_id, username, iso, s, e, b in team:
+        if not sheets or sheets[-1].tg_id != tg_id:
+            sheets.append(UserSheet(tg_id, username, [], days_off.get(tg_id, [])))
+        if iso is not None:
+            sheets[-1].rows.append((iso, s, e, b))
+    for sheet in sheets:
+        old = archived.get(sheet.tg_id)
+        if old:
+            # живая запись приоритетнее архивной (как в _fetch_entries)
+            merged = {r[0]: r for r in old}
+            merged.update((r[0], r) for r in sheet.rows)
+            sheet.rows[:] = [merged[k] for k in sorted(merged)]
+    return sheets
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", text).strip("_")
+
+
+# ===== выполняется в процессах пула: только чистые функции с простыми аргументами =====
+def render_chunk(sheets: List[UserSheet], start: date, end: date, upto: date) -> List[Rendered]:
+    out: List[Rendered] = []
+    period = f"{start.strftime('%d.%m.%Y')}–{end.strftime('%d.%m.%Y')}"
+    upto_iso = upto.isoformat()
+    for sheet in sheets:
+        body, total_min = _format_report_rows(sheet.rows)
+        name = f"@{sheet.username}" if sheet.username else str(sheet.tg_id)
+        text = f"{name} ({sheet.tg_id}), {period}\n\n{body}\n\nИтого: {fmt_hhmm(total_min)}"
+        norm = overtime = 0
+        if upto >= start:
+            norm = norm_minutes(start, upto, [date.fromisoformat(d) for d in sheet.days_off if d <= upto_iso])
+            worked = sum(e - s - b for iso, s, e, b in sheet.rows if iso <= upto_iso)
+            overtime = worked - norm
+            label = "Норма" if upto == end else f"Норма по {upto.strftime('%d.%m.%Y')}"
+            text += f"\n{label}: {fmt_hhmm(norm)}\nПереработка: {fmt_signed(overtime)}"
+        filename = f"{sheet.tg_id}_{_safe_name(sheet.username)}.txt" if sheet.username else f"{sheet.tg_id}.txt"
+        out.append(Rendered(filename, text, (
+            sheet.tg_id, sheet.username or "", len(sheet.rows), fmt_hhmm(total_min),
+            fmt_hhmm(norm), fmt_signed(overtime), len(sheet.days_off),
+        )))
+    return out
+
+
+def build_archive(rendered: List[Rendered]) -> bytes:
+    summary = io.StringIO()
+    writer = csv.writer(summary)
+    writer.writerow(SUMMARY_HEADER)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for item in rendered:
+            zf.writestr(f"users/{item.filename}", item.text)
+            writer.writerow(item.summary)
+        # BOM — чтобы Excel открыл кириллицу и знаки без мастера импорта
+        zf.writestr("summary.csv", "\ufeff" + summary.getvalue())
+    return buf.getvalue()
+
+
+# ===== пул =====
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=TIMESHEET_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def generate(session, start: date, end: date, today: date,
+                   progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> Timesheet:
+    """
+    Собрать табель. today — локальная дата администратора: по неё считается норма текущего месяца.
+    progress(готово, всего) вызывается по мере готовности пачек пользователей.
+    """
+    sheets = await collect(session, start, end)
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    upto = min(end, today)
+    futures = [
+        loop.run_in_executor(pool, render_chunk, sheets[i:i + TIMESHEET_CHUNK], start, end, upto)
+        for i in range(0, len(sheets), TIMESHEET_CHUNK)
+    ]
+    done = 0
+    for fut in asyncio.as_completed(futures):
+        done += len(await fut)
+        if progress is not None:
+            await progress(done, len(sheets))
+    # порядок пользователей в архиве — по tg_id, независимо от порядка готовности
+    rendered = [item for fut in futures for item in fut.result()]
+    data = await loop.run_in_executor(pool, build_archive, rendered)
+    filename = f"timesheet-{start.strftime('%Y-%m')}.zip"
+    return Timesheet(filename, data, len(sheets))
@@ -0,0 +1,127 @@
+# db/activity.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import insert, select, update
+
+from db.base import current_schema, session_factory, use_schema
+from db.models import User
+
+log = logging.getLogger("db.activity")
+
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "30"))
+
+
+def _as_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite отдаёт naive-время (CURRENT_TIMESTAMP в UTC)
+    if dt is None or dt.tzinfo is not None:
+        return dt
+    return dt.replace(tzinfo=timezone.utc)
+
+
+class ActivityTracker:
+    """
+    Копит в памяти last_seen/username по tg_id и раз в interval секунд
+    пишет в users одной пачкой. Пишутся только реально изменившиеся строки:
+    сменился username или last_seen сдвинулся больше, чем на interval.
+    Один трекер на процесс: касания раскладываются по схеме бота (db/tenant.py).
+    """
+
+    def __init__(self, interval: float = ACTIVITY_FLUSH_SECONDS):
+        self.interval = interval
+        self._pending: Dict[Optional[str], Dict[int, Tuple[Optional[str], datetime]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, tg_id: int, username: Optional[str]) -> None:
+        self._pending.setdefault(current_schema(), {})[tg_id] = (username, datetime.now(timezone.utc))
+
+    async def flush(self) -> int:
+        """Сбросить накопленное в БД. Возвращает число записанных строк."""
+        pending, self._pending = self._pending, {}
+        n = 0
+        try:
+            for schema in list(pending):
+                with use_schema(schema):
+                    n += await self._flush_batch(pending[schema])
+                del pending[schema]
+        finally:
+            # незаписанное (ошибка БД, гонка с upsert_user за users.tg_id, отмена) — обратно в очередь
+            self._requeue(pending)
+        return n
+
+    def _requeue(self, pending: Dict[Optional[str], Dict[int, Tuple[Optional[str], datetime]]]) -> None:
+        for schema, batch in pending.items():
+            current = self._pending.setdefault(schema, {})
+            for tg_id, item in batch.items():
+                # касание, пришедшее за время записи, новее возвращаемого
+                newer = current.get(tg_id)
+                if newer is None or newer[1] < item[1]:
+                    current[tg_id] = item
+
+    async def _flush_batch(self, batch: Dict[int, Tuple[Optional[str], datetime]]) -> int:
+        min_gap = timedelta(seconds=self.interval)
+
+        Session = session_factory()
+        async with Session() as session:
+            res = await session.execute(
+                select(User.id, User.tg_id, User.username, User.last_seen).where(User.tg_id.in_(list(batch)))
+            )
+            existing = {row.tg_id: row for row in res}
+
+            inserts = []
+            updates = []
+            for tg_id, (username, seen) in batch.items():
+                row = existing.get(tg_id)
+                if row is None:
+                    inserts.append({"tg_id": tg_id, "username": username, "first_seen": seen, "last_seen": seen})
+                    continue
+                last_seen = _as_utc(row.last_seen)
+                if row.username == username and last_seen is not None and seen - last_seen < min_gap:
+                    continue
+                updates.append({"id": row.id, "username": username, "last_seen": seen})
+
+            if inserts:
+                await session.execute(insert(User), inserts)
+            if updates:
+                # ORM bulk UPDATE по первичному ключу — один executemany
+                await session.execute(update(User), updates)
+            await session.commit()
+        return len(inserts) + len(updates)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("activity flush failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+_tracker: Optional[ActivityTracker] = None
+
+
+def setup_activity_tracker(interval: float = ACTIVITY_FLUSH_SECONDS) -> ActivityTracker:
+    global _tracker
+    _tracker = ActivityTracker(interval)
+    _tracker.start()
+    return _tracker
+
+
+def get_activity_tracker() -> ActivityTracker:
+    assert _tracker is not None, "Activity tracker is not initialized. Call setup_activity_tracker() first."
+    return _tracker
@@ -0,0 +1,188 @@
+# db/archive_repo.py
+from __future__ import annotations
+import os
+import sys
+from array import array
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.base import dialect_insert
+from db.models import UserSettings, WorkArchive, WorkEntry, WorkMonthTotal
+
+# сколько закрытых лет оставлять «живыми»; увеличивать — только вернув уже упакованные годы,
+# иначе правки в них пройдут мимо архива (WorkRepo._unarchive проверяет только годы < cutoff)
+ARCHIVE_KEEP_YEARS = int(os.getenv("ARCHIVE_KEEP_YEARS", "1"))
+
+EMPTY = 0xFFFF
+_FIELDS = 3  # start_min, end_min, break_min
+
+Entry = Tuple[str, int, int, int]  # (work_date_iso, start_min, end_min, break_min)
+
+def archive_cutoff(current_year: int) -> int:
+    """Годы < cutoff уходят в архив (app/scheduler.py, archive_closed_years), остальные всегда живые."""
+    return current_year - ARCHIVE_KEEP_YEARS
+
+def _new_days() -> array:
+    return array("H", [EMPTY]) * (366 * _FIELDS)
+
+def pack_days(days: array) -> bytes:
+    # в БД всегда little-endian, независимо от платформы
+    if sys.byteorder == "big":
+        days = array("H", days)
+        days.byteswap()
+    return days.tobytes()
+
+def unpack_days(blob: bytes) -> array:
+    days = array("H")
+    days.frombytes(blob)
+    if sys.byteorder == "big":
+        days.byteswap()
+    return days
+
+def _put(days: array, year: int, iso: str, start_min: int, end_min: int, break_min: int) -> None:
+    i = (date.fromisoformat(iso) - date(year, 1, 1)).days * _FIELDS
+    days[i], days[i + 1], days[i + 2] = start_min, end_min, break_min
+
+def iter_days(year: int, days: array, start: date, end: date) -> List[Entry]:
+    """Записи года в пределах [start, end] по возрастанию даты."""
+    first = date(year, 1, 1)
+    lo = max((start - first).days, 0)
+    hi = min((end - first).days, (date(year, 12, 31) - first).days)
+    out: List[Entry] = []
+    for d in range(lo, hi + 1):
+        i = d * _FIELDS
+        if days[i] != EMPTY:
+            out.append(((first + timedelta(days=d)).isoformat(), days[i], days[i + 1], days[i + 2]))
+    return out
+
+class ArchiveRepo:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def fetch_range(self, user_id: int, start: date, end: date) -> List[Entry]:
+        res = await self.session.execute(
+            select(WorkArchive.year, WorkArchive.days)
+            .where(WorkArchive.user_id == user_id, WorkArchive.year.between(start.year, end.year))
+            .order_by(WorkArchive.year)
+        )
+        out: List[Entry] = []
+        for year, blob in res.fetchall():
+            out.extend(iter_days(year, unpack_days(blob), start, end))
+        return out
+
+    async def fetch_range_all(self, start: date, end: date) -> Dict[int, List[Entry]]:
+        """fetch_range сразу для всех пользователей: user_id -> записи периода."""
+        res = await self.session.execute(
+            select(WorkArchive.user_id, WorkArchive.year, WorkArchive.days)
+            .where(WorkArchive.year.between(start.year, end.year))
+            .order_by(WorkArchive.user_id, WorkArchive.year)
+        )
+        out: Dict[int, List[Entry]] = {}
+        for user_id, year, blob in res.fetchall():
+            out.setdefault(user_id, []).extend(iter_days(year, unpack_days(blob), start, end))
+        return out
+
+    async def restore_year(self, user_id: int, year: int) -> int:
+        """
+        Вернуть закрытый год пользователя в work_entries — перед правкой даты этого года.
+        Строка work_archive и итоги месяцев удаляются; год снова уйдёт в архив
+        при следующем archive_closed_years. Возвращает число возвращённых записей.
+        """
+        res = await self.session.execute(
+            delete(WorkArchive).where(WorkArchive.user_id == user_id, WorkArchive.year == year)
+            .returning(WorkArchive.days)
+            .execution_options(synchronize_session=False)
+        )
+        blob = res.scalar_one_or_none()
+        if blob is None:
+            return 0
+        entries = iter_days(year, unpack_days(blob), date(year, 1, 1), date(year, 12, 31))
+        if entries:
+            now = UserSettings.now_iso()
+            stmt = dialect_insert(self.session, WorkEntry)
+            # живая запись того же дня приоритетнее архивной
+            await self.session.execute(
+                stmt.on_conflict_do_nothing(index_elements=[WorkEntry.user_id, WorkEntry.work_date]),
+                [{"user_id": user_id, "work_date": iso, "start_min": s, "end_min": e, "break_min": b,
+                  "updated_at": now} for iso, s, e, b in entries],
+            )
+        await self.session.execute(
+            delete(WorkMonthTotal)
+            .where(WorkMonthTotal.user_id == user_id, WorkMonthTotal.month.between(f"{year}-01", f"{year}-12"))
+            .execution_options(synchronize_session=False)
+        )
+        return len(entries)
+
+    async def oldest_live_year(self) -> int | None:
+        res = await self.session.execute(select(func.min(WorkEntry.work_date)))
+        first = res.scalar_one_or_none()
+        return int(first[:4]) if first else None
+
+    async def archive_year(self, year: int) -> int:
+        """
+        Переносит все записи года из work_entries в work_archive (сливая с уже
+        заархивированным), пересчитывает work_month_totals и удаляет перенесённое.
+        Возвращает число перенесённых записей.
+        """
+        lo, hi = f"{year}-01-01", f"{year}-12-31"
+        res = await self.session.execute(
+            select(WorkEntry.user_id, WorkEntry.work_date, WorkEntry.start_min, WorkEntry.end_min, WorkEntry.break_min)
+            .where(WorkEntry.work_date.between(lo, hi))
+        )
+        per_user: Dict[int, List[Entry]] = {}
+        moved = 0
+        for uid, iso, s, e, b in res.fetchall():
+            per_user.setdefault(uid, []).append((iso, s, e, b))
+            moved += 1
+        if not per_user:
+            return 0
+
+        # пользователи года — подзапросом, а не списком параметров (лимит переменных SQLite)
+        res = await self.session.execute(
+            select(WorkArchive.user_id, WorkArchive.days)
+            .where(WorkArchive.year == year,
+                   WorkArchive.user_id.in_(select(WorkEntry.user_id).where(WorkEntry.work_date.between(lo, hi))))
+        )
+        existing = {uid: unpack_days(blob) for uid, blob in res.fetchall()}
+
+        archive_rows = []
+        total_rows = []
+        for uid, entries in per_user.items():
+            days = existing.get(uid) or _new_days()
+            for iso, s, e, b in entries:
+                _put(days, year, iso, s, e, b)
+            archive_rows.append({"user_id": uid, "year": year, "days": pack_days(days)})
+            totals: Dict[str, List[int]] = {}
+            for iso, s, e, b in iter_days(year, days, date(year, 1, 1), date(year, 12, 31)):
+                t = totals.setdefault(iso[:7], [0, 0])
+                t[0] += e - s - b
+                t[1] += 1
+            total_rows.extend(
+                {"user_id": uid, "month": m, "worked_min": w, "days": n} for m, (w, n) in totals.items()
+            )
+
+        stmt = dialect_insert(self.session, WorkArchive)
+        await self.session.execute(
+            stmt.on_conflict_do_update(index_elements=[WorkArchive.user_id, WorkArchive.year],
+                                       set_={"days": stmt.excluded.days}),
+            archive_rows,
+        )
+        stmt = dialect_insert(self.session, WorkMonthTotal)
+        await self.session.execute(
+            stmt.on_conflict_do_update(index_elements=[WorkMonthTotal.user_id, WorkMonthTotal.month],
+                                       set_={"worked_min": stmt.excluded.worked_min, "days": stmt.excluded.days}),
+            total_rows,
+        )
+        # отчёты по данным не меняются, но источник другой — поколение для кэша (app/report_cache.py)
+        await self.session.execute(
+            update(UserSettings)
+            .where(UserSettings.user_id.in_(select(WorkEntry.user_id).where(WorkEntry.work_date.between(lo, hi))))
+            .values(report_gen=UserSettings.report_gen + 1)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.execute(
+            delete(WorkEntry).where(WorkEntry.work_date.between(lo, hi))
+            .execution_options(synchronize_session=False)
+        )
+        return moved
@@ -0,0 +1,180 @@
+# db/backup.py
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from app import metrics
+from db import base
+from db.tenant import attached_files
+
+log = logging.getLogger("db.backup")
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))                 # сколько последних копий хранить
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "1") not in ("", "0", "false", "False")
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "256"))             # страниц за шаг online backup API
+BACKUP_SLEEP = float(os.getenv("BACKUP_SLEEP", "0.005"))         # пауза между шагами, сек
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))  # перезапусков online backup до VACUUM INTO
+
+_PREFIX = "bot-"
+
+
+@dataclass
+class BackupResult:
+    path: str
+    size: int
+    pages: int
+    duration: float
+
+
+_lock = asyncio.Lock()
+
+
+def sqlite_path(url: Optional[str] = None) -> Optional[str]:
+    """
+    Путь к файлу SQLite для текущего engine (None — не SQLite или база в памяти).
+    """
+    if url is None:
+        if base.engine is None:
+            return None
+        parsed = base.engine.url
+    else:
+        parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or not parsed.database or parsed.database == ":memory:":
+        return None
+    return os.path.abspath(parsed.database)
+
+
+class _Restarted(Exception):
+    """Online backup перезапускался чаще BACKUP_MAX_RESTARTS раз."""
+
+
+def _progress_tracker():
+    """
+    progress для online backup: гейдж прогресса и счёт перезапусков. Коммит бота через своё
+    соединение начинает копирование заново — remaining снова растёт.
+    """
+    last = None
+    restarts = 0
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        # вызывается из потока бэкапа между шагами
+        nonlocal last, restarts
+        if last is not None and remaining > last:
+            restarts += 1
+            metrics.inc("backup_restarts")
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _Restarted()
+        last = remaining
+        if total:
+            metrics.set_gauge("backup_progress", round(1 - remaining / total, 3))
+
+    return progress
+
+
+def _backup_sync(src_path: str, dst_path: str) -> int:
+    """
+    Online backup API: копирует по BACKUP_PAGES страниц, отпуская базу между шагами,
+    поэтому обработчики и планировщик не блокируются (WAL-запись продолжается).
+    Запись в базу перезапускает копирование; под постоянной нагрузкой (напоминания,
+    трекер активности) большая база может не докопироваться никогда — после
+    BACKUP_MAX_RESTARTS перезапусков копия снимается через VACUUM INTO: одно чтение
+    из снимка, писатели WAL не ждут.
+    """
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(dst_path)
+    try:
+        try:
+            src.backup(dst, pages=BACKUP_PAGES, progress=_progress_tracker(), sleep=BACKUP_SLEEP)
+        except _Restarted:
+            dst.close()
+            os.remove(dst_path)
+            log.warning("online backup of %s keeps restarting, falling back to VACUUM INTO", src_path)
+            metrics.inc("backup_vacuum_into")
+            src.execute("VACUUM INTO ?", (dst_path,))
+            dst = sqlite3.connect(dst_path)
+        pages = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    metrics.set_gauge("backup_progress", 1.0)
+    return pages
+
+
+def _compress_sync(path: str) -> str:
+    gz_path = path + ".gz"
+    with open(path, "rb") as f_in, gzip.open(gz_path, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out, length=1024 * 1024)
+    os.remove(path)
+    return gz_path
+
+
+def _rotate(directory: str, keep: int) -> None:
+    # копия = все файлы одного штампа (основная база + базы ботов, см. db/tenant.py)
+    files = sorted(f for f in os.listdir(directory) if f.startswith(_PREFIX))
+    stamps = sorted({f[len(_PREFIX):len(_PREFIX) + 15] for f in files})
+    old = set(stamps[:-keep]) if keep > 0 else set()
+    for name in (f for f in files if f[len(_PREFIX):len(_PREFIX) + 15] in old):
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            log.warning("cannot remove old backup %s", name)
+
+
+async def run_backup(directory: str = BACKUP_DIR, compress: bool = BACKUP_COMPRESS) -> BackupResult:
+    """
+    Снять копию живой базы в фоне (отдельный поток), с ротацией и сжатием.
+    Базы остальных ботов (ATTACH, db/tenant.py) копируются с тем же штампом;
+    path/size/pages в результате — по основной базе и суммарно.
+    Одновременно выполняется не больше одного бэкапа.
+    """
+    src_path = sqlite_path()
+    if src_path is None:
+        raise RuntimeError("Online backup is supported only for file-based SQLite")
+
+    async with _lock:
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        sources = [("", src_path)] + [(f".{schema}", path) for schema, path in attached_files().items()]
+
+        started = time.perf_counter()
+        metrics.set_gauge("backup_progress", 0.0)
+        pages = 0
+        size = 0
+        main_path = ""
+        for suffix, src in sources:
+            dst_path = os.path.join(directory, f"{_PREFIX}{stamp}{suffix}.sqlite3")
+            tmp_path = dst_path + ".part"
+            try:
+                pages += await asyncio.to_thread(_backup_sync, src, tmp_path)
+                os.replace(tmp_path, dst_path)
+                if compress:
+                    dst_path = await asyncio.to_thread(_compress_sync, dst_path)
+            except Exception:
+                metrics.inc("backup_failed")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            size += os.path.getsize(dst_path)
+            main_path = main_path or dst_path
+        dst_path = main_path
+        duration = time.perf_counter() - started
+        await asyncio.to_thread(_rotate, directory, BACKUP_KEEP)
+
+        metrics.inc("backup_done")
+        metrics.set_gauge("backup_last_duration_sec", round(duration, 3))
+        metrics.set_gauge("backup_last_size_bytes", size)
+        metrics.set_gauge("backup_last_ts", time.time())
+        log.info("backup %s: %d pages, %d bytes, %.2fs", dst_path, pages, size, duration)
+        return BackupResult(path=dst_path, size=size, pages=pages, duration=duration)
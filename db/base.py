@@ -1,6 +1,13 @@
 # bot/db/base.py
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from db.query_stats import install_query_stats
 
 class Base(DeclarativeBase):
     pass
@@ -8,23 +15,76 @@ class Base(DeclarativeBase):
 engine: AsyncEngine | None = None
 SessionLocal: async_sessionmaker[AsyncSession] | None = None
 
+# Схема данных текущего бота (несколько токенов в процессе, см. db/tenant.py).
+# None — основная схема, как у единственного бота.
+_schema: ContextVar[Optional[str]] = ContextVar("db_schema", default=None)
+_tenant_sessions: Dict[str, async_sessionmaker[AsyncSession]] = {}
+
+def current_schema() -> Optional[str]:
+    return _schema.get()
+
+@contextmanager
+def use_schema(schema: Optional[str]) -> Iterator[None]:
+    token = _schema.set(schema)
+    try:
+        yield
+    finally:
+        _schema.reset(token)
+
+def _engine_kwargs(db_url: str) -> Dict[str, Any]:
+    """
+    Параметры пула под диалект. SQLite — файл/память, пул по умолчанию;
+    PostgreSQL (asyncpg) — настраиваемый пул соединений.
+    """
+    if db_url.startswith("postgresql"):
+        return {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            "pool_pre_ping": True,
+            "connect_args": {"server_settings": {"application_name": "tgbot"}},
+        }
+    return {}
+
+def _sqlite_on_connect(dbapi_conn, connection_record) -> None:
+    # PRAGMA foreign_keys действует на соединение, а не на базу
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
 async def init_db(db_url: str = "sqlite+aiosqlite:///./bot.sqlite3") -> None:
     global engine, SessionLocal
     engine = create_async_engine(
         db_url,
         echo=False,
         future=True,
+        **_engine_kwargs(db_url),
     )
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _sqlite_on_connect)
+    install_query_stats(engine)
     SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
 async def create_tables() -> None:
     from . import models  # noqa
     async with engine.begin() as conn:  # type: ignore[arg-type]
         await conn.run_sync(Base.metadata.create_all)
-        await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
-        await conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+        if conn.dialect.name == "sqlite":
+            await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+def dialect_insert(session: AsyncSession, table: Any):
+    """
+    INSERT с поддержкой on_conflict_do_update для текущего диалекта (SQLite/PostgreSQL).
+    """
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
 
-# Утилита-синглтон для выдачи сессии
+# Утилита-синглтон для выдачи сессии (с учётом схемы текущего бота)
 def session_factory() -> async_sessionmaker[AsyncSession]:
     assert SessionLocal is not None, "DB is not initialized. Call init_db() first."
-    return SessionLocal
+    schema = _schema.get()
+    if schema is None:
+        return SessionLocal
+    return _tenant_sessions[schema]
@@ -0,0 +1,95 @@
+# db/broadcast_repo.py
+from __future__ import annotations
+import time
+from typing import List, NamedTuple, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Broadcast, User
+
+class BroadcastRow(NamedTuple):
+    id: int
+    text: str
+    status: str
+    cursor_tg_id: int
+    total: int
+    delivered: int
+    failed: int
+    status_chat_id: int
+    status_message_id: int
+
+_COLUMNS = (
+    Broadcast.id, Broadcast.text, Broadcast.status, Broadcast.cursor_tg_id, Broadcast.total,
+    Broadcast.delivered, Broadcast.failed, Broadcast.status_chat_id, Broadcast.status_message_id,
+)
+
+class BroadcastRepo:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create(self, text: str, status_chat_id: int, status_message_id: int, owner: str) -> int:
+        """Новая рассылка сразу закреплена за owner; total — число получателей на момент старта."""
+        total = (await self.session.execute(select(func.count()).select_from(User))).scalar_one()
+        now = time.time()
+        bc = Broadcast(
+            text=text, status="running", cursor_tg_id=0, total=total, delivered=0, failed=0,
+            status_chat_id=status_chat_id, status_message_id=status_message_id,
+            owner=owner, heartbeat_at=now, created_at=now,
+        )
+        self.session.add(bc)
+        await self.session.flush()
+        return bc.id
+
+    async def get(self, broadcast_id: int) -> Optional[BroadcastRow]:
+        res = await self.session.execute(select(*_COLUMNS).where(Broadcast.id == broadcast_id))
+        row = res.first()
+        return BroadcastRow(*row) if row is not None else None
+
+    async def running_ids(self) -> List[int]:
+        res = await self.session.execute(
+            select(Broadcast.id).where(Broadcast.status == "running").order_by(Broadcast.id)
+        )
+        return list(res.scalars())
+
+    async def claim(self, broadcast_id: int, owner: str, stale_before: float) -> bool:
+        """
+        Забрать идущую рассылку, если её владелец не подаёт признаков жизни с stale_before.
+        """
+        res = await self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running",
+                   Broadcast.heartbeat_at < stale_before)
+            .values(owner=owner, heartbeat_at=time.time())
+            .execution_options(synchronize_session=False)
+        )
+        return res.rowcount == 1
+
+    async def recipients(self, after_tg_id: int, limit: int) -> List[int]:
+        """Следующая пачка получателей: keyset по уникальному индексу users.tg_id, без OFFSET."""
+        res = await self.session.execute(
+            select(User.tg_id).where(User.tg_id > after_tg_id).order_by(User.tg_id).limit(limit)
+        )
+        return list(res.scalars())
+
+    async def checkpoint(self, broadcast_id: int, owner: str, cursor_tg_id: int,
+                         delivered: int, failed: int, heartbeat_at: Optional[float] = None) -> bool:
+        """
+        Сохранить прогресс. False — рассылку отменили или перехватил другой инстанс.
+        heartbeat_at=0 отпускает рассылку: её сразу подхватит следующий запуск.
+        """
+        res = await self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.owner == owner, Broadcast.status == "running")
+            .values(cursor_tg_id=cursor_tg_id, delivered=delivered, failed=failed,
+                    heartbeat_at=time.time() if heartbeat_at is None else heartbeat_at)
+            .execution_options(synchronize_session=False)
+        )
+        return res.rowcount == 1
+
+    async def finish(self, broadcast_id: int, status: str) -> bool:
+        res = await self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        return res.rowcount == 1
@@ -0,0 +1,65 @@
+# db/handoff_repo.py
+from __future__ import annotations
+import json
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Handoff
+
+class HandoffRepo:
+    """Строки handoffs; таблица общая — работать вне use_bot (основная схема)."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def request(self, requested_by: str, now: float) -> int:
+        row = Handoff(state="requested", requested_by=requested_by, requested_at=now)
+        self.session.add(row)
+        await self.session.flush()
+        return row.id
+
+    async def claim_request(self, owner: str, not_before: float) -> Optional[int]:
+        """
+        Взять чужую свежую заявку на передачу (requested -> draining).
+        Из нескольких старых инстансов заявку получит только один.
+        """
+        res = await self.session.execute(
+            select(Handoff.id)
+            .where(Handoff.state == "requested", Handoff.requested_by != owner,
+                   Handoff.requested_at >= not_before)
+            .order_by(Handoff.id)
+            .limit(1)
+        )
+        handoff_id = res.scalar_one_or_none()
+        if handoff_id is None:
+            return None
+        res = await self.session.execute(
+            update(Handoff)
+            .where(Handoff.id == handoff_id, Handoff.state == "requested")
+            .values(state="draining", released_by=owner)
+            .execution_options(synchronize_session=False)
+        )
+        return handoff_id if res.rowcount == 1 else None
+
+    async def release(self, handoff_id: int, payload: Dict[str, Any], now: float) -> None:
+        await self.session.execute(
+            update(Handoff)
+            .where(Handoff.id == handoff_id, Handoff.state == "draining")
+            .values(state="released", released_at=now, payload=json.dumps(payload))
+            .execution_options(synchronize_session=False)
+        )
+
+    async def get(self, handoff_id: int) -> Tuple[str, Optional[Dict[str, Any]]]:
+        res = await self.session.execute(
+            select(Handoff.state, Handoff.payload).where(Handoff.id == handoff_id)
+        )
+        state, payload = res.one()
+        return state, json.loads(payload) if payload else None
+
+    async def finish(self, handoff_id: int, state: str) -> None:
+        await self.session.execute(
+            update(Handoff)
+            .where(Handoff.id == handoff_id)
+            .values(state=state)
+            .execution_options(synchronize_session=False)
+        )
@@ -0,0 +1,61 @@
+# db/lease_repo.py
+from __future__ import annotations
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.base import dialect_insert
+from db.models import SchedulerLease, SchedulerRequest
+
+class LeaseRepo:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def try_acquire(self, name: str, owner: str, ttl: float, now: float) -> bool:
+        """
+        Захватить/продлить аренду: получится, если она наша или истекла.
+        """
+        res = await self.session.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == name, or_(SchedulerLease.owner == owner, SchedulerLease.expires_at < now))
+            .values(owner=owner, expires_at=now + ttl)
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount:
+            return True
+        # строки ещё нет — первый вставивший становится владельцем
+        stmt = dialect_insert(self.session, SchedulerLease).values(name=name, owner=owner, expires_at=now + ttl)
+        res = await self.session.execute(stmt.on_conflict_do_nothing(index_elements=[SchedulerLease.name]))
+        return res.rowcount == 1
+
+    async def release(self, name: str, owner: str) -> None:
+        # отпускаем сразу, чтобы другой инстанс подхватил без ожидания TTL
+        await self.session.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == name, SchedulerLease.owner == owner)
+            .values(expires_at=0)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def enqueue_requests(self, items: Iterable[Tuple[str, Dict[str, Any], float]]) -> None:
+        rows = [{"kind": kind, "payload": json.dumps(payload), "created_at": ts} for kind, payload, ts in items]
+        if rows:
+            await self.session.execute(SchedulerRequest.__table__.insert(), rows)
+
+    async def take_requests(self, limit: int = 500) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Забрать заявки по порядку поступления и удалить их (в той же транзакции).
+        """
+        res = await self.session.execute(
+            select(SchedulerRequest.id, SchedulerRequest.kind, SchedulerRequest.payload)
+            .order_by(SchedulerRequest.id)
+            .limit(limit)
+        )
+        rows = res.fetchall()
+        if not rows:
+            return []
+        await self.session.execute(
+            delete(SchedulerRequest).where(SchedulerRequest.id.in_([r[0] for r in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        return [(r[1], json.loads(r[2])) for r in rows]
@@ -1,19 +1,60 @@
 # bot/db/middleware.py
+import inspect
 from aiogram import BaseMiddleware
 from typing import Callable, Dict, Any, Awaitable
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.base import session_factory
 from db.users_repo import UsersRepo
+from db.query_stats import track_update, set_handler, handler_name
+
+def after_commit(session: AsyncSession, call: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+    """
+    Отложить вызов (ответ в Telegram, постановку задачи) до commit апдейта в DbSessionMiddleware:
+    блокировка записи не держится на время сетевого запроса, а неудачная отправка
+    не откатывает данные. При rollback отложенное отбрасывается.
+    """
+    session.info.setdefault("after_commit", []).append((call, args, kwargs))
+
+class QueryStatsMiddleware(BaseMiddleware):
+    """
+    Outer-мидлварь на dp.update: открывает область учёта SQL для апдейта.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        with track_update(getattr(event, "update_id", None)):
+            return await handler(event, data)
 
 class DbSessionMiddleware(BaseMiddleware):
+    """
+    Unit of work на апдейт: репозитории в db/ сами не коммитят (только flush),
+    единственный commit — после успешного завершения обработчика, иначе rollback.
+    Ответы после записи обработчики откладывают через after_commit().
+    """
     async def __call__(
         self,
         handler: Callable[[Dict[str, Any], Any], Awaitable[Any]],
         event: Any,
         data: Dict[str, Any]
     ) -> Any:
+        set_handler(handler_name(data))
         Session = session_factory()
         async with Session() as session:  # type is AsyncSession
             data["db_session"] = session
             data["users_repo"] = UsersRepo(session)
-            return await handler(event, data)
+            try:
+                result = await handler(event, data)
+            except BaseException:
+                session.info.pop("after_commit", None)
+                await session.rollback()
+                raise
+            deferred = session.info.pop("after_commit", ())
+            await session.commit()
+        for call, args, kwargs in deferred:
+            res = call(*args, **kwargs)
+            if inspect.isawaitable(res):
+                await res
+        return result
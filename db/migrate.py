@@ -1,55 +1,68 @@
 # bot/db/migrate.py
-from sqlalchemy import text
-from db.base import session_factory
+from sqlalchemy import inspect, text
+from db.base import Base, current_schema, session_factory
+from db.settings_repo import SettingsRepo
+from db.tenant import qualified
 
 async def ensure_user_settings_columns() -> None:
     """
-    Мягкая миграция SQLite: добьём недостающие колонки в user_settings,
-    не опираясь на глобальный engine.
+    Мягкая миграция (SQLite/PostgreSQL): добьём недостающие колонки в user_settings,
+    не опираясь на глобальный engine. Работает в схеме текущего бота (use_schema).
     """
+    schema = current_schema()
+    table = qualified("user_settings")
     Session = session_factory()
     async with Session() as session:
         async with session.begin():
-            # Узнаём существующие колонки
-            res = await session.execute(text("PRAGMA table_info(user_settings)"))
-            cols = [row[1] for row in res.fetchall()]  # row[1] = имя поля
+            # Узнаём существующие колонки через инспектор — без PRAGMA
+            conn = await session.connection()
+            cols = await conn.run_sync(
+                lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns("user_settings", schema=schema)}
+            )
 
             if "reminder_minutes" not in cols:
                 await session.execute(
-                    text("ALTER TABLE user_settings ADD COLUMN reminder_minutes INTEGER NOT NULL DEFAULT 0")
+                    text(f"ALTER TABLE {table} ADD COLUMN reminder_minutes INTEGER NOT NULL DEFAULT 0")
                 )
 
             if "timezone" not in cols:
                 await session.execute(
-                    text("ALTER TABLE user_settings ADD COLUMN timezone TEXT NOT NULL DEFAULT 'Europe/Warsaw'")
+                    text(f"ALTER TABLE {table} ADD COLUMN timezone TEXT NOT NULL DEFAULT 'Europe/Warsaw'")
+                )
+
+            if "since_baseline_min" not in cols:
+                await session.execute(
+                    text(f"ALTER TABLE {table} ADD COLUMN since_baseline_min INTEGER")
+                )
+                # заполняем сразу: чтение баланса в БД не пишет (см. SettingsRepo.get_balance)
+                repo = SettingsRepo(session)
+                for user_id, baseline_date in await repo.balance_users():
+                    await repo.recompute_balance(user_id, baseline_date)
+
+            if "reminder_paused" not in cols:
+                await session.execute(
+                    text(f"ALTER TABLE {table} ADD COLUMN reminder_paused TEXT")
+                )
+
+            if "report_gen" not in cols:
+                await session.execute(
+                    text(f"ALTER TABLE {table} ADD COLUMN report_gen INTEGER NOT NULL DEFAULT 0")
                 )
 
 
 async def ensure_work_tables() -> None:
     """
-    Создаём таблицы work_entries / work_templates если их нет.
+    Создаём таблицы work_entries / work_templates / work_days_off / broadcasts если их нет
+    (по моделям, для любого диалекта).
     """
+    from db.models import Broadcast, WorkDayOff, WorkEntry, WorkTemplate
+
     Session = session_factory()
     async with Session() as session:
         async with session.begin():
-            await session.execute(text("""
-                CREATE TABLE IF NOT EXISTS work_entries (
-                    user_id INTEGER NOT NULL,
-                    work_date TEXT NOT NULL,
-                    start_min INTEGER NOT NULL,
-                    end_min INTEGER NOT NULL,
-                    break_min INTEGER NOT NULL DEFAULT 0,
-                    updated_at TEXT NOT NULL,
-                    PRIMARY KEY (user_id, work_date)
-                )
-            """))
-            await session.execute(text("""
-                CREATE TABLE IF NOT EXISTS work_templates (
-                    user_id INTEGER NOT NULL,
-                    start_min INTEGER NOT NULL,
-                    end_min INTEGER NOT NULL,
-                    break_min INTEGER NOT NULL DEFAULT 0,
-                    last_used_at TEXT NOT NULL,
-                    PRIMARY KEY (user_id, start_min, end_min, break_min)
-                )
-            """))
+            conn = await session.connection()
+            await conn.run_sync(
+                Base.metadata.create_all,
+                tables=[WorkEntry.__table__, WorkTemplate.__table__, WorkDayOff.__table__, Broadcast.__table__],
+                checkfirst=True,
+            )
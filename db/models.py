@@ -1,6 +1,6 @@
 # bot/db/models.py
 from datetime import datetime
-from sqlalchemy import Integer, BigInteger, String, DateTime, func
+from sqlalchemy import Integer, BigInteger, String, DateTime, Float, Index, LargeBinary, func
 from sqlalchemy.orm import Mapped, mapped_column
 from db.base import Base
 
@@ -20,10 +20,17 @@ class UserSettings(Base):
     updated_at — ISO с точностью до секунд.
     reminder_minutes — минуты с начала суток (0..1439), где 0 = OFF.
     timezone — IANA (например, 'Europe/Warsaw').
+    since_baseline_min — отработано строго после baseline_date; ведётся дельтами
+    из WorkRepo при каждой записи/удалении, NULL = ещё не посчитан (заполняют миграция
+    и reconcile_balances).
+    reminder_paused — причина паузы напоминаний ('blocked', 'chat_not_found', 'deactivated'),
+    NULL = напоминания активны; снимается первым сообщением пользователя.
+    report_gen — поколение данных отчётов: растёт в той же транзакции, что и любая правка
+    записей пользователя (кэш отчётов app/report_cache.py сверяется с ним на каждом чтении).
     """
     __tablename__ = "user_settings"
 
-    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
     baseline_date: Mapped[str] = mapped_column(String, nullable=False)        # YYYY-MM-DD
     baseline_worked_min: Mapped[int] = mapped_column(Integer, nullable=False) # минуты
     updated_at: Mapped[str] = mapped_column(String, nullable=False)           # ISO datetime
@@ -31,7 +38,153 @@ class UserSettings(Base):
     # Новые поля
     reminder_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=0) # 0 = OFF
     timezone: Mapped[str] = mapped_column(String, nullable=False, default="Europe/Warsaw")
+    since_baseline_min: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    reminder_paused: Mapped[str | None] = mapped_column(String, nullable=True)
+    report_gen: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     @staticmethod
     def now_iso() -> str:
         return datetime.utcnow().isoformat(timespec="seconds")
+
+class WorkEntry(Base):
+    """
+    work_entries: одна строка на пользователя и день (work_date — YYYY-MM-DD).
+    updated_at — ISO с точностью до секунд (UTC).
+    """
+    __tablename__ = "work_entries"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    work_date: Mapped[str] = mapped_column(String, primary_key=True)
+    start_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    end_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    break_min: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    updated_at: Mapped[str] = mapped_column(String, nullable=False)
+
+class WorkTemplate(Base):
+    """
+    work_templates: последние использованные интервалы (храним не больше 4 на пользователя).
+    """
+    __tablename__ = "work_templates"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    start_min: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    end_min: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    break_min: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False, default=0, server_default="0")
+    last_used_at: Mapped[str] = mapped_column(String, nullable=False)
+
+class WorkDayOff(Base):
+    """
+    work_days_off: дни, явно отмеченные выходными (не входят в норму).
+    Снимается, если на этот день записано рабочее время.
+    """
+    __tablename__ = "work_days_off"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    off_date: Mapped[str] = mapped_column(String, primary_key=True)
+
+class SchedulerLease(Base):
+    """
+    scheduler_lease: кто из инстансов бота владеет планировщиком.
+    expires_at — epoch-секунды; владелец продлевает аренду heartbeat'ом.
+    """
+    __tablename__ = "scheduler_lease"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(128), nullable=False)
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False)
+
+class SchedulerRequest(Base):
+    """
+    scheduler_requests: заявки от не-лидеров (reminder/kb_expire/...) владельцу планировщика.
+    payload — JSON.
+    """
+    __tablename__ = "scheduler_requests"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    payload: Mapped[str] = mapped_column(String, nullable=False)
+    created_at: Mapped[float] = mapped_column(Float, nullable=False)
+
+class Handoff(Base):
+    """
+    handoffs: передача работы от старого процесса новому при деплое (app/handoff.py).
+    state: requested -> draining -> released -> done | abandoned.
+    payload — JSON: последние update_id по ботам и FSM-состояния. Времена — epoch-секунды.
+    """
+    __tablename__ = "handoffs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    state: Mapped[str] = mapped_column(String(16), nullable=False, default="requested")
+    requested_by: Mapped[str] = mapped_column(String(128), nullable=False)
+    requested_at: Mapped[float] = mapped_column(Float, nullable=False)
+    released_by: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    released_at: Mapped[float | None] = mapped_column(Float, nullable=True)
+    payload: Mapped[str | None] = mapped_column(String, nullable=True)
+
+class OutboxMessage(Base):
+    """
+    outbox: исходящие сообщения, записанные в той же транзакции, что и изменение данных.
+    Доставляет фоновый отправитель (app/outbox.py). idem_key защищает от повторной постановки,
+    status: pending | sent | dead. Времена — epoch-секунды.
+    """
+    __tablename__ = "outbox"
+    __table_args__ = (Index("ix_outbox_pending", "status", "next_attempt_at"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    idem_key: Mapped[str] = mapped_column(String(128), unique=True, nullable=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(String, nullable=False)
+    parse_mode: Mapped[str | None] = mapped_column(String(16), nullable=True)  # None = по умолчанию бота
+    status: Mapped[str] = mapped_column(String(8), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[float] = mapped_column(Float, nullable=False)
+    next_attempt_at: Mapped[float] = mapped_column(Float, nullable=False)
+    locked_by: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    locked_until: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+    sent_at: Mapped[float | None] = mapped_column(Float, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+class Broadcast(Base):
+    """
+    broadcasts: рассылки администратора всем пользователям из users.
+    cursor_tg_id — последний обработанный tg_id (получатели идут по возрастанию tg_id),
+    status: running | done | cancelled. owner/heartbeat_at (epoch) — какой инстанс
+    сейчас шлёт; рассылку с устаревшим heartbeat подхватывает другой или перезапущенный.
+    """
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="running")
+    cursor_tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    delivered: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    status_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status_message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    heartbeat_at: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+    created_at: Mapped[float] = mapped_column(Float, nullable=False)
+
+class WorkArchive(Base):
+    """
+    work_archive: закрытые годы work_entries, одна строка на пользователя и год.
+    days — 366 упакованных записей по 3 x uint16 (start, end, break), 0xFFFF = нет записи
+    (см. db/archive_repo.py).
+    """
+    __tablename__ = "work_archive"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    year: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    days: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+class WorkMonthTotal(Base):
+    """
+    work_month_totals: итоги по месяцам для заархивированных лет (month — YYYY-MM).
+    """
+    __tablename__ = "work_month_totals"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    month: Mapped[str] = mapped_column(String(7), primary_key=True)
+    worked_min: Mapped[int] = mapped_column(Integer, nullable=False)
+    days: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -0,0 +1,103 @@
+# db/outbox_repo.py
+from __future__ import annotations
+import time
+from typing import Iterable, List, NamedTuple, Optional
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.base import current_schema, dialect_insert
+from db.models import OutboxMessage
+
+class OutboxItem(NamedTuple):
+    id: int
+    chat_id: int
+    text: str
+    parse_mode: Optional[str]
+    attempts: int
+
+class OutboxRepo:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def enqueue(self, chat_id: int, text: str, idem_key: str, parse_mode: Optional[str] = None) -> None:
+        """
+        Поставить сообщение в очередь в текущей транзакции. Повтор с тем же idem_key игнорируется.
+        """
+        now = time.time()
+        stmt = dialect_insert(self.session, OutboxMessage).values(
+            idem_key=idem_key, chat_id=chat_id, text=text, parse_mode=parse_mode,
+            status="pending", attempts=0, created_at=now, next_attempt_at=now, locked_until=0,
+        )
+        await self.session.execute(stmt.on_conflict_do_nothing(index_elements=[OutboxMessage.idem_key]))
+        # отправитель схемы проснётся после commit (см. app/outbox.py)
+        self.session.info["outbox_dirty"] = current_schema()
+
+    async def claim(self, owner: str, limit: int, lock_seconds: float = 30.0) -> List[OutboxItem]:
+        """
+        Забрать пачку готовых к отправке сообщений под блокировку owner до now+lock_seconds.
+        Несколько инстансов не получат одни и те же строки.
+        """
+        now = time.time()
+        until = now + lock_seconds
+        due = (
+            select(OutboxMessage.id)
+            .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= now,
+                   OutboxMessage.locked_until < now)
+            .order_by(OutboxMessage.id)
+            .limit(limit)
+        )
+        await self.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(due), OutboxMessage.locked_until < now)
+            .values(locked_by=owner, locked_until=until)
+            .execution_options(synchronize_session=False)
+        )
+        res = await self.session.execute(
+            select(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text,
+                   OutboxMessage.parse_mode, OutboxMessage.attempts)
+            .where(OutboxMessage.locked_by == owner, OutboxMessage.locked_until == until,
+                   OutboxMessage.status == "pending")
+            .order_by(OutboxMessage.id)
+        )
+        return [OutboxItem(*r) for r in res.fetchall()]
+
+    async def mark_sent(self, ids: Iterable[int]) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage).where(OutboxMessage.id.in_(ids))
+            .values(status="sent", sent_at=time.time(), locked_by=None, locked_until=0)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def mark_failed(self, item_id: int, error: str, retry_at: Optional[float]) -> None:
+        """
+        retry_at=None — постоянная ошибка, сообщение больше не отправляем.
+        """
+        values = {"attempts": OutboxMessage.attempts + 1, "last_error": error[:500],
+                  "locked_by": None, "locked_until": 0}
+        if retry_at is None:
+            values["status"] = "dead"
+        else:
+            values["next_attempt_at"] = retry_at
+        await self.session.execute(
+            update(OutboxMessage).where(OutboxMessage.id == item_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def release(self, ids: Iterable[int], retry_at: float) -> None:
+        """Вернуть неотправленные из пачки в очередь без попытки (лимит Telegram, кончилась аренда)."""
+        ids = list(ids)
+        if not ids:
+            return
+        await self.session.execute(
+            update(OutboxMessage).where(OutboxMessage.id.in_(ids))
+            .values(next_attempt_at=retry_at, locked_by=None, locked_until=0)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def purge_sent(self, older_than: float) -> None:
+        await self.session.execute(
+            delete(OutboxMessage).where(OutboxMessage.status == "sent", OutboxMessage.sent_at < older_than)
+            .execution_options(synchronize_session=False)
+        )
@@ -0,0 +1,210 @@
+# db/query_stats.py
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import ORMExecuteState, Session as SyncSession
+
+log = logging.getLogger("db.query_stats")
+
+# Debug-режим: логируем апдейты, вышедшие за бюджет запросов/времени
+SQL_DEBUG = os.getenv("SQL_DEBUG", "0") not in ("", "0", "false", "False")
+SQL_BUDGET_QUERIES = int(os.getenv("SQL_BUDGET_QUERIES", "10"))
+SQL_BUDGET_MS = float(os.getenv("SQL_BUDGET_MS", "50"))
+SQL_BUDGET_ROWS = int(os.getenv("SQL_BUDGET_ROWS", "5000"))   # строк, прочитанных за апдейт
+# Один и тот же запрос столько раз за апдейт — подозрение на N+1
+SQL_NPLUS1_THRESHOLD = int(os.getenv("SQL_NPLUS1_THRESHOLD", "5"))
+
+
+@dataclass
+class QueryStats:
+    """
+    Агрегат по одному апдейту (или по блоку count_queries()).
+    rows — строки, которые вернули SELECT'ы через Session;
+    affected — строки, затронутые INSERT/UPDATE/DELETE (cursor.rowcount).
+    db_time — суммарное время выполнения statement'ов в секундах.
+    """
+    update_id: int | None = None
+    handler: str | None = None
+    queries: int = 0
+    rows: int = 0
+    affected: int = 0
+    commits: int = 0
+    db_time: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    by_handler: Counter = field(default_factory=Counter)
+
+    @property
+    def db_time_ms(self) -> float:
+        return self.db_time * 1000.0
+
+    def suspected_n_plus_one(self, threshold: int = SQL_NPLUS1_THRESHOLD) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def over_budget(self) -> bool:
+        return (self.queries > SQL_BUDGET_QUERIES or self.db_time_ms > SQL_BUDGET_MS
+                or self.rows > SQL_BUDGET_ROWS)
+
+    def summary(self) -> str:
+        return (f"update={self.update_id} handler={self.handler} queries={self.queries} "
+                f"rows={self.rows} affected={self.affected} commits={self.commits} db={self.db_time_ms:.1f}ms")
+
+
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> QueryStats | None:
+    return _current.get()
+
+
+def set_handler(name: str | None) -> None:
+    """Пометить текущий апдейт именем обработчика (вызывается из inner-мидлвари)."""
+    stats = _current.get()
+    if stats is not None:
+        stats.handler = name
+
+
+def _normalize(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+# ===== хуки движка =====
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_time += time.perf_counter() - started
+    stats.statements[_normalize(statement)] += 1
+    stats.by_handler[stats.handler or "-"] += 1
+    # DB-API rowcount — только затронутые строки DML: для SELECT SQLite отдаёт -1,
+    # прочитанные строки считает _count_rows ниже
+    if context.isinsert or context.isupdate or context.isdelete:
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount and rowcount > 0:
+            stats.affected += rowcount
+
+
+@event.listens_for(SyncSession, "do_orm_execute")
+def _count_rows(state: ORMExecuteState):
+    """
+    Прочитанные строки — на уровне результата: он буферизуется (freeze) и отдаётся
+    вызывающему как был. DML с RETURNING и потоковые выборки (session.stream, yield_per)
+    не трогаем и не считаем.
+    """
+    stats = _current.get()
+    if stats is None:
+        return None
+    options = state.execution_options
+    if not state.is_select or options.get("stream_results") or options.get("yield_per"):
+        return None
+    result = state.invoke_statement()
+    frozen = result.freeze()
+    stats.rows += len(frozen.data)
+    return frozen()
+
+
+def _on_commit(conn) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.commits += 1
+
+
+def install_query_stats(engine: AsyncEngine | Engine) -> None:
+    """
+    Вешаем хуки на движок. Для AsyncEngine события слушаются на sync_engine.
+    """
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "commit", _on_commit)
+
+
+def _report(stats: QueryStats) -> None:
+    if not SQL_DEBUG:
+        return
+    if stats.over_budget():
+        log.warning("SQL budget exceeded: %s", stats.summary())
+    for sql, n in stats.suspected_n_plus_one():
+        log.warning("Possible N+1 (%d x) in %s: %s", n, stats.handler, sql[:200])
+
+
+@contextmanager
+def track_update(update_id: int | None) -> Iterator[QueryStats]:
+    """
+    Открывает область учёта запросов для одного апдейта.
+    Все statement'ы, выполненные внутри (в т.ч. в дочерних задачах), попадают в QueryStats.
+    Внутри уже открытой области (count_queries() в тесте) считаем в неё.
+    """
+    outer = _current.get()
+    if outer is not None:
+        if outer.update_id is None:
+            outer.update_id = update_id
+        yield outer
+        return
+    stats = QueryStats(update_id=update_id)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        _report(stats)
+
+
+# ===== хелпер для тестов =====
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    """
+    with count_queries() as qs:
+        await on_text(message)
+    assert qs.queries == 4
+    """
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_queries(expected: int, *, commits: int | None = None, handler: str | None = None) -> Iterator[QueryStats]:
+    """
+    Проверка числа запросов (и, опционально, коммитов) для обработчика.
+    handler — считать только запросы, помеченные этим обработчиком.
+    """
+    with count_queries() as stats:
+        if handler is not None:
+            stats.handler = handler
+        yield stats
+    actual = stats.by_handler[handler] if handler is not None else stats.queries
+    if actual != expected:
+        details = "\n".join(f"  {n} x {sql}" for sql, n in stats.statements.most_common())
+        raise AssertionError(f"expected {expected} queries, got {actual}:\n{details}")
+    if commits is not None and stats.commits != commits:
+        raise AssertionError(f"expected {commits} commits, got {stats.commits}")
+
+
+def handler_name(data: dict[str, Any]) -> str | None:
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    if callback is None:
+        return None
+    return getattr(callback, "__qualname__", repr(callback))
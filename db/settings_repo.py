@@ -1,14 +1,93 @@
 # db/settings_repo.py
-from typing import Optional
-from sqlalchemy import select
+from typing import AsyncIterator, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import UserSettings
+from db.work_repo import WorkRepo
 from datetime import date
 
+DEFAULT_TZ = "Europe/Warsaw"
+
+class ReminderRow(NamedTuple):
+    """Снимок для скана напоминаний: только нужные колонки, без ORM-инструментации."""
+    user_id: int
+    reminder_minutes: int
+    timezone: str
+
 class SettingsRepo:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    # ===== read-only снимки (Core select нужных колонок) =====
+    async def get_timezone(self, user_id: int) -> str:
+        res = await self.session.execute(select(UserSettings.timezone).where(UserSettings.user_id == user_id))
+        return res.scalar_one_or_none() or DEFAULT_TZ
+
+    async def get_report_state(self, user_id: int) -> Tuple[str, Optional[int]]:
+        """
+        (timezone, report_gen) одним запросом для отчёта. report_gen = None — строки настроек нет:
+        правки записей такого пользователя поколение не двигают, кэшировать его отчёты нельзя.
+        """
+        res = await self.session.execute(
+            select(UserSettings.timezone, UserSettings.report_gen).where(UserSettings.user_id == user_id)
+        )
+        row = res.one_or_none()
+        if row is None:
+            return DEFAULT_TZ, None
+        return row.timezone or DEFAULT_TZ, row.report_gen
+
+    async def iter_reminders(self, chunk: int = 1000) -> AsyncIterator[ReminderRow]:
+        """
+        Потоково отдаёт включённые напоминания пачками по chunk строк.
+        """
+        result = await self.session.stream(
+            select(UserSettings.user_id, UserSettings.reminder_minutes, UserSettings.timezone)
+            .where(UserSettings.reminder_minutes > 0, UserSettings.reminder_paused.is_(None))
+            .execution_options(yield_per=chunk)
+        )
+        async for part in result.partitions(chunk):
+            for row in part:
+                yield ReminderRow(row[0], row[1], row[2])
+
+    async def count_paused_reminders(self) -> int:
+        res = await self.session.execute(
+            select(func.count()).select_from(UserSettings)
+            .where(UserSettings.reminder_minutes > 0, UserSettings.reminder_paused.is_not(None))
+        )
+        return int(res.scalar_one())
+
+    # ===== пауза напоминаний недоступным пользователям =====
+    async def pause_reminders(self, user_ids: Iterable[int], reason: str) -> None:
+        ids = list(user_ids)
+        if not ids:
+            return
+        await self.session.execute(
+            update(UserSettings).where(UserSettings.user_id.in_(ids))
+            .values(reminder_paused=reason, updated_at=UserSettings.now_iso())
+            .execution_options(synchronize_session=False)
+        )
+
+    async def resume_reminders(self, user_id: int) -> Optional[ReminderRow]:
+        """
+        Снять паузу, если она есть. Возвращает напоминание для повторной постановки
+        (None — паузы не было или напоминания выключены).
+        """
+        res = await self.session.execute(
+            select(UserSettings.reminder_minutes, UserSettings.timezone, UserSettings.reminder_paused)
+            .where(UserSettings.user_id == user_id)
+        )
+        row = res.one_or_none()
+        if row is None or row.reminder_paused is None:
+            return None
+        await self.session.execute(
+            update(UserSettings).where(UserSettings.user_id == user_id)
+            .values(reminder_paused=None, updated_at=UserSettings.now_iso())
+            .execution_options(synchronize_session=False)
+        )
+        if row.reminder_minutes <= 0:
+            return None
+        return ReminderRow(user_id, row.reminder_minutes, row.timezone)
+
     async def get(self, user_id: int) -> Optional[UserSettings]:
         res = await self.session.execute(select(UserSettings).where(UserSettings.user_id == user_id))
         return res.scalar_one_or_none()
@@ -23,31 +102,84 @@ class SettingsRepo:
                 baseline_worked_min=0,
                 updated_at=UserSettings.now_iso(),
                 reminder_minutes=0,
-                timezone="Europe/Warsaw",
+                timezone=DEFAULT_TZ,
+                since_baseline_min=0,
             )
             self.session.add(us)
-            await self.session.commit()
-            await self.session.refresh(us)
+            await self.session.flush()
         return us
 
     async def set_baseline(self, user_id: int, baseline_date_iso: str, worked_minutes: int) -> UserSettings:
         us = await self.get_or_create(user_id)
         us.baseline_date = baseline_date_iso  # YYYY-MM-DD
         us.baseline_worked_min = worked_minutes
+        # новая точка отсчёта — баланс считаем заново (единственный полный SUM)
+        us.since_baseline_min = await WorkRepo(self.session).sum_worked_since(user_id, baseline_date_iso)
         us.updated_at = UserSettings.now_iso()
-        await self.session.commit()
         return us
 
     async def set_reminder_minutes(self, user_id: int, minutes: int) -> UserSettings:
         us = await self.get_or_create(user_id)
         us.reminder_minutes = minutes  # 0..1439; 0 = OFF
         us.updated_at = UserSettings.now_iso()
-        await self.session.commit()
         return us
 
     async def set_timezone(self, user_id: int, tz: str) -> UserSettings:
         us = await self.get_or_create(user_id)
         us.timezone = tz  # строго IANA
         us.updated_at = UserSettings.now_iso()
-        await self.session.commit()
         return us
+
+    async def get_balance(self, user_id: int) -> Optional[Tuple[str, int]]:
+        """
+        (baseline_date, baseline_worked_min + отработано после неё) без суммирования work_entries.
+        Читаем колонками мимо identity map: WorkRepo двигает счётчик UPDATE'ом.
+        Счётчик ещё не заполнен (NULL до миграции/reconcile_balances) — считаем полностью, но не пишем.
+        """
+        res = await self.session.execute(
+            select(UserSettings.baseline_date, UserSettings.baseline_worked_min, UserSettings.since_baseline_min)
+            .where(UserSettings.user_id == user_id)
+        )
+        row = res.one_or_none()
+        if row is None:
+            return None
+        since = row.since_baseline_min
+        if since is None:
+            since = await WorkRepo(self.session).sum_worked_since(user_id, row.baseline_date)
+        return row.baseline_date, row.baseline_worked_min + since
+
+    async def recompute_balance(self, user_id: int, baseline_date_iso: str) -> int:
+        # сначала UPDATE: строка настроек заблокирована до commit, правка дня у соседа
+        # дождётся нас и сдвинет уже пересчитанное значение (см. WorkRepo._shift_balance)
+        await self.session.execute(
+            update(UserSettings).where(UserSettings.user_id == user_id).values(since_baseline_min=None)
+            .execution_options(synchronize_session=False)
+        )
+        since = await WorkRepo(self.session).sum_worked_since(user_id, baseline_date_iso)
+        await self.session.execute(
+            update(UserSettings).where(UserSettings.user_id == user_id).values(since_baseline_min=since)
+            .execution_options(synchronize_session=False)
+        )
+        return since
+
+    async def balance_users(self) -> List[Tuple[int, str]]:
+        """(user_id, baseline_date) всех пользователей с настройками — и с незаполненным счётчиком тоже."""
+        res = await self.session.execute(
+            select(UserSettings.user_id, UserSettings.baseline_date).order_by(UserSettings.user_id)
+        )
+        return [(r[0], r[1]) for r in res.fetchall()]
+
+    async def verify_balance(self, user_id: int) -> bool:
+        """
+        Сверка накопленного счётчика с полным пересчётом (work_entries и архив закрытых лет).
+        Незаполненный (NULL) счётчик — не сходится: его надо посчитать.
+        """
+        res = await self.session.execute(
+            select(UserSettings.baseline_date, UserSettings.since_baseline_min).where(UserSettings.user_id == user_id)
+        )
+        row = res.one_or_none()
+        if row is None:
+            return True
+        if row.since_baseline_min is None:
+            return False
+        return row.since_baseline_min == await WorkRepo(self.session).sum_worked_since(user_id, row.baseline_date)
@@ -0,0 +1,90 @@
+# db/tenant.py
+"""
+Данные нескольких ботов одного процесса (BOT_TOKENS) на общем engine и пуле.
+Бот по умолчанию живёт в основной схеме, как раньше; каждый следующий — в своей:
+SQLite — отдельный файл через ATTACH на каждом соединении пула, PostgreSQL — schema.
+Сессия нужной схемы выдаётся db.base.session_factory() по contextvar (use_schema),
+таблицы в SQL переводятся через schema_translate_map.
+Общие таблицы (scheduler_lease, scheduler_requests, handoffs) есть только в основной схеме.
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, List
+
+from sqlalchemy import Table, event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import db.base as base
+from db.base import Base
+
+SHARED_TABLES = ("scheduler_lease", "scheduler_requests", "handoffs")
+
+# schema -> файл SQLite (только для sqlite)
+_attached: Dict[str, str] = {}
+_listening = False
+
+
+def tenant_tables() -> List[Table]:
+    from db import models  # noqa: F401
+    return [t for name, t in Base.metadata.tables.items() if name not in SHARED_TABLES]
+
+
+def qualified(table: str) -> str:
+    """Имя таблицы текущей схемы для сырого SQL (text() не переводится schema_translate_map)."""
+    schema = base.current_schema()
+    return f'"{schema}".{table}' if schema else table
+
+
+def registered_schemas() -> List[str]:
+    return list(base._tenant_sessions)
+
+
+def _sqlite_tenant_path(schema: str) -> str:
+    main = base.engine.url.database  # type: ignore[union-attr]
+    if not main or main == ":memory:":
+        return ":memory:"
+    root, ext = os.path.splitext(main)
+    return f"{root}.{schema}{ext or '.sqlite3'}"
+
+
+def _attach_all(dbapi_conn, connection_record) -> None:
+    cursor = dbapi_conn.cursor()
+    for schema, path in _attached.items():
+        cursor.execute(f'ATTACH DATABASE ? AS "{schema}"', (path,))
+    cursor.close()
+
+
+async def register_schema(schema: str) -> None:
+    """
+    Подключить схему бота: ATTACH/CREATE SCHEMA, создать таблицы, завести sessionmaker.
+    Вызывается при старте до обработки апдейтов.
+    """
+    global _listening
+    engine = base.engine
+    assert engine is not None, "DB is not initialized. Call init_db() first."
+    if schema in base._tenant_sessions:
+        return
+    sqlite = engine.dialect.name == "sqlite"
+    if sqlite:
+        _attached[schema] = _sqlite_tenant_path(schema)
+        if not _listening:
+            event.listen(engine.sync_engine, "connect", _attach_all)
+            _listening = True
+        # ATTACH делается при открытии соединения — старые соединения пула закрываем
+        await engine.dispose()
+    else:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+
+    mapped = engine.execution_options(schema_translate_map={None: schema})
+    async with mapped.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=tenant_tables())
+        if sqlite:
+            await conn.exec_driver_sql(f'PRAGMA "{schema}".journal_mode=WAL')
+    base._tenant_sessions[schema] = async_sessionmaker(mapped, expire_on_commit=False)
+
+
+def attached_files() -> Dict[str, str]:
+    """schema -> файл SQLite подключённых баз ботов (пусто для PostgreSQL и одного бота)."""
+    return {schema: path for schema, path in _attached.items() if path != ":memory:"}
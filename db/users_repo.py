@@ -1,16 +1,41 @@
 # bot/db/users_repo.py
+from typing import NamedTuple
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from db.base import dialect_insert
 from db.models import User
 
+class UserRow(NamedTuple):
+    """Read-only снимок пользователя (без identity map и инструментации ORM)."""
+    id: int
+    tg_id: int
+    username: str | None
+
 class UsersRepo:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    async def exists(self, tg_id: int) -> bool:
+        res = await self.session.execute(select(User.id).where(User.tg_id == tg_id))
+        return res.first() is not None
+
+    async def get_row(self, tg_id: int) -> UserRow | None:
+        res = await self.session.execute(select(User.id, User.tg_id, User.username).where(User.tg_id == tg_id))
+        row = res.first()
+        return UserRow(*row) if row is not None else None
+
     async def get_by_tg_id(self, tg_id: int) -> User | None:
         res = await self.session.execute(select(User).where(User.tg_id == tg_id))
         return res.scalar_one_or_none()
 
+    async def ensure(self, tg_id: int, username: str | None) -> None:
+        """
+        Строка users есть сразу (в транзакции апдейта) — одним INSERT без чтения.
+        Существующую не трогает: last_seen/username пишет трекер активности (db/activity.py).
+        """
+        stmt = dialect_insert(self.session, User).values(tg_id=tg_id, username=username)
+        await self.session.execute(stmt.on_conflict_do_nothing(index_elements=[User.tg_id]))
+
     async def upsert_user(self, tg_id: int, username: str | None) -> User:
         user = await self.get_by_tg_id(tg_id)
         if user is None:
@@ -18,6 +43,5 @@ class UsersRepo:
             self.session.add(user)
         else:
             user.username = username  # обновим при случае
-        await self.session.commit()
-        await self.session.refresh(user)
+        await self.session.flush()
         return user
@@ -1,55 +1,223 @@
-
 from __future__ import annotations
-from typing import List, Tuple, Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Set, Tuple, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy import and_, case, delete, func, select, tuple_, update
+from db.archive_repo import ArchiveRepo, archive_cutoff
+from db.base import dialect_insert
+from db.models import User, UserSettings, WorkDayOff, WorkEntry, WorkTemplate
+
+_WORKED = WorkEntry.end_min - WorkEntry.start_min - WorkEntry.break_min
+# user_id в одном IN (...): SQLite ограничивает число параметров запроса (999 в старых сборках)
+IN_CHUNK = 500
+
+def _chunks(ids: List[int]) -> Iterable[List[int]]:
+    for i in range(0, len(ids), IN_CHUNK):
+        yield ids[i:i + IN_CHUNK]
 
 class WorkRepo:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    async def _unarchive(self, user_id: int, date_iso: str) -> None:
+        # правка даты закрытого года: год пользователя возвращается в work_entries,
+        # иначе упакованная запись так и осталась бы в отчётах и балансе.
+        # Годы от cutoff и новее в архив не попадают — там лишний DELETE не нужен.
+        year = int(date_iso[:4])
+        if year < archive_cutoff(datetime.now(timezone.utc).year):
+            await ArchiveRepo(self.session).restore_year(user_id, year)
+
+    async def _lock_balance(self, user_id: int) -> None:
+        # PostgreSQL: правки одного пользователя идут по очереди (блокировка строки настроек до commit),
+        # следующий statement видит уже закоммиченное соседом. В SQLite писатель и так один на базу.
+        if self.session.bind.dialect.name == "postgresql":
+            await self.session.execute(
+                select(UserSettings.user_id).where(UserSettings.user_id == user_id).with_for_update()
+            )
+
+    async def _shift_balance(self, user_id: int, date_iso: str, new_min: int) -> None:
+        """
+        Запись после baseline_date двигает накопленный баланс на (новое - текущее за день).
+        Текущее читается подзапросом в том же UPDATE, до изменения work_entries:
+        две параллельные правки одного дня не возьмут одно и то же «старое».
+        Тем же UPDATE растёт report_gen — поколение для кэша отчётов на всех репликах.
+        """
+        old = (
+            select(_WORKED).where(WorkEntry.user_id == user_id, WorkEntry.work_date == date_iso)
+            .scalar_subquery()
+        )
+        since = UserSettings.since_baseline_min
+        await self.session.execute(
+            update(UserSettings)
+            .where(UserSettings.user_id == user_id)
+            .values(
+                since_baseline_min=case(
+                    (and_(since.is_not(None), UserSettings.baseline_date < date_iso),
+                     since + new_min - func.coalesce(old, 0)),
+                    else_=since,
+                ),
+                report_gen=UserSettings.report_gen + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
     async def upsert_entry(self, user_id: int, date_iso: str, start_min: int, end_min: int, break_min: int) -> None:
-        await self.session.execute(text("""
-            INSERT INTO work_entries (user_id, work_date, start_min, end_min, break_min, updated_at)
-            VALUES (:uid, :d, :s, :e, :b, strftime('%Y-%m-%dT%H:%M:%S','now'))
-            ON CONFLICT(user_id, work_date) DO UPDATE SET
-                start_min=excluded.start_min,
-                end_min=excluded.end_min,
-                break_min=excluded.break_min,
-                updated_at=excluded.updated_at
-        """), {"uid": user_id, "d": date_iso, "s": start_min, "e": end_min, "b": break_min})
-        await self.session.commit()
+        await self._unarchive(user_id, date_iso)
+        await self._lock_balance(user_id)
+        await self._shift_balance(user_id, date_iso, end_min - start_min - break_min)
+        stmt = dialect_insert(self.session, WorkEntry).values(
+            user_id=user_id, work_date=date_iso, start_min=start_min, end_min=end_min,
+            break_min=break_min, updated_at=UserSettings.now_iso(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[WorkEntry.user_id, WorkEntry.work_date],
+            set_={
+                "start_min": stmt.excluded.start_min,
+                "end_min": stmt.excluded.end_min,
+                "break_min": stmt.excluded.break_min,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        await self.session.execute(stmt)
+        # записанное время снимает отметку «выходной»
+        await self.session.execute(
+            delete(WorkDayOff).where(WorkDayOff.user_id == user_id, WorkDayOff.off_date == date_iso)
+            .execution_options(synchronize_session=False)
+        )
 
     async def delete_entry(self, user_id: int, date_iso: str) -> None:
-        await self.session.execute(text("DELETE FROM work_entries WHERE user_id=:uid AND work_date=:d"),
-                                   {"uid": user_id, "d": date_iso})
-        await self.session.commit()
+        await self._unarchive(user_id, date_iso)
+        await self._lock_balance(user_id)
+        await self._shift_balance(user_id, date_iso, 0)
+        await self.session.execute(
+            delete(WorkEntry).where(WorkEntry.user_id == user_id, WorkEntry.work_date == date_iso)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def set_day_off(self, user_id: int, date_iso: str) -> None:
+        """
+        Отметить день выходным: запись времени удаляется, день исключается из нормы
+        (report_gen поднимает delete_entry в той же транзакции).
+        """
+        await self.delete_entry(user_id, date_iso)
+        stmt = dialect_insert(self.session, WorkDayOff).values(user_id=user_id, off_date=date_iso)
+        await self.session.execute(stmt.on_conflict_do_nothing(index_elements=[WorkDayOff.user_id, WorkDayOff.off_date]))
+
+    async def get_days_off(self, user_id: int, start: date, end: date) -> List[date]:
+        res = await self.session.execute(
+            select(WorkDayOff.off_date)
+            .where(WorkDayOff.user_id == user_id, WorkDayOff.off_date.between(start.isoformat(), end.isoformat()))
+        )
+        return [date.fromisoformat(r[0]) for r in res.fetchall()]
+
+    async def sum_worked_since(self, user_id: int, date_iso: str) -> int:
+        """
+        Полный пересчёт: сумма отработанного строго после date_iso, включая закрытые годы.
+        """
+        res = await self.session.execute(
+            select(func.coalesce(func.sum(_WORKED), 0))
+            .where(WorkEntry.user_id == user_id, WorkEntry.work_date > date_iso)
+        )
+        total = int(res.scalar_one())
+        start = date.fromisoformat(date_iso) + timedelta(days=1)
+        archived = await ArchiveRepo(self.session).fetch_range(user_id, start, date.max)
+        if archived:
+            # живая запись того же дня приоритетнее архивной (как в отчёте)
+            res = await self.session.execute(
+                select(WorkEntry.work_date)
+                .where(WorkEntry.user_id == user_id, WorkEntry.work_date.between(archived[0][0], archived[-1][0]))
+            )
+            live = {r[0] for r in res.fetchall()}
+            total += sum(e - s - b for iso, s, e, b in archived if iso not in live)
+        return total
 
     async def touch_template(self, user_id: int, start_min: int, end_min: int, break_min: int) -> None:
-        await self.session.execute(text("""
-            INSERT INTO work_templates (user_id, start_min, end_min, break_min, last_used_at)
-            VALUES (:uid, :s, :e, :b, strftime('%Y-%m-%dT%H:%M:%S','now'))
-            ON CONFLICT(user_id, start_min, end_min, break_min) DO UPDATE SET
-                last_used_at=excluded.last_used_at
-        """), {"uid": user_id, "s": start_min, "e": end_min, "b": break_min})
+        stmt = dialect_insert(self.session, WorkTemplate).values(
+            user_id=user_id, start_min=start_min, end_min=end_min, break_min=break_min,
+            last_used_at=UserSettings.now_iso(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[WorkTemplate.user_id, WorkTemplate.start_min, WorkTemplate.end_min, WorkTemplate.break_min],
+            set_={"last_used_at": stmt.excluded.last_used_at},
+        )
+        await self.session.execute(stmt)
         # leave only 4 most recent
-        await self.session.execute(text("""
-            DELETE FROM work_templates
-            WHERE user_id=:uid AND rowid NOT IN (
-                SELECT rowid FROM work_templates
-                WHERE user_id=:uid
-                ORDER BY last_used_at DESC
-                LIMIT 4
-            )
-        """), {"uid": user_id})
-        await self.session.commit()
+        recent = (
+            select(WorkTemplate.start_min, WorkTemplate.end_min, WorkTemplate.break_min)
+            .where(WorkTemplate.user_id == user_id)
+            .order_by(WorkTemplate.last_used_at.desc())
+            .limit(4)
+        )
+        await self.session.execute(
+            delete(WorkTemplate).where(
+                WorkTemplate.user_id == user_id,
+                tuple_(WorkTemplate.start_min, WorkTemplate.end_min, WorkTemplate.break_min).not_in(recent),
+            ).execution_options(synchronize_session=False)
+        )
 
     async def get_templates(self, user_id: int) -> List[Tuple[int,int,int]]:
-        res = await self.session.execute(text("""
-            SELECT start_min, end_min, break_min
-            FROM work_templates
-            WHERE user_id=:uid
-            ORDER BY last_used_at DESC
-            LIMIT 4
-        """), {"uid": user_id})
+        res = await self.session.execute(
+            select(WorkTemplate.start_min, WorkTemplate.end_min, WorkTemplate.break_min)
+            .where(WorkTemplate.user_id == user_id)
+            .order_by(WorkTemplate.last_used_at.desc())
+            .limit(4)
+        )
         return [(r[0], r[1], r[2]) for r in res.fetchall()]
+
+    async def get_templates_bulk(self, user_ids: Iterable[int]) -> Dict[int, List[Tuple[int,int,int]]]:
+        """
+        Шаблоны сразу для пачки пользователей (запрос на каждые IN_CHUNK): user_id -> до 4 последних.
+        """
+        out: Dict[int, List[Tuple[int,int,int]]] = {}
+        for ids in _chunks(list(user_ids)):
+            res = await self.session.execute(
+                select(WorkTemplate.user_id, WorkTemplate.start_min, WorkTemplate.end_min, WorkTemplate.break_min)
+                .where(WorkTemplate.user_id.in_(ids))
+                .order_by(WorkTemplate.user_id, WorkTemplate.last_used_at.desc())
+            )
+            for r in res.fetchall():
+                lst = out.setdefault(r[0], [])
+                if len(lst) < 4:
+                    lst.append((r[1], r[2], r[3]))
+        return out
+
+    async def users_with_entry_on(self, pairs: Dict[int, str]) -> Set[int]:
+        """
+        pairs: user_id -> work_date_iso (локальная дата пользователя).
+        Возвращает тех, у кого уже есть запись на эту дату — запрос по PK (user_id, work_date)
+        на каждые IN_CHUNK пользователей.
+        """
+        found: Set[int] = set()
+        for ids in _chunks(list(pairs)):
+            res = await self.session.execute(
+                select(WorkEntry.user_id, WorkEntry.work_date)
+                .where(WorkEntry.user_id.in_(ids), WorkEntry.work_date.in_(sorted({pairs[i] for i in ids})))
+            )
+            found.update(r[0] for r in res.fetchall() if pairs.get(r[0]) == r[1])
+        return found
+
+    async def team_entries(self, start: date, end: date) -> List[Tuple[int, Optional[str], Optional[str], int, int, int]]:
+        """
+        Все пользователи из users и их записи за период одним запросом (LEFT JOIN по PK work_entries):
+        (tg_id, username, work_date_iso | None, start_min, end_min, break_min), по tg_id и дате.
+        У пользователя без записей — одна строка с work_date = None.
+        """
+        res = await self.session.execute(
+            select(User.tg_id, User.username, WorkEntry.work_date,
+                   WorkEntry.start_min, WorkEntry.end_min, WorkEntry.break_min)
+            .outerjoin(WorkEntry, (WorkEntry.user_id == User.tg_id)
+                       & WorkEntry.work_date.between(start.isoformat(), end.isoformat()))
+            .order_by(User.tg_id, WorkEntry.work_date)
+        )
+        return [tuple(r) for r in res.fetchall()]
+
+    async def team_days_off(self, start: date, end: date) -> Dict[int, List[str]]:
+        """Выходные всех пользователей за период: user_id -> [YYYY-MM-DD]."""
+        res = await self.session.execute(
+            select(WorkDayOff.user_id, WorkDayOff.off_date)
+            .where(WorkDayOff.off_date.between(start.isoformat(), end.isoformat()))
+        )
+        out: Dict[int, List[str]] = {}
+        for user_id, off_date in res.fetchall():
+            out.setdefault(user_id, []).append(off_date)
+        return out
@@ -1,5 +1,7 @@
 import os
 import asyncio
+import logging
+from typing import List
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
@@ -7,57 +9,126 @@ from dotenv import load_dotenv
 from app.handlers import router as other_router
 from app.routers.user import router as user_router
 from app.routers.settings import router as settings_router
+from app.routers.admin import router as admin_router
 from app.commands import setup_commands
 from app.middlewares.auth import AuthMiddleware
-from db.middleware import DbSessionMiddleware
-from db.base import init_db, create_tables, session_factory
+from app.middlewares.intake import IntakeMiddleware
+from app.middlewares.throttle import ThrottleMiddleware
+from app.middlewares.dedup import DedupMiddleware, save_seen_updates
+from app.middlewares.tenant import TenantMiddleware
+from app.middlewares.resume import ResumeRemindersMiddleware
+from app.middlewares.logctx import LogContextMiddleware, HandlerNameMiddleware
+from db.middleware import DbSessionMiddleware, QueryStatsMiddleware
+from db.base import init_db, create_tables
 from db.migrate import ensure_user_settings_columns, ensure_work_tables
 from aiogram.client.default import DefaultBotProperties
 
-from app.scheduler import setup_scheduler, schedule_user_reminder
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from db.models import UserSettings
+from app.scheduler import setup_scheduler
+from app.lease import setup_leader, get_leader
+from app.outbox import setup_outbox, stop_outboxes
+from app.broadcast import setup_broadcaster, get_broadcaster
+from app.tenants import parse_tokens, register_bots, use_bot
+from app.logs import setup_logging, stop_logging
+from app.handoff import HANDOFF_ON_START, setup_handoff, get_handoff
+from app.timesheet import shutdown_pool
+from db.activity import setup_activity_tracker, get_activity_tracker
 
 load_dotenv()
 
-async def on_startup(bot: Bot):
-    await setup_commands(bot)
-    # Инициализируем планировщик
-    setup_scheduler(bot)
-    # Поднимем все напоминания из БД
-    Session = session_factory()
-    async with Session() as session:
-        res = await session.execute(select(UserSettings))
-        for us in res.scalars():
-            if us.reminder_minutes and us.reminder_minutes > 0:
-                schedule_user_reminder(us.user_id, us.reminder_minutes, us.timezone)
+log = logging.getLogger("app.main")
 
-async def main():
-    await init_db(os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./bot.sqlite3'))
-    await create_tables()
-    await ensure_user_settings_columns()
-    await ensure_work_tables()
+async def on_startup(bots: List[Bot]):
+    setup_activity_tracker()
+    for bot in bots:
+        # Отправитель outbox (свой у каждого бота): заодно дошлёт закоммиченное до рестарта
+        setup_outbox(bot)
+        await setup_commands(bot)
+    # Инициализируем планировщик (один на всех ботов)
+    setup_scheduler()
+    # Выборы владельца планировщика: он и поднимет все напоминания из БД
+    await setup_leader()
+    # Рассылки: продолжит прерванные рестартом
+    setup_broadcaster()
+    # Деплой: всё выше уже прогрето — принимаем апдейты и таймеры у старого процесса
+    if HANDOFF_ON_START:
+        await get_handoff().take_over(bots)
+    # и сами отдадим работу следующему
+    get_handoff().watch()
+
+async def on_shutdown(bots: List[Bot]):
+    # поллинг уже остановлен: дожидаемся апдейтов, которые ещё в обработчиках
+    await get_handoff().drain()
+    # отпускаем аренду — другой инстанс подхватит планировщик без ожидания TTL
+    await get_leader().stop()
+    # рассылки сохраняют курсор и отпускаются до следующего запуска
+    await get_broadcaster().stop()
+    # догоняем в БД накопленные last_seen/username
+    await get_activity_tracker().stop()
+    await stop_outboxes()
+    # воркеры табеля (/timesheet), если запускались
+    shutdown_pool()
+    # запомненные update_id переживут рестарт (если задан DEDUP_STATE_PATH)
+    save_seen_updates()
+    # при передаче работы — последние update_id и FSM для нового процесса
+    await get_handoff().release(bots)
 
-    bot = Bot(token=os.getenv('BOT_TOKEN'), default=DefaultBotProperties(parse_mode='HTML'))
+def build_dispatcher() -> Dispatcher:
+    """
+    Мидлвари и роутеры (тесты собирают ту же цепочку, см. tests/conftest.py).
+    Один Dispatcher на все токены: роутеры aiogram подключаются только к одному родителю,
+    а FSM-ключи и так включают bot_id.
+    """
     dp = Dispatcher(storage=MemoryStorage())
 
     # Мидлвари
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.update.outer_middleware(TenantMiddleware())
+    dp.update.outer_middleware(DedupMiddleware())
+    dp.update.outer_middleware(ThrottleMiddleware())
+    dp.update.outer_middleware(IntakeMiddleware())
+    dp.update.outer_middleware(QueryStatsMiddleware())
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
     dp.message.middleware(DbSessionMiddleware())
     dp.callback_query.middleware(DbSessionMiddleware())
+    dp.message.middleware(ResumeRemindersMiddleware())
+    dp.callback_query.middleware(ResumeRemindersMiddleware())
     dp.update.middleware(AuthMiddleware())
 
-    dp.startup.register(on_startup)
-
     # Роутеры
+    dp.include_router(admin_router)
     dp.include_router(user_router)
     dp.include_router(settings_router)
     dp.include_router(other_router)
+    return dp
+
+async def main():
+    await init_db(os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./bot.sqlite3'))
+    await create_tables()
+
+    # Несколько ботов (команд) в одном процессе: BOT_TOKENS=tok1,tok2,...
+    # Первый — бот по умолчанию со старыми данными, остальные — в своих схемах БД.
+    tokens = parse_tokens(os.getenv('BOT_TOKENS') or os.getenv('BOT_TOKEN') or '')
+    bots = [Bot(token=t, default=DefaultBotProperties(parse_mode='HTML')) for t in tokens]
+    await register_bots(bots)
+    for bot in bots:
+        with use_bot(bot.id):
+            await ensure_user_settings_columns()
+            await ensure_work_tables()
+
+    dp = build_dispatcher()
+    setup_handoff(dp)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
 
-    await dp.start_polling(bot)
+    await dp.start_polling(*bots)
 
 if __name__ == '__main__':
+    # логи пишет отдельный поток — event loop не ждёт stderr
+    setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print('Bot stopped')
+        log.info('Bot stopped')
+    finally:
+        stop_logging()
@@ -0,0 +1,178 @@
+# tests/conftest.py
+"""
+Обвязка тестов: чистая БД, Bot с подменённой HTTP-сессией
+(запросы к Telegram записываются и получают правдоподобный ответ) и Dispatcher
+с той же цепочкой мидлварей, что в main.py. pytest-asyncio не нужен:
+каждый тест — один asyncio.run(), см. фикстуру run.
+
+БД — матрица db_url: SQLite в tmp_path всегда, PostgreSQL — если задан TEST_DATABASE_URL
+(postgresql+asyncpg://…; таблицы в нём пересоздаются на каждый тест). Сервер недоступен
+или нет драйвера — postgresql-варианты пропускаются.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import GetMe, SendMessage, TelegramMethod  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+from app import scheduler  # noqa: E402
+from app.tenants import register_bots  # noqa: E402
+from db.activity import setup_activity_tracker  # noqa: E402
+from db import base, models  # noqa: E402,F401
+from db.base import Base, create_tables, init_db  # noqa: E402
+
+BOT_ID = 42
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+_update_ids = itertools.count(1)
+_user_ids = itertools.count(1001)
+
+
+class FakeSession(BaseSession):
+    """Вместо HTTP: запоминаем вызванные методы, отвечаем минимально правдоподобно."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: List[TelegramMethod] = []
+        self._message_ids = itertools.count(500)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls.append(method)
+        if isinstance(method, GetMe):
+            return User(id=BOT_ID, is_bot=True, first_name="bot")
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=next(self._message_ids), date=datetime.now(timezone.utc),
+                chat=Chat(id=method.chat_id, type="private"), text=method.text,
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any):  # pragma: no cover
+        raise NotImplementedError
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    def sent_texts(self) -> List[str]:
+        return [m.text for m in self.calls if isinstance(m, SendMessage)]
+
+
+class Harness:
+    def __init__(self, dp: Dispatcher, bot: Bot, session: FakeSession, dialect: str) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.dialect = dialect
+        self.forwarded: List[tuple] = []
+        self.user_id = next(_user_ids)
+
+    def _user(self) -> User:
+        return User(id=self.user_id, is_bot=False, first_name="Test")
+
+    async def message(self, text: str) -> Any:
+        msg = Message(
+            message_id=next(_update_ids), date=datetime.now(timezone.utc),
+            chat=Chat(id=self.user_id, type="private"), from_user=self._user(), text=text,
+        )
+        return await self.dp.feed_update(self.bot, Update(update_id=next(_update_ids), message=msg))
+
+    async def callback(self, data: str) -> Any:
+        shown = Message(
+            message_id=next(_update_ids), date=datetime.now(timezone.utc),
+            chat=Chat(id=self.user_id, type="private"), text="Укажите время работы:",
+        )
+        cb = CallbackQuery(id=str(next(_update_ids)), from_user=self._user(), chat_instance="t",
+                           message=shown, data=data)
+        return await self.dp.feed_update(self.bot, Update(update_id=next(_update_ids), callback_query=cb))
+
+
+_dp: Optional[Dispatcher] = None
+
+
+def _dispatcher() -> Dispatcher:
+    # роутеры подключаются к родителю один раз — Dispatcher общий на все тесты
+    global _dp
+    if _dp is None:
+        from main import build_dispatcher
+        _dp = build_dispatcher()
+    return _dp
+
+
+_postgres_error: Optional[str] = None
+_postgres_checked = False
+
+
+def _postgres_url() -> str:
+    """TEST_DATABASE_URL, если сервер отвечает; иначе pytest.skip с причиной (проверка — раз за сессию)."""
+    global _postgres_checked, _postgres_error
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL не задан")
+    if not _postgres_checked:
+        _postgres_checked = True
+
+        async def probe() -> None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            engine = create_async_engine(TEST_DATABASE_URL)
+            try:
+                async with engine.connect():
+                    pass
+            finally:
+                await engine.dispose()
+
+        try:
+            asyncio.run(probe())
+        except Exception as exc:
+            _postgres_error = f"{type(exc).__name__}: {exc}"
+    if _postgres_error is not None:
+        pytest.skip(f"PostgreSQL недоступен: {_postgres_error}")
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def db_url(request, tmp_path) -> str:
+    if request.param == "postgresql":
+        return _postgres_url()
+    return f"sqlite+aiosqlite:///{tmp_path / 'bot.sqlite3'}"
+
+
+@pytest.fixture
+def run(db_url) -> Callable[[Callable[[Harness], Awaitable[Any]]], Any]:
+    """
+    run(scenario): поднять БД и бота в новом event loop и выполнить scenario(harness).
+    Планировщик — не-владелец: заявки (таймеры клавиатур и т.п.) копятся в harness.forwarded.
+    """
+    def _run(scenario: Callable[[Harness], Awaitable[Any]]) -> Any:
+        async def main() -> Any:
+            await init_db(db_url)
+            if base.engine.dialect.name == "postgresql":
+                # общий сервер: данные предыдущего теста не должны просочиться
+                async with base.engine.begin() as conn:
+                    await conn.run_sync(Base.metadata.drop_all)
+            await create_tables()
+            session = FakeSession()
+            bot = Bot(token=f"{BOT_ID}:TEST", session=session)
+            await register_bots([bot])
+            harness = Harness(_dispatcher(), bot, session, base.engine.dialect.name)
+            scheduler.set_owner(False, lambda kind, payload: harness.forwarded.append((kind, payload)))
+            tracker = setup_activity_tracker(interval=3600)
+            try:
+                return await scenario(harness)
+            finally:
+                await tracker.stop()
+                scheduler.set_owner(True)
+                await base.engine.dispose()
+        return asyncio.run(main())
+    return _run
@@ -0,0 +1,31 @@
+# tests/test_activity.py
+"""Пользователи и активность: строка users — сразу, last_seen/username — пачкой (db/activity.py)."""
+from sqlalchemy import select
+
+from app.middlewares import auth
+from db import base
+from db.activity import get_activity_tracker
+from db.broadcast_repo import BroadcastRepo
+from db.models import User
+
+
+def test_settings_creates_user_immediately(run):
+    async def scenario(h):
+        await h.message("/settings")
+        # трекер в тестах сбрасывается раз в час — строка уже есть без него
+        async with base.session_factory()() as session:
+            assert h.user_id in await BroadcastRepo(session).recipients(0, 100)
+        assert h.user_id in get_activity_tracker()._pending[None]
+        # повторный /settings не падает на уникальном tg_id
+        await h.message("/settings")
+        async with base.session_factory()() as session:
+            assert len((await session.scalars(select(User).where(User.tg_id == h.user_id))).all()) == 1
+    run(scenario)
+
+
+def test_admin_activity_is_touched(run, monkeypatch):
+    async def scenario(h):
+        monkeypatch.setattr(auth, "ADMIN_ID", h.user_id)
+        await h.message("/report")
+        assert h.user_id in get_activity_tracker()._pending.get(None, {})
+    run(scenario)
@@ -0,0 +1,47 @@
+# tests/test_archive.py
+"""Закрытые годы в work_archive (db/archive_repo.py): правка возвращает год в work_entries."""
+from datetime import date
+
+from sqlalchemy import select
+
+from db import base
+from db.models import WorkEntry
+from db.archive_repo import ArchiveRepo
+from db.query_stats import count_queries
+from db.work_repo import WorkRepo
+
+
+def test_edit_of_archived_year_restores_it(run):
+    async def scenario(h):
+        async with base.session_factory()() as session:
+            repo = WorkRepo(session)
+            await repo.upsert_entry(h.user_id, "2020-03-02", 540, 1080, 0)
+            await repo.upsert_entry(h.user_id, "2020-03-03", 540, 1020, 0)
+            await session.commit()
+            assert await ArchiveRepo(session).archive_year(2020) == 2
+            await session.commit()
+
+            with count_queries() as stats:
+                await repo.upsert_entry(h.user_id, "2020-03-03", 600, 1020, 0)
+            assert any("work_archive" in sql for sql in stats.statements)
+            await session.commit()
+            assert await ArchiveRepo(session).fetch_range(h.user_id, date(2020, 1, 1), date(2020, 12, 31)) == []
+            res = await session.execute(
+                select(WorkEntry.work_date, WorkEntry.start_min, WorkEntry.end_min, WorkEntry.break_min)
+                .where(WorkEntry.user_id == h.user_id).order_by(WorkEntry.work_date)
+            )
+        assert [tuple(r) for r in res] == [("2020-03-02", 540, 1080, 0), ("2020-03-03", 600, 1020, 0)]
+    run(scenario)
+
+
+def test_current_year_edit_skips_archive(run):
+    async def scenario(h):
+        today = date.today().isoformat()
+        async with base.session_factory()() as session:
+            repo = WorkRepo(session)
+            with count_queries() as stats:
+                await repo.upsert_entry(h.user_id, today, 540, 1080, 0)
+                await repo.delete_entry(h.user_id, today)
+            await session.commit()
+        assert not any("work_archive" in sql for sql in stats.statements)
+    run(scenario)
@@ -0,0 +1,44 @@
+# tests/test_backup.py
+"""Онлайн-бэкап SQLite (db/backup.py) под непрерывной записью бота."""
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from app import metrics
+from db import backup, base
+
+
+def test_backup_finishes_under_writes(run, tmp_path, monkeypatch):
+    async def scenario(h):
+        if h.dialect != "sqlite":
+            pytest.skip("online backup — только SQLite")
+        # ~2000 страниц и шаг в 4 страницы: без записи копия сняла бы их за сотни шагов
+        monkeypatch.setattr(backup, "BACKUP_PAGES", 4)
+        monkeypatch.setattr(backup, "BACKUP_SLEEP", 0.001)
+        async with base.engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE filler (x BLOB)"))
+            await conn.execute(text(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000) "
+                "INSERT INTO filler SELECT randomblob(4000) FROM n"
+            ))
+        before = metrics.get("backup_vacuum_into")
+        task = asyncio.create_task(backup.run_backup(str(tmp_path / "backups"), compress=False))
+        writes = 0
+        # коммиты через соединение бота, как у напоминаний и трекера активности
+        while not task.done():
+            async with base.engine.begin() as conn:
+                await conn.execute(text("INSERT INTO filler VALUES (randomblob(100))"))
+            writes += 1
+            await asyncio.sleep(0.002)
+        result = await asyncio.wait_for(task, timeout=30)
+        assert writes > backup.BACKUP_MAX_RESTARTS
+        assert metrics.get("backup_vacuum_into") - before == 1
+        copy = sqlite3.connect(result.path)
+        try:
+            assert copy.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+            assert copy.execute("SELECT count(*) FROM filler").fetchone()[0] >= 2000
+        finally:
+            copy.close()
+    run(scenario)
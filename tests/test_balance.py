@@ -0,0 +1,77 @@
+# tests/test_balance.py
+"""Накопленный баланс (user_settings.since_baseline_min): дельты WorkRepo против полного пересчёта."""
+from datetime import date
+
+from sqlalchemy import select, update
+
+from app import scheduler
+from db import base
+from db.archive_repo import ArchiveRepo
+from db.models import UserSettings
+from db.query_stats import count_queries
+from db.settings_repo import SettingsRepo
+from db.work_repo import WorkRepo
+
+
+async def _since(session, user_id: int):
+    return await session.scalar(select(UserSettings.since_baseline_min).where(UserSettings.user_id == user_id))
+
+
+def test_deltas_match_full_recompute(run):
+    async def scenario(h):
+        this_year = date.today().year
+        async with base.session_factory()() as session:
+            srepo, repo = SettingsRepo(session), WorkRepo(session)
+            await srepo.set_baseline(h.user_id, "2020-03-01", 0)
+            await session.commit()
+
+            async def check(step: str) -> None:
+                await session.commit()
+                full = await repo.sum_worked_since(h.user_id, "2020-03-01")
+                assert await _since(session, h.user_id) == full, step
+
+            await repo.upsert_entry(h.user_id, "2020-03-02", 540, 1080, 60)
+            await repo.upsert_entry(h.user_id, "2020-03-03", 540, 1020, 0)
+            await repo.upsert_entry(h.user_id, f"{this_year}-01-02", 600, 1080, 30)
+            await check("upsert")
+            await repo.upsert_entry(h.user_id, "2020-03-03", 480, 1140, 45)
+            await check("upsert same day")
+            # день baseline и раньше в счётчик не входит
+            await repo.upsert_entry(h.user_id, "2020-03-01", 540, 1080, 0)
+            await repo.upsert_entry(h.user_id, "2020-02-28", 540, 1080, 0)
+            await check("before baseline")
+            await repo.delete_entry(h.user_id, f"{this_year}-01-02")
+            await repo.delete_entry(h.user_id, "2020-02-28")
+            await check("delete")
+            assert await ArchiveRepo(session).archive_year(2020) == 3
+            await check("archive")
+            # правка закрытого года возвращает его из архива
+            await repo.upsert_entry(h.user_id, "2020-03-02", 540, 1140, 0)
+            await check("restore + upsert")
+            assert await ArchiveRepo(session).archive_year(2020) == 3
+            await repo.delete_entry(h.user_id, "2020-03-03")
+            await check("restore + delete")
+            assert await _since(session, h.user_id) == 600
+    run(scenario)
+
+
+def test_missing_balance_read_without_write(run):
+    async def scenario(h):
+        async with base.session_factory()() as session:
+            srepo = SettingsRepo(session)
+            await srepo.set_baseline(h.user_id, "2020-03-01", 60)
+            await WorkRepo(session).upsert_entry(h.user_id, "2020-03-02", 540, 1080, 0)
+            # как сразу после ALTER TABLE ADD COLUMN
+            await session.execute(update(UserSettings).where(UserSettings.user_id == h.user_id)
+                                  .values(since_baseline_min=None))
+            await session.commit()
+
+            with count_queries() as stats:
+                assert await srepo.get_balance(h.user_id) == ("2020-03-01", 60 + 540)
+            assert not any(sql.startswith("UPDATE") for sql in stats.statements)
+            assert await _since(session, h.user_id) is None
+        # счётчик заполняет сверка
+        assert await scheduler.reconcile_balances() == 1
+        async with base.session_factory()() as session:
+            assert await _since(session, h.user_id) == 540
+    run(scenario)
@@ -0,0 +1,61 @@
+# tests/test_broadcast.py
+"""Рассылки (app/broadcast.py): флуд-лимит дольше BROADCAST_STALE не отдаёт рассылку другому инстансу."""
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app import broadcast
+from app.broadcast import Broadcaster
+from db import base
+from db.models import User
+
+
+async def _recipient(h) -> None:
+    async with base.session_factory()() as session:
+        session.add(User(tg_id=h.user_id))
+        await session.commit()
+
+
+def _flood_once(h) -> None:
+    make_request = h.session.make_request
+    flooded = []
+
+    async def flood(bot, method, timeout=None):
+        if isinstance(method, SendMessage) and method.text == "news" and not flooded:
+            flooded.append(method)
+            raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=1)
+        return await make_request(bot, method, timeout)
+
+    h.session.make_request = flood
+
+
+def test_retry_after_keeps_heartbeat(run, monkeypatch):
+    async def scenario(h):
+        monkeypatch.setattr(broadcast, "BROADCAST_STALE", 0.2)
+        await _recipient(h)
+        _flood_once(h)
+        sender, other = Broadcaster(), Broadcaster()
+        await sender.start("news", h.user_id, 1)
+        # ждём retry_after=1 с: всё это время рассылка жива и у другого инстанса не забирается
+        for _ in range(8):
+            await asyncio.sleep(0.1)
+            assert await other.resume() == 0
+        await asyncio.gather(*sender._tasks.values())
+        assert h.session.sent_texts().count("news") == 1
+    run(scenario)
+
+
+def test_cancel_during_retry_after_stops(run, monkeypatch):
+    async def scenario(h):
+        monkeypatch.setattr(broadcast, "BROADCAST_STALE", 0.2)
+        await _recipient(h)
+        _flood_once(h)
+        sender = Broadcaster()
+        broadcast_id = await sender.start("news", h.user_id, 1)
+        await asyncio.sleep(0.05)
+        assert await sender.cancel(broadcast_id)
+        # следующий heartbeat не проходит — повтора после флуд-лимита нет
+        await asyncio.wait_for(asyncio.gather(*sender._tasks.values()), timeout=0.5)
+        assert "news" not in h.session.sent_texts()
+    run(scenario)
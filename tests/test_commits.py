@@ -0,0 +1,65 @@
+# tests/test_commits.py
+"""Unit of work на апдейт (db/middleware.py): один commit, ответы в Telegram — после него."""
+import pytest
+from sqlalchemy import event, func, select
+
+from aiogram.methods import SendMessage
+
+from db import base
+from db.models import OutboxMessage, WorkEntry
+from db.query_stats import count_queries
+
+
+def _record_commits(h) -> None:
+    event.listen(base.engine.sync_engine, "commit", lambda conn: h.session.calls.append("COMMIT"))
+
+
+def test_work_entry_is_one_commit(run):
+    async def scenario(h):
+        with count_queries() as stats:
+            await h.message("9-18")
+        assert stats.commits == 1
+        async with base.session_factory()() as session:
+            entries = await session.scalar(select(func.count()).select_from(WorkEntry))
+            outbox = await session.scalar(select(func.count()).select_from(OutboxMessage))
+        assert (entries, outbox) == (1, 1)
+        # ответ ушёл в outbox, напрямую ничего не отправлено
+        assert h.session.sent_texts() == []
+    run(scenario)
+
+
+def test_each_update_commits_once(run):
+    async def scenario(h):
+        # /report без обращений к БД — сессия не открывает транзакцию вовсе
+        for text, commits in (("9-18", 1), ("выходной", 1), ("/mark", 1), ("/report", 0), ("/settings", 1)):
+            with count_queries() as stats:
+                await h.message(text)
+            assert stats.commits == commits, text
+    run(scenario)
+
+
+def test_direct_reply_after_commit(run):
+    async def scenario(h):
+        _record_commits(h)
+        # /settings создаёт строку user_settings и отвечает сообщением с клавиатурой
+        await h.message("/settings")
+        calls = h.session.calls
+        first_send = next(i for i, m in enumerate(calls) if isinstance(m, SendMessage))
+        assert "COMMIT" in calls[:first_send]
+        assert h.session.sent_texts() == ["Настройки:"]
+    run(scenario)
+
+
+def test_failed_reply_keeps_data(run):
+    async def scenario(h):
+        async def broken(*args, **kwargs):
+            raise RuntimeError("telegram is down")
+
+        h.session.make_request = broken
+        # ответ падает уже после commit — настройки пользователя сохранены
+        with pytest.raises(RuntimeError):
+            await h.message("/settings")
+        from db.settings_repo import SettingsRepo
+        async with base.session_factory()() as session:
+            assert await SettingsRepo(session).get(h.user_id) is not None
+    run(scenario)
@@ -0,0 +1,22 @@
+# tests/test_dedup.py
+"""Кэш update_id (app/middlewares/dedup.py): файл состояния между рестартами."""
+import os
+
+from app.middlewares.dedup import SeenUpdates
+
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "seen.bin")
+    seen = SeenUpdates(capacity=3)
+    for update_id in (5, 7, 3, 9):
+        seen.add(update_id)
+    seen.save(path)
+    # только сами update_id, без заголовка
+    assert os.path.getsize(path) == 3 * 8
+
+    restored = SeenUpdates(capacity=3)
+    assert restored.load(path) == 3
+    assert restored.newest == 9
+    assert not restored.add(7) and restored.add(5)
+    # порядок вытеснения сохранён: 5 вытеснил самый старый — 7
+    assert restored.add(7)
@@ -0,0 +1,75 @@
+# tests/test_dialects.py
+"""
+Ветки под диалект (SQLite/PostgreSQL): мягкая миграция через инспектор, пул соединений,
+блокировка строки настроек, NOT IN по кортежу. На PostgreSQL — при заданном TEST_DATABASE_URL.
+"""
+import os
+
+from sqlalchemy import inspect, text
+
+from db import base
+from db.migrate import ensure_user_settings_columns
+from db.query_stats import count_queries
+from db.work_repo import WorkRepo
+
+
+async def _settings_columns() -> set:
+    async with base.engine.connect() as conn:
+        return await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns("user_settings")})
+
+
+def test_migration_adds_missing_columns(run):
+    async def scenario(h):
+        await h.message("/settings")
+        await h.message("9-18")
+        async with base.engine.begin() as conn:
+            for column in ("since_baseline_min", "report_gen"):
+                await conn.execute(text(f"ALTER TABLE user_settings DROP COLUMN {column}"))
+        assert "report_gen" not in await _settings_columns()
+        await ensure_user_settings_columns()
+        assert {"since_baseline_min", "report_gen"} <= await _settings_columns()
+        # баланс заполнен миграцией, а не первым чтением
+        async with base.engine.connect() as conn:
+            since = await conn.scalar(text("SELECT since_baseline_min FROM user_settings"))
+        assert since is not None
+        # повторный запуск — ничего не добавляет и не падает
+        await ensure_user_settings_columns()
+        await h.message("/settings")
+        await h.message("9-18")
+        assert h.session.sent_texts()
+    run(scenario)
+
+
+def test_pool_settings(run):
+    async def scenario(h):
+        if h.dialect != "postgresql":
+            assert base._engine_kwargs(str(base.engine.url)) == {}
+            return
+        assert base.engine.pool.size() == int(os.getenv("DB_POOL_SIZE", "10"))
+        async with base.engine.connect() as conn:
+            name = await conn.scalar(text("SELECT current_setting('application_name')"))
+        assert name == "tgbot"
+    run(scenario)
+
+
+def test_entry_locks_settings_row(run):
+    async def scenario(h):
+        await h.message("/settings")
+        with count_queries() as stats:
+            await h.message("9-18")
+        locked = any(sql.endswith("FOR UPDATE") for sql in stats.statements)
+        assert locked == (h.dialect == "postgresql")
+    run(scenario)
+
+
+def test_templates_trimmed_by_tuple(run):
+    async def scenario(h):
+        async with base.session_factory()() as session:
+            repo = WorkRepo(session)
+            for hour in range(6):
+                await repo.touch_template(h.user_id, hour * 60, hour * 60 + 480, 0)
+            await session.commit()
+            templates = await repo.get_templates(h.user_id)
+        # last_used_at с точностью до секунды — какие именно 4 остались, здесь не проверить
+        assert len(templates) == 4
+    run(scenario)
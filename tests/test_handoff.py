@@ -0,0 +1,79 @@
+# tests/test_handoff.py
+"""Передача работы при деплое (app/handoff.py): offset при незавершённых обработчиках."""
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+from app.handoff import HandoffCoordinator, restore_fsm, snapshot_fsm
+from app.middlewares.dedup import DedupMiddleware, in_flight, seen_updates
+from db import base
+from db.handoff_repo import HandoffRepo
+
+# выше update_id, которые раздаёт conftest
+FIRST = 10 ** 9
+
+
+async def _released(h, coordinator: HandoffCoordinator) -> dict:
+    async with base.session_factory()() as session:
+        repo = HandoffRepo(session)
+        await repo.request("new", 0)
+        coordinator.handoff_id = await repo.claim_request(coordinator.instance_id, 0)
+        await session.commit()
+    await coordinator.release([h.bot])
+    async with base.session_factory()() as session:
+        state, payload = await HandoffRepo(session).get(coordinator.handoff_id)
+    assert state == "released"
+    return payload
+
+
+def test_offset_stops_before_unfinished_update(run):
+    async def scenario(h):
+        dedup = DedupMiddleware()
+        gate = asyncio.Event()
+
+        async def stuck(event, data):
+            await gate.wait()
+
+        async def quick(event, data):
+            return None
+
+        slow = asyncio.create_task(dedup(stuck, Update(update_id=FIRST + 1), {"bot": h.bot}))
+        await asyncio.sleep(0)
+        for update_id in (FIRST + 2, FIRST + 3):
+            await dedup(quick, Update(update_id=update_id), {"bot": h.bot})
+        assert in_flight(h.bot.id) == {FIRST + 1}
+
+        payload = await _released(h, HandoffCoordinator(h.dp))
+        # FIRST + 1 не подтверждается: новый процесс получит его заново, а следующие пропустит
+        assert payload["offsets"][str(h.bot.id)] == FIRST
+        assert payload["done"][str(h.bot.id)] == [FIRST + 2, FIRST + 3]
+
+        gate.set()
+        await slow
+        assert in_flight(h.bot.id) == set()
+        payload = await _released(h, HandoffCoordinator(h.dp))
+        assert payload["offsets"][str(h.bot.id)] == seen_updates(h.bot.id).newest == FIRST + 3
+    run(scenario)
+
+
+def test_fsm_round_trip(run):
+    async def scenario(h):
+        old, new = MemoryStorage(), MemoryStorage()
+        key = StorageKey(bot_id=h.bot.id, chat_id=h.user_id, user_id=h.user_id, business_connection_id="bc")
+        await old.set_state(key, "Form:date")
+        await old.set_data(key, {"date": "2026-10-19"})
+        assert await restore_fsm(new, snapshot_fsm(old)) == 1
+        assert await new.get_state(key) == "Form:date"
+        assert await new.get_data(key) == {"date": "2026-10-19"}
+    run(scenario)
+
+
+def test_missing_aiogram_internals_fail_at_start(run, monkeypatch):
+    async def scenario(h):
+        monkeypatch.delattr(h.dp, "_handle_update_tasks")
+        with pytest.raises(RuntimeError, match="Dispatcher._handle_update_tasks"):
+            HandoffCoordinator(h.dp)
+    run(scenario)
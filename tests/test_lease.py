@@ -0,0 +1,25 @@
+# tests/test_lease.py
+"""Владение планировщиком (app/lease.py): таймеры клавиатур при смене владельца."""
+from app import scheduler
+from app.lease import SchedulerLeader
+from app.tenants import use_bot
+
+
+def test_lost_lease_forwards_kb_expiries(run, monkeypatch):
+    async def scenario(h):
+        monkeypatch.setattr(scheduler, "_scheduler", None)
+        sched = scheduler.setup_scheduler(paused=True)
+        try:
+            leader = SchedulerLeader()
+            await leader._set_leader(True)
+            with use_bot(h.bot.id):
+                scheduler.schedule_kb_expire(h.user_id, 7, seconds=60)
+            # аренду перехватили (не плановая остановка): задачи снимаются, таймер уходит заявкой
+            await leader._set_leader(False)
+            assert sched.get_jobs() == []
+            assert [(kind, p["chat_id"], p["message_id"]) for kind, p, _ in leader._outgoing] == [
+                ("kb_expire", h.user_id, 7)
+            ]
+        finally:
+            sched.shutdown(wait=False)
+    run(scenario)
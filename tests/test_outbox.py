@@ -0,0 +1,79 @@
+# tests/test_outbox.py
+"""Фоновый отправитель outbox (app/outbox.py): лимит Telegram и аренда пачки."""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from sqlalchemy import select
+
+from app import outbox
+from app.outbox import OutboxSender
+from db import base
+from db.models import OutboxMessage
+from db.outbox_repo import OutboxRepo
+
+
+async def _enqueue(h, n: int) -> None:
+    async with base.session_factory()() as session:
+        for i in range(n):
+            await OutboxRepo(session).enqueue(h.user_id, f"m{i}", idem_key=f"t:{h.user_id}:{i}")
+        await session.commit()
+
+
+async def _rows(h):
+    async with base.session_factory()() as session:
+        res = await session.execute(
+            select(OutboxMessage.text, OutboxMessage.status, OutboxMessage.attempts,
+                   OutboxMessage.next_attempt_at, OutboxMessage.locked_until)
+            .where(OutboxMessage.chat_id == h.user_id).order_by(OutboxMessage.id)
+        )
+        return res.fetchall()
+
+
+def test_retry_after_stops_the_batch(run):
+    async def scenario(h):
+        await _enqueue(h, 4)
+        make_request = h.session.make_request
+
+        async def flood(bot, method, timeout=None):
+            if isinstance(method, SendMessage) and method.text == "m1":
+                h.session.calls.append(method)
+                raise TelegramRetryAfter(method, "Flood control exceeded", retry_after=30)
+            return await make_request(bot, method, timeout)
+
+        h.session.make_request = flood
+        sender = OutboxSender(h.bot)
+        assert await sender.drain_once() == 2
+        # m2, m3 в Telegram не ходили
+        assert h.session.sent_texts() == ["m0", "m1"]
+        rows = await _rows(h)
+        assert [(r.status, r.attempts) for r in rows] == [("sent", 0), ("pending", 1), ("pending", 0), ("pending", 0)]
+        assert rows[1].next_attempt_at == rows[2].next_attempt_at == rows[3].next_attempt_at > time.time() + 25
+        assert rows[3].locked_until == 0
+        # до конца лимита отправитель пачки не забирает
+        assert await sender.drain_once() == 0
+    run(scenario)
+
+
+def test_batch_fits_the_lease(run, monkeypatch):
+    async def scenario(h):
+        await _enqueue(h, 5)
+        monkeypatch.setattr(outbox, "OUTBOX_LOCK", 1.0)
+        monkeypatch.setattr(outbox, "OUTBOX_SEND_TIMEOUT", 0.5)
+        make_request = h.session.make_request
+
+        async def slow(bot, method, timeout=None):
+            if isinstance(method, SendMessage):
+                await asyncio.sleep(0.2)
+            return await make_request(bot, method, timeout)
+
+        h.session.make_request = slow
+        sender = OutboxSender(h.bot)
+        # третья отправка уже не успела бы до конца аренды
+        assert await sender.drain_once() == 3
+        rows = await _rows(h)
+        assert [r.status for r in rows] == ["sent"] * 3 + ["pending"] * 2
+        assert [(r.attempts, r.locked_until) for r in rows[3:]] == [(0, 0), (0, 0)]
+        assert rows[3].next_attempt_at <= time.time()
+    run(scenario)
@@ -0,0 +1,33 @@
+# tests/test_profiler.py
+"""Сэмплирующий профиль event loop (app/profiler.py)."""
+import asyncio
+import time
+
+from app.profiler import profile_loop
+
+
+def test_idle_loop_is_idle():
+    # этот файл лежит в корне проекта и есть в каждом стеке — как main.py у бота
+    result = asyncio.run(profile_loop(1, interval=0.01))
+    assert result.samples > 0
+    assert result.idle / result.samples > 0.8
+    assert not any(name.startswith("tests.") for name in result.inclusive)
+
+
+def test_busy_handler_is_own_time():
+    async def busy() -> None:
+        # блокирующая работа прямо в цикле — весь профиль должен прийтись на неё
+        end = time.monotonic() + 1.2
+        while time.monotonic() < end:
+            sum(range(1000))
+
+    async def main():
+        task = asyncio.create_task(busy())
+        result = await profile_loop(1, interval=0.01)
+        await task
+        return result
+
+    result = asyncio.run(main())
+    assert result.idle / result.samples < 0.2
+    top, _ = result.own.most_common(1)[0]
+    assert top.endswith("busy")
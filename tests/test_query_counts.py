@@ -0,0 +1,69 @@
+# tests/test_query_counts.py
+"""
+Бюджет SQL на обработчик (db/query_stats.py): лишний запрос в горячем пути — падение теста.
+Первый апдейт пользователя включает проверку паузы напоминаний (app/scheduler.py,
+resume_reminders_if_paused), дальше она кэшируется на RESUME_CHECK_TTL.
+На PostgreSQL правка записи добавляет SELECT … FOR UPDATE строки настроек (WorkRepo._lock_balance).
+"""
+import pytest
+
+from db.query_stats import assert_queries, count_queries
+
+
+def _lock(h) -> int:
+    return 1 if h.dialect == "postgresql" else 0
+
+
+def test_work_entry(run):
+    async def scenario(h):
+        # timezone, баланс, запись дня, выходной, шаблон (2), строка баланса, outbox, пауза;
+        # текущий год в архиве быть не может — restore_year не вызывается
+        with assert_queries(9 + _lock(h), commits=1, handler="on_text"):
+            await h.message("9-18")
+        with assert_queries(8 + _lock(h), commits=1):
+            await h.message("9-17")
+    run(scenario)
+
+
+def test_template_button(run):
+    async def scenario(h):
+        await h.message("/mark")
+        with assert_queries(6 + _lock(h), commits=1, handler="on_tpl"):
+            await h.callback("tpl:540:1080:60")
+    run(scenario)
+
+
+def test_report_uses_cache(run):
+    async def scenario(h):
+        # кэш сверяется с user_settings.report_gen — строка настроек нужна
+        await h.message("/settings")
+        await h.message("9-18")
+        # период: часовой пояс и поколение, записи, архив, выходные, outbox
+        with assert_queries(5, commits=1):
+            await h.message("01.01.2020-31.12.2030")
+        # тот же период без изменений данных — часовой пояс с поколением и outbox
+        with assert_queries(2, commits=1):
+            await h.message("01.01.2020-31.12.2030")
+    run(scenario)
+
+
+def test_assert_queries_reports_mismatch(run):
+    async def scenario(h):
+        with pytest.raises(AssertionError, match=f"expected 1 queries, got {9 + _lock(h)}"):
+            with assert_queries(1):
+                await h.message("9-18")
+    run(scenario)
+
+
+def test_rows_returned_and_affected(run):
+    async def scenario(h):
+        await h.message("/settings")
+        await h.message("9-18")
+        # SQLite отдаёт rowcount=-1 на SELECT: прочитанные строки считаются по результату
+        with count_queries() as stats:
+            await h.message("01.01.2020-31.12.2030")
+        assert stats.rows == 2          # настройки и запись дня
+        with count_queries() as stats:
+            await h.message("9-17")
+        assert stats.affected >= 1
+    run(scenario)
@@ -0,0 +1,29 @@
+# tests/test_query_plans.py
+"""Планы горячих запросов (tools/plan_guard.py): полный скан или уход с PK (user_id, …) — падение."""
+import asyncio
+
+from db import base
+from db.base import create_tables, init_db
+from tools.gen_data import generate
+from tools.plan_guard import check_plan, run_guard
+
+
+def test_hot_paths_use_primary_keys(tmp_path, capsys):
+    async def main() -> int:
+        await init_db(f"sqlite+aiosqlite:///{tmp_path / 'plan.sqlite3'}")
+        await create_tables()
+        await generate(users=50, years=2)
+        try:
+            return await run_guard()
+        finally:
+            await base.engine.dispose()
+
+    failures = asyncio.run(main())
+    assert failures == 0, capsys.readouterr().out
+
+
+def test_check_plan_flags_full_scan():
+    assert check_plan("SELECT …", [(2, 0, 0, "SCAN work_entries")]) == ["full scan: SCAN work_entries"]
+    assert check_plan("SELECT …", [(2, 0, 0, "SEARCH work_entries USING INDEX ix_other (work_date=?)")])
+    pk = "SEARCH work_entries USING INDEX sqlite_autoindex_work_entries_1 (user_id=? AND work_date>? AND work_date<?)"
+    assert check_plan("SELECT …", [(2, 0, 0, pk)]) == []
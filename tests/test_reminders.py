@@ -0,0 +1,99 @@
+# tests/test_reminders.py
+"""Напоминания: пачка по окну и пауза недоступным пользователям."""
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import metrics, scheduler
+from db import base
+from db.query_stats import count_queries
+from db.settings_repo import SettingsRepo
+from db.work_repo import IN_CHUNK, WorkRepo
+
+
+async def _paused_user(h) -> None:
+    async with base.session_factory()() as session:
+        repo = SettingsRepo(session)
+        await repo.set_reminder_minutes(h.user_id, 18 * 60)
+        await repo.pause_reminders([h.user_id], "blocked")
+        await session.commit()
+
+
+def test_resume_schedules_after_commit(run):
+    async def scenario(h):
+        await _paused_user(h)
+        assert await scheduler.count_paused() == 1
+        await h.message("/report")
+        assert ("reminder", {"user_id": h.user_id, "minutes": 18 * 60, "tz": "Europe/Warsaw",
+                             "bot_id": 42}) in h.forwarded
+        assert await scheduler.count_paused() == 0
+    run(scenario)
+
+
+def test_failed_update_keeps_pause(run, monkeypatch):
+    async def scenario(h):
+        await _paused_user(h)
+
+        async def broken(*args, **kwargs):
+            raise RuntimeError("db is down")
+
+        # commit апдейта падает: пауза осталась — задача не ставится
+        with monkeypatch.context() as m:
+            m.setattr(AsyncSession, "commit", broken)
+            with pytest.raises(RuntimeError):
+                await h.message("/report")
+        assert not [f for f in h.forwarded if f[0] == "reminder"]
+        assert await scheduler.count_paused() == 1
+    run(scenario)
+
+
+def test_skipped_counted_from_db(run):
+    async def scenario(h):
+        await _paused_user(h)
+        before = metrics.get("reminders_skipped")
+        await scheduler.count_skipped_reminders()
+        assert metrics.get("reminders_skipped") - before == 1
+        await h.message("/report")
+        await scheduler.count_skipped_reminders()
+        assert metrics.get("reminders_skipped") - before == 1
+        assert metrics.get("reminders_paused_users") == 0
+    run(scenario)
+
+
+def test_batch_requeued_after_db_error(run, monkeypatch):
+    async def scenario(h):
+        calls = []
+        real = WorkRepo.users_with_entry_on
+
+        async def flaky(self, pairs):
+            calls.append(pairs)
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+            return await real(self, pairs)
+
+        monkeypatch.setattr(WorkRepo, "users_with_entry_on", flaky)
+        monkeypatch.setattr(scheduler, "REMINDER_BATCH_WINDOW", 0.01)
+        await scheduler.send_reminder(h.user_id, bot_id=h.bot.id)
+        while scheduler._batch_tasks:
+            await asyncio.gather(*scheduler._batch_tasks)
+        assert len(calls) == 2
+        assert h.session.sent_texts() == ["Укажите время работы:"]
+    run(scenario)
+
+
+def test_bulk_lookups_are_chunked(run):
+    async def scenario(h):
+        ids = list(range(1, 2 * IN_CHUNK + 2))
+        async with base.session_factory()() as session:
+            repo = WorkRepo(session)
+            await repo.upsert_entry(ids[-1], "2026-10-19", 540, 1080, 0)
+            await repo.touch_template(ids[-1], 540, 1080, 0)
+            await session.commit()
+            with count_queries() as stats:
+                found = await repo.users_with_entry_on({i: "2026-10-19" for i in ids})
+                templates = await repo.get_templates_bulk(ids)
+        assert found == {ids[-1]}
+        assert templates == {ids[-1]: [(540, 1080, 0)]}
+        assert stats.queries == 6
+    run(scenario)
@@ -0,0 +1,48 @@
+# tests/test_reports.py
+"""Отчёт за период: «сегодня» по часовому поясу пользователя, кэш готовых текстов."""
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import scheduler
+from db import base
+from db.models import OutboxMessage
+from db.work_repo import WorkRepo
+
+
+def test_norm_uses_user_today(run):
+    async def scenario(h):
+        # 22:30 UTC 19.10 — в Варшаве (пояс по умолчанию) уже 00:30 20.10
+        scheduler.set_clock(lambda: datetime(2026, 10, 19, 22, 30, tzinfo=timezone.utc))
+        try:
+            await h.message("01.10.2026-31.10.2026")
+        finally:
+            scheduler.set_clock(None)
+        async with base.session_factory()() as session:
+            text = await session.scalar(select(OutboxMessage.text).where(OutboxMessage.chat_id == h.user_id))
+        assert "Норма по 20.10.2026" in text
+    run(scenario)
+
+
+def test_cache_sees_writes_of_other_replicas(run):
+    async def scenario(h):
+        await h.message("/settings")
+        await h.message("01.10.2026 9-18")
+        await h.message("01.10.2026-31.10.2026")
+        # правка пришла через другой процесс: в этом ни after_commit, ни сессии апдейта
+        engine = create_async_engine(base.engine.url.render_as_string(hide_password=False))
+        try:
+            async with async_sessionmaker(engine)() as session:
+                await WorkRepo(session).upsert_entry(h.user_id, "2026-10-01", 9 * 60, 20 * 60, 0)
+                await session.commit()
+        finally:
+            await engine.dispose()
+        await h.message("01.10.2026-31.10.2026")
+        async with base.session_factory()() as session:
+            texts = (await session.scalars(
+                select(OutboxMessage.text).where(OutboxMessage.chat_id == h.user_id).order_by(OutboxMessage.id)
+            )).all()
+        assert "Итого: 09:00" in texts[-2]
+        assert "Итого: 11:00" in texts[-1]
+    run(scenario)
@@ -0,0 +1,86 @@
+# tools/bench_read_path.py
+"""
+Микробенчмарк скана user_settings: полные ORM-объекты против Core-снимков (ReminderRow).
+
+    python -m tools.bench_read_path --users 100000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import insert, select
+
+import db.base as base
+from db.base import create_tables, init_db, session_factory
+from db.models import UserSettings
+from db.settings_repo import SettingsRepo
+
+
+async def _seed(n: int) -> None:
+    Session = session_factory()
+    async with Session() as session:
+        rows = [
+            {"user_id": uid, "baseline_date": "2025-01-01", "baseline_worked_min": 0,
+             "updated_at": "2025-01-01T00:00:00", "reminder_minutes": 540 + uid % 120,
+             "timezone": "Europe/Warsaw", "since_baseline_min": 0}
+            for uid in range(1, n + 1)
+        ]
+        for i in range(0, n, 10_000):
+            await session.execute(insert(UserSettings), rows[i:i + 10_000])
+        await session.commit()
+
+
+async def _scan_orm() -> int:
+    # как было в main.on_startup: полные UserSettings
+    n = 0
+    Session = session_factory()
+    async with Session() as session:
+        res = await session.execute(select(UserSettings))
+        for us in res.scalars():
+            if us.reminder_minutes and us.reminder_minutes > 0:
+                n += 1
+    return n
+
+
+async def _scan_core() -> int:
+    n = 0
+    Session = session_factory()
+    async with Session() as session:
+        async for _row in SettingsRepo(session).iter_reminders():
+            n += 1
+    return n
+
+
+async def _measure(name: str, fn) -> None:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n = await fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:5} rows={n:>7}  time={elapsed * 1000:8.1f} ms  peak_alloc={peak / 1024 / 1024:7.2f} MiB")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await init_db(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.sqlite3')}")
+        await create_tables()
+        await _seed(args.users)
+        for _ in range(args.rounds):
+            await _measure("orm", _scan_orm)
+            await _measure("core", _scan_core)
+        await base.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+# tools/bench_reports.py
+"""
+Бенчмарк горячих путей на большой базе: отчёт за месяц/год/всё время (_fetch_entries),
+запись дня (upsert_entry + commit) и запись шаблона с обрезкой (touch_template + commit).
+
+    python -m tools.bench_reports --users 2000 --years 3
+    python -m tools.bench_reports --db /tmp/bench.sqlite3      # база из tools.gen_data
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Awaitable, Callable, List
+
+import db.base as base
+from db.base import create_tables, init_db, session_factory
+from db.work_repo import WorkRepo
+
+
+def _report(users: int, span_days: int, rng: random.Random) -> Callable[[], Awaitable[int]]:
+    from app.handlers import _fetch_entries
+
+    async def run() -> int:
+        end = date.today()
+        start = end - timedelta(days=span_days)
+        Session = session_factory()
+        async with Session() as session:
+            return len(await _fetch_entries(session, rng.randint(1, users), start, end))
+    return run
+
+
+def _upsert(users: int, rng: random.Random) -> Callable[[], Awaitable[int]]:
+    async def run() -> int:
+        d = date.today() - timedelta(days=rng.randrange(60))
+        Session = session_factory()
+        async with Session() as session:
+            await WorkRepo(session).upsert_entry(rng.randint(1, users), d.isoformat(),
+                                                 8 * 60 + rng.randrange(60), 17 * 60, 30)
+            await session.commit()
+        return 1
+    return run
+
+
+def _template(users: int, rng: random.Random) -> Callable[[], Awaitable[int]]:
+    async def run() -> int:
+        Session = session_factory()
+        async with Session() as session:
+            await WorkRepo(session).touch_template(rng.randint(1, users), 7 * 60 + rng.randrange(8) * 15,
+                                                   16 * 60, 30)
+            await session.commit()
+        return 1
+    return run
+
+
+async def _measure(name: str, fn: Callable[[], Awaitable[int]], iterations: int) -> None:
+    times: List[float] = []
+    rows = 0
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        rows += await fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    p95 = times[int(len(times) * 0.95) - 1] if len(times) >= 20 else times[-1]
+    print(f"{name:14} n={iterations:>5}  p50={statistics.median(times):7.2f} ms  p95={p95:7.2f} ms  "
+          f"max={times[-1]:7.2f} ms  rows/op={rows / iterations:7.1f}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="готовая база (tools.gen_data); без него генерируется временная")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "bench.sqlite3")
+        fresh = not os.path.exists(path)
+        await init_db(f"sqlite+aiosqlite:///{path}")
+        await create_tables()
+        if fresh:
+            from tools.gen_data import generate
+            t0 = time.perf_counter()
+            n = await generate(args.users, args.years, args.seed)
+            print(f"generated {n} work_entries for {args.users} users in {time.perf_counter() - t0:.1f}s")
+        async with base.engine.connect() as conn:
+            users = (await conn.exec_driver_sql("SELECT max(user_id) FROM user_settings")).scalar() or args.users
+
+        await _measure("report month", _report(users, 31, rng), args.iterations)
+        await _measure("report year", _report(users, 365, rng), args.iterations)
+        await _measure("report all", _report(users, 365 * args.years, rng), args.iterations)
+        await _measure("upsert", _upsert(users, rng), args.iterations)
+        await _measure("template prune", _template(users, rng), args.iterations)
+        await base.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
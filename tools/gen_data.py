@@ -0,0 +1,128 @@
+# tools/gen_data.py
+"""
+Генератор синтетических данных: users × years правдоподобных записей work_entries
+(будни, разброс начала/конца, перерывы, отпуска и пропуски), настройки и шаблоны.
+
+    python -m tools.gen_data --db /tmp/bench.sqlite3 --users 2000 --years 3
+
+Без --db база создаётся во временном каталоге; путь печатается.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterator, List
+
+from sqlalchemy import insert
+
+import db.base as base
+from db.base import create_tables, init_db, session_factory
+from db.models import User, UserSettings, WorkDayOff, WorkEntry, WorkTemplate
+
+CHUNK = 20_000
+
+
+def _user_days(rng: random.Random, first: date, last: date) -> Iterator[Dict]:
+    """
+    Записи одного пользователя: пн–пт, иногда суббота, ~4 недели отпуска в год и случайные пропуски.
+    """
+    usual_start = rng.choice((7 * 60, 8 * 60, 8 * 60 + 30, 9 * 60, 10 * 60))
+    usual_len = rng.choice((8 * 60, 8 * 60, 8 * 60 + 30, 9 * 60))
+    vacations = set()
+    for year in range(first.year, last.year + 1):
+        for _ in range(2):
+            v = date(year, 1, 1) + timedelta(days=rng.randrange(360))
+            vacations.update(v + timedelta(days=i) for i in range(10))
+    d = first
+    while d <= last:
+        wd = d.weekday()
+        if d in vacations:
+            if wd < 5:
+                yield {"dayoff": True, "work_date": d.isoformat()}
+        elif (wd < 5 and rng.random() > 0.04) or (wd == 5 and rng.random() < 0.08):
+            start = usual_start + rng.choice((-15, 0, 0, 0, 5, 10, 30))
+            brk = rng.choice((0, 15, 30, 30, 45))
+            end = start + usual_len + brk + rng.choice((-30, 0, 0, 0, 15, 60, 90))
+            yield {"work_date": d.isoformat(), "start_min": start, "end_min": min(end, 24 * 60 - 1),
+                   "break_min": brk}
+        d += timedelta(days=1)
+
+
+async def generate(users: int, years: int, seed: int = 1, today: date | None = None) -> int:
+    """
+    Заполнить текущую базу (init_db уже вызван). Возвращает число строк work_entries.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    first = date(today.year - years + 1, 1, 1)
+    now_iso = UserSettings.now_iso()
+    baseline = (first - timedelta(days=1)).isoformat()
+
+    entries: List[Dict] = []
+    days_off: List[Dict] = []
+    n_entries = 0
+    Session = session_factory()
+    async with Session() as session:
+        await session.execute(insert(User), [{"tg_id": uid, "username": f"user{uid}"} for uid in range(1, users + 1)])
+        settings: List[Dict] = []
+        templates: List[Dict] = []
+        for uid in range(1, users + 1):
+            worked = 0
+            seen: Dict[tuple, str] = {}
+            for row in _user_days(rng, first, today):
+                if row.pop("dayoff", False):
+                    days_off.append({"user_id": uid, "off_date": row["work_date"]})
+                    continue
+                row["user_id"] = uid
+                row["updated_at"] = now_iso
+                worked += row["end_min"] - row["start_min"] - row["break_min"]
+                seen[(row["start_min"], row["end_min"], row["break_min"])] = row["work_date"]
+                entries.append(row)
+                if len(entries) >= CHUNK:
+                    await session.execute(insert(WorkEntry), entries)
+                    n_entries += len(entries)
+                    entries.clear()
+            for (s, e, b), last_used in sorted(seen.items(), key=lambda kv: kv[1])[-4:]:
+                templates.append({"user_id": uid, "start_min": s, "end_min": e, "break_min": b,
+                                  "last_used_at": last_used + "T18:00:00"})
+            settings.append({
+                "user_id": uid, "baseline_date": baseline, "baseline_worked_min": 0, "updated_at": now_iso,
+                "reminder_minutes": rng.choice((0, 17 * 60, 18 * 60, 19 * 60)), "timezone": "Europe/Warsaw",
+                "since_baseline_min": worked,
+            })
+        if entries:
+            await session.execute(insert(WorkEntry), entries)
+            n_entries += len(entries)
+        for table, rows in ((UserSettings, settings), (WorkTemplate, templates), (WorkDayOff, days_off)):
+            for i in range(0, len(rows), CHUNK):
+                await session.execute(insert(table), rows[i:i + CHUNK])
+        await session.commit()
+    return n_entries
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="путь к файлу SQLite (по умолчанию — во временном каталоге)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="tgbot-gen-"), "bench.sqlite3")
+    if os.path.exists(path):
+        parser.error(f"{path} already exists")
+    await init_db(f"sqlite+aiosqlite:///{path}")
+    await create_tables()
+    t0 = time.perf_counter()
+    n = await generate(args.users, args.years, args.seed)
+    print(f"{path}: {args.users} users, {n} work_entries in {time.perf_counter() - t0:.1f}s")
+    await base.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+# tools/plan_guard.py
+"""
+Страж планов запросов: гоняет горячие пути (отчёт, запись дня, шаблоны, напоминания)
+на сгенерированной базе, перехватывает их SQL и делает EXPLAIN QUERY PLAN.
+Код выхода 1, если запрос к work_entries/work_templates/work_days_off/user_settings
+перестал искать по первичному ключу (user_id, …) или ушёл в полный скан.
+
+    python -m tools.plan_guard            # база во временном каталоге
+    python -m tools.plan_guard --db /tmp/bench.sqlite3
+
+В CI то же самое проверяет tests/test_query_plans.py.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+from typing import Any, List, Tuple
+
+from sqlalchemy import event
+
+import db.base as base
+from db.base import create_tables, init_db, session_factory
+
+HOT_TABLES = ("work_entries", "work_templates", "work_days_off", "user_settings")
+# SQLite: первичный ключ не-INTEGER живёт в sqlite_autoindex_<table>_1
+_PK_INDEX = re.compile(r"USING (?:COVERING )?INDEX sqlite_autoindex_(\w+)_1 \(user_id=|USING PRIMARY KEY")
+_SCAN = re.compile(r"^SCAN (\w+)")
+_SEARCH = re.compile(r"^SEARCH (\w+)")
+
+
+async def _exercise() -> None:
+    """Горячие пути так, как их вызывают хендлеры и планировщик."""
+    from app.handlers import _fetch_entries, _norm_footer
+    from db.settings_repo import SettingsRepo
+    from db.work_repo import WorkRepo
+
+    today = date.today()
+    Session = session_factory()
+    async with Session() as session:
+        rows = await _fetch_entries(session, 1, today.replace(day=1), today)
+        await _norm_footer(session, 1, today.replace(day=1), today, rows, today)
+        wr = WorkRepo(session)
+        srepo = SettingsRepo(session)
+        await srepo.get_timezone(1)
+        await wr.upsert_entry(1, (today - timedelta(days=2)).isoformat(), 6 * 60, 20 * 60, 7)
+        # правка закрытого года — с возвратом его из архива
+        await wr.upsert_entry(1, today.replace(year=today.year - 5, day=1).isoformat(), 9 * 60, 18 * 60, 0)
+        await wr.touch_template(1, 9 * 60, 17 * 60, 30)
+        await wr.set_day_off(1, (today - timedelta(days=1)).isoformat())
+        await srepo.get_balance(1)
+        await wr.get_templates(1)
+        await wr.get_templates_bulk([1, 2, 3])
+        await wr.users_with_entry_on({1: today.isoformat(), 2: today.isoformat()})
+        await wr.sum_worked_since(1, (today - timedelta(days=90)).isoformat())
+        await session.rollback()
+
+
+def check_plan(sql: str, plan: List[Tuple[Any, ...]]) -> List[str]:
+    problems: List[str] = []
+    for row in plan:
+        detail = row[-1]
+        m = _SCAN.match(detail)
+        if m and m.group(1) in HOT_TABLES:
+            problems.append(f"full scan: {detail}")
+            continue
+        m = _SEARCH.match(detail)
+        if m and m.group(1) in HOT_TABLES and not _PK_INDEX.search(detail):
+            problems.append(f"not using (user_id, …) primary key: {detail}")
+    return problems
+
+
+async def run_guard(verbose: bool = False) -> int:
+    captured: List[Tuple[str, Any]] = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            captured.append((statement, parameters))
+
+    event.listen(base.engine.sync_engine, "before_cursor_execute", _capture)
+    try:
+        await _exercise()
+    finally:
+        event.remove(base.engine.sync_engine, "before_cursor_execute", _capture)
+
+    failures = 0
+    async with base.engine.connect() as conn:
+        for sql, params in captured:
+            if not any(t in sql for t in HOT_TABLES):
+                continue
+            res = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params)
+            plan = res.fetchall()
+            problems = check_plan(sql, plan)
+            if problems or verbose:
+                print(" ".join(sql.split()))
+                for row in plan:
+                    print("    ", row[-1])
+            for p in problems:
+                print("  !!", p)
+                failures += 1
+    print(f"{len(captured)} statements checked, {failures} plan problems")
+    return failures
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="готовая база (tools.gen_data); по умолчанию — сгенерировать маленькую")
+    parser.add_argument("-v", "--verbose", action="store_true", help="печатать все планы")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "plan.sqlite3")
+        fresh = not os.path.exists(path)
+        await init_db(f"sqlite+aiosqlite:///{path}")
+        await create_tables()
+        if fresh:
+            from tools.gen_data import generate
+            await generate(users=50, years=2)
+        failures = await run_guard(args.verbose)
+        await base.engine.dispose()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
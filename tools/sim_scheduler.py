@@ -0,0 +1,207 @@
+# tools/sim_scheduler.py
+"""
+Симуляция планировщика на виртуальных часах: N пользователей с напоминаниями
+в разных часовых поясах, неделя (с переходом на зимнее время) за секунды.
+
+    python -m tools.sim_scheduler --users 100000
+    python -m tools.sim_scheduler --users 20000 --start 2025-03-29 --days 7
+
+Задачи ставятся настоящими schedule_user_reminder / schedule_kb_expire в jobstore
+приостановленного AsyncIOScheduler; цикл ниже повторяет BaseScheduler._process_jobs,
+только «сейчас» — виртуальное (app.scheduler.set_clock). Сеть и БД не трогаются:
+срабатывание напоминания = учёт + постановка автоскрытия клавиатуры, как в _deliver_reminders.
+
+Выводит: число пробуждений, задач/сек (виртуальный пик и реальная скорость прогона),
+память на задачи и точность срабатывания по поясам (мимо настенного времени, пропуски, дубли).
+Переводы часов в ЕС/США/Австралии приходятся на воскресенье, когда напоминаний (пн–сб) нет,
+поэтому ночные напоминания в «дыру» перевода не попадают — симуляция это и показывает.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import resource
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+from app import scheduler as sched_mod
+
+# пояс -> доля пользователей
+TIMEZONES: List[Tuple[str, float]] = [
+    ("Europe/Warsaw", 0.55),
+    ("Europe/Kyiv", 0.15),
+    ("Europe/London", 0.08),
+    ("America/New_York", 0.07),
+    ("Asia/Tbilisi", 0.05),     # без перехода
+    ("Asia/Kolkata", 0.04),     # смещение +05:30
+    ("Australia/Sydney", 0.06),
+]
+
+
+def _reminder_minutes(rng: random.Random, night_share: float) -> int:
+    # большинство — вечер после работы, немного ночных смен (попадают в час перевода)
+    if rng.random() < night_share:
+        return rng.randrange(60, 4 * 60)
+    return int(min(max(rng.gauss(18 * 60, 45), 15 * 60), 23 * 60 + 59))
+
+
+def _seed(n: int, seed: int, night_share: float) -> Dict[int, Tuple[str, int]]:
+    rng = random.Random(seed)
+    zones = [z for z, _ in TIMEZONES]
+    weights = [w for _, w in TIMEZONES]
+    return {uid: (rng.choices(zones, weights)[0], _reminder_minutes(rng, night_share))
+            for uid in range(1, n + 1)}
+
+
+def _expected(users: Dict[int, Tuple[str, int]], start: datetime, end: datetime) -> Dict[Tuple[int, date], str]:
+    """
+    Когда напоминание должно сработать: (user, локальная дата) пн–сб, настенное время внутри окна.
+    """
+    out: Dict[Tuple[int, date], str] = {}
+    first = start.date() - timedelta(days=1)
+    span = (end - start).days + 3
+    for uid, (tz, minutes) in users.items():
+        zone = ZoneInfo(tz)
+        for i in range(span):
+            d = first + timedelta(days=i)
+            if d.weekday() > 5:
+                continue
+            local = datetime(d.year, d.month, d.day, minutes // 60, minutes % 60, tzinfo=zone)
+            if start <= local.astimezone(timezone.utc) < end:
+                out[(uid, d)] = tz
+    return out
+
+
+class VirtualClock:
+    def __init__(self, now: datetime) -> None:
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+async def simulate(n_users: int, start: datetime, days: int, seed: int, night_share: float) -> None:
+    end = start + timedelta(days=days)
+    clock = VirtualClock(start)
+    sched_mod.set_clock(clock)
+    scheduler = sched_mod.setup_scheduler(paused=True)
+    store = scheduler._lookup_jobstore("default")
+
+    users = _seed(n_users, seed, night_share)
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for uid, (tz, minutes) in users.items():
+        sched_mod.schedule_user_reminder(uid, minutes, tz)
+    seed_sec = time.perf_counter() - t0
+    mem_jobs, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # add_job считает первый запуск от настоящего now — переносим на виртуальное
+    for job in store.get_all_jobs():
+        job._modify(next_run_time=job.trigger.get_next_fire_time(None, start))
+        store.update_job(job)
+
+    wakeups = 0
+    reminder_fires: List[Tuple[int, datetime]] = []
+    kb_fires = 0
+    per_instant: Counter = Counter()
+    max_jobs = len(store.get_all_jobs())
+    msg_id = 0
+
+    t0 = time.perf_counter()
+    while True:
+        nxt = store.get_next_run_time()
+        if nxt is None or nxt >= end:
+            break
+        clock.now = nxt.astimezone(timezone.utc)
+        wakeups += 1
+        for job in store.get_due_jobs(clock.now):
+            run_times = job._get_run_times(clock.now)
+            run_times = run_times[-1:] if run_times and job.coalesce else run_times
+            for run_time in run_times:
+                per_instant[run_time] += 1
+                if job.id.startswith("reminder:"):
+                    uid = job.args[0]
+                    reminder_fires.append((uid, run_time))
+                    msg_id += 1
+                    sched_mod.schedule_kb_expire(uid, msg_id, seconds=60)
+                else:
+                    kb_fires += 1
+            job_next = job.trigger.get_next_fire_time(run_times[-1], clock.now) if run_times else None
+            if job_next:
+                job._modify(next_run_time=job_next)
+                store.update_job(job)
+            else:
+                store.remove_job(job.id)
+        max_jobs = max(max_jobs, len(store._jobs))
+    run_sec = time.perf_counter() - t0
+    scheduler.shutdown(wait=False)
+    sched_mod.set_clock(None)
+
+    # точность по поясам
+    expected = _expected(users, start, end)
+    fired: Dict[Tuple[int, date], int] = Counter()
+    off_time: Counter = Counter()
+    for uid, run_time in reminder_fires:
+        tz, minutes = users[uid]
+        local = run_time.astimezone(ZoneInfo(tz))
+        fired[(uid, local.date())] += 1
+        if local.hour * 60 + local.minute != minutes or local.weekday() > 5:
+            off_time[tz] += 1
+
+    stats: Dict[str, Counter] = defaultdict(Counter)
+    for uid, (tz, _m) in users.items():
+        stats[tz]["users"] += 1
+    for key, tz in expected.items():
+        stats[tz]["expected"] += 1
+        if key not in fired:
+            stats[tz]["missed"] += 1
+    for (uid, _d), k in fired.items():
+        tz = users[uid][0]
+        stats[tz]["fired"] += k
+        if k > 1:
+            stats[tz]["duplicate"] += k - 1
+
+    total_fires = len(reminder_fires) + kb_fires
+    print(f"users: {n_users}, window: {start.isoformat()} .. {end.isoformat()} ({days} days)")
+    print(f"seeding (under tracemalloc): {seed_sec:.2f}s, job memory: {mem_jobs / 1024 / 1024:.1f} MiB "
+          f"({mem_jobs / max(n_users, 1):.0f} B/job), peak jobs in store: {max_jobs}, "
+          f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    print(f"wakeups: {wakeups}, fires: {total_fires} (reminders {len(reminder_fires)}, kb expire {kb_fires})")
+    peak_at, peak = per_instant.most_common(1)[0] if per_instant else (None, 0)
+    print(f"jobs/sec: peak {peak} at {peak_at}, simulated {total_fires / max(run_sec, 1e-9):.0f}/s "
+          f"of real time ({run_sec:.2f}s)")
+    print()
+    print(f"{'timezone':20} {'users':>7} {'expected':>9} {'fired':>8} {'missed':>7} {'dup':>5} {'off-time':>8} {'accuracy':>9}")
+    for tz, _w in TIMEZONES:
+        st = stats.get(tz)
+        if not st:
+            continue
+        exp = st["expected"]
+        ok = exp - st["missed"] - st["duplicate"] - off_time[tz]
+        acc = ok / exp * 100 if exp else 100.0
+        print(f"{tz:20} {st['users']:>7} {exp:>9} {st['fired']:>8} {st['missed']:>7} "
+              f"{st['duplicate']:>5} {off_time[tz]:>8} {acc:>8.3f}%")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--start", default="2025-10-25",
+                    help="UTC-дата начала; по умолчанию захватывает переход на зимнее время в ЕС (26.10) и США (02.11)")
+    ap.add_argument("--days", type=int, default=9)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--night-share", type=float, default=0.02, help="доля напоминаний на 01:00–03:59")
+    args = ap.parse_args()
+    start = datetime.fromisoformat(args.start).replace(tzinfo=timezone.utc)
+    asyncio.run(simulate(args.users, start, args.days, args.seed, args.night_share))
+
+
+if __name__ == "__main__":
+    main()